@@ -1,9 +1,44 @@
+from config import LOCK_TOP_BLOCKERS, VACUUM_TOP_TABLES
+from query_mix import SHAPES, SHAPE_LABELS, mix_shares
+
+# Профили, которые правила определяют надежнее, чем состав запросов
+MIX_KEEPS_RULE = ("IDLE", "Data Maintenance")
+# Минимальная доля времени БД, учтенная в pg_stat_statements, чтобы доверять составу
+MIX_MIN_COVERAGE = 0.5
+
+
 class ProfileAnalyzer:
+    def __init__(self, engine="rules", model=None):
+        """engine: "rules" - ручные пороги, "model" - обученный DecisionTreeModel (classifier.py)"""
+        if engine == "model" and model is None:
+            raise ValueError("engine='model' requires a trained model")
+        self.engine = engine
+        self.model = model
+
     def analyze(self, prev, curr, duration):
+        profile, conf, metrics = self._analyze_rules(prev, curr, duration)
+        profile, conf = self._analyze_query_mix(profile, conf, metrics, prev, curr, duration)
+        if self.engine == "model":
+            metrics["Rule Profile"] = profile
+            profile, conf = self.model.predict(metrics)
+        return profile, conf, metrics
+
+    def _analyze_rules(self, prev, curr, duration):
         if duration <= 0:
             duration = 1
 
-        d_commits = max(curr["commits"] - prev["commits"], 0)
+        # Собственные запросы коллектора не должны попадать в профиль нагрузки. calls - все запросы
+        # с меткой, включая другой коллектор (TrainingRecorder), statements - счет этого процесса без pg_stat_statements
+        mon_prev, mon_curr = prev.get("monitor") or {}, curr.get("monitor") or {}
+        d_monitor_statements = max(
+            mon_curr.get("statements", 0) - mon_prev.get("statements", 0),
+            mon_curr.get("calls", 0) - mon_prev.get("calls", 0),
+            0
+        )
+        d_monitor_db_time = max(mon_curr.get("db_time", 0) - mon_prev.get("db_time", 0), 0)
+        d_monitor_cpu = max(mon_curr.get("cpu_time", 0) - mon_prev.get("cpu_time", 0), 0)
+
+        d_commits = max(curr["commits"] - prev["commits"] - d_monitor_statements, 0)
 
         d_inserted = max(curr["tup_inserted"] - prev["tup_inserted"], 0)
         d_fetched = max(curr["tup_fetched"] - prev["tup_fetched"], 0)
@@ -12,7 +47,7 @@ class ProfileAnalyzer:
 
         d_writes = d_inserted + d_updated + d_deleted
 
-        d_db_time_stats = max(curr.get("db_time_accumulated", 0) - prev.get("db_time_accumulated", 0), 0)
+        d_db_time_stats = max(curr.get("db_time_accumulated", 0) - prev.get("db_time_accumulated", 0) - d_monitor_db_time, 0)
 
         avg_active_sessions = (prev["active_sessions"] + curr["active_sessions"]) / 2
 
@@ -37,6 +72,24 @@ class ProfileAnalyzer:
 
         io_waits = curr["waits"].get("IO", 0)
 
+        locks = curr.get("locks") or {}
+        lock_waits = locks.get("waiting", curr["waits"].get("Lock", 0))
+        # Среднее число ждущих за интервал по накопительному счетчику коллектора, а не мгновенное значение
+        lw_prev, lw_curr = prev.get("lock_waits"), curr.get("lock_waits")
+        if lw_prev and lw_curr:
+            lock_waits = round(max(lw_curr["session_seconds"] - lw_prev["session_seconds"], 0.0) / duration, 2)
+        # Сессии стоят в очереди на блокировки, а не жгут CPU: это контеншн, а не тяжелый OLAP
+        lock_bound = lock_waits >= 2 and lock_waits > avg_active_sessions * 0.3
+
+        vac_prev, vac_curr = prev.get("vacuum") or {}, curr.get("vacuum") or {}
+        vacuums_running = len(vac_curr.get("in_progress", []))
+        manual_vacuums = sum(1 for v in vac_curr.get("in_progress", []) if not v["auto"])
+        d_vacuum_runs = sum(
+            max(vac_curr.get(k, 0) - vac_prev.get(k, 0), 0)
+            for k in ("autovacuum_count", "vacuum_count", "autoanalyze_count", "analyze_count")
+        )
+        dead_growth = (vac_curr.get("dead_tuples", 0) - vac_prev.get("dead_tuples", 0)) / duration
+
         metrics = {
             "TPS": round(tps, 2),
             "Active Sessions (ASH)": round(db_time_rate, 2),
@@ -44,15 +97,32 @@ class ProfileAnalyzer:
             "Max Latency (s)": round(curr["max_duration"], 2),
             "IO Waits": io_waits,
             "Read/Write Ratio": round(rw_ratio, 2),
-            "Insert/Write Ratio": round(insert_ratio, 2)
+            "Insert/Write Ratio": round(insert_ratio, 2),
+            "Lock Waits": lock_waits,
+            "Lock Chain Depth": locks.get("chain_depth", 0),
+            "Lock-Bound": lock_bound,
+            "Dead Tuples": int(vac_curr.get("dead_tuples", 0)),
+            "Dead Tuple Growth (/s)": round(dead_growth, 1),
+            "Vacuums Running": vacuums_running,
+            "Vacuum Runs": d_vacuum_runs,
+            "Autovacuum Workers": vac_curr.get("autovacuum_workers", 0),
+            "Monitor DB Time (%)": round(100.0 * d_monitor_db_time / duration, 3),
+            "Monitor CPU (ms)": round(d_monitor_cpu * 1000, 2)
         }
 
+        # Ручной VACUUM в одной сессии почти не дает db_time до завершения, поэтому проверяем его до IDLE
+        if manual_vacuums > 0 and tps < 20.0:
+            return "Data Maintenance", "High", metrics
+
         if tps < 1.0 and db_time_rate < 0.5:
             return "IDLE", "High", metrics
 
         if db_time_rate < 0.1 and tps < 2:
             return "IDLE", "High", metrics
 
+        if vacuums_running > 0 and tps < 20.0:
+            return "Data Maintenance", "High", metrics
+
         if tps < 20.0 and db_time_rate > 0.1 and d_writes < 50:
             return "Data Maintenance", "High", metrics
 
@@ -67,6 +137,11 @@ class ProfileAnalyzer:
         if is_heavy_query and rw_ratio < 5.0 and insert_ratio < 0.2 and tps < 10:
             return "End of day Batch", "High", metrics
 
+        if lock_bound and d_writes > 0:
+            if insert_ratio < 0.30:
+                return "Classic OLTP", "Medium", metrics
+            return "Mixed / HTAP", "Medium", metrics
+
         if (rw_ratio > 50) or (is_heavy_query and tps < 100):
             if tps < 5.0 and db_time_rate < 1.0:
                  return "IDLE", "Low", metrics
@@ -86,3 +161,227 @@ class ProfileAnalyzer:
             return "Mixed / HTAP", "Low", metrics
 
         return "IDLE", "Low", metrics
+
+
+    def _analyze_query_mix(self, profile, conf, metrics, prev, curr, duration):
+        """
+        Уточнение профиля по составу нагрузки: доли времени БД по формам запросов
+        (point lookup, range scan, aggregate/join, записи, DDL) из дельт pg_stat_statements.
+        """
+        mix = mix_shares(prev.get("query_mix"), curr.get("query_mix"))
+        for shape in SHAPES:
+            metrics[f"Mix {SHAPE_LABELS[shape]} (%)"] = round(100.0 * mix["time_share"][shape], 1) if mix else 0.0
+        # Доля мала - в интервале в основном неучтенная активность (pg_stat_statements.max, utility)
+        coverage = mix["time"] / duration / max(metrics["Active Sessions (ASH)"], 1e-9) if mix else 0.0
+        metrics["Mix Coverage (%)"] = round(min(coverage, 1.0) * 100, 1)
+        if mix is None or profile in MIX_KEEPS_RULE or coverage < MIX_MIN_COVERAGE:
+            return profile, conf
+
+        share = mix["time_share"]
+        reads = share["point_lookup"] + share["range_scan"]
+        writes = share["single_row_write"] + share["bulk_write"]
+        confidence = lambda dominant: "High" if dominant >= 0.8 else "Medium"
+
+        if share["ddl_maintenance"] >= 0.5:
+            return "Data Maintenance", confidence(share["ddl_maintenance"])
+        if share["aggregate_join"] >= 0.6 and writes < 0.2:
+            if metrics["IO Waits"] > metrics["Active Sessions (ASH)"] * 0.3:
+                return "Disk-Bound OLAP", confidence(share["aggregate_join"])
+            return "Heavy OLAP", confidence(share["aggregate_join"])
+        if reads >= 0.8 and writes < 0.1 and share["aggregate_join"] < 0.1:
+            return "Web / Read-Only", confidence(reads)
+        if writes >= 0.7 and metrics["Insert/Write Ratio"] > 0.8:
+            return "IoT / Ingestion", confidence(writes)
+        if share["bulk_write"] >= 0.6 and metrics["TPS"] < 10:
+            return "End of day Batch", confidence(share["bulk_write"])
+        return profile, conf
+
+
+# Накопительные счетчики, которые можно складывать между узлами кластера
+CUMULATIVE_KEYS = ("commits", "rollbacks", "db_time_accumulated", "tup_inserted", "tup_fetched", "tup_updated", "tup_deleted")
+
+
+class TopologyAnalyzer:
+    """
+    Классификация primary и реплик как единого кластера: профиль каждого узла
+    плюс общий профиль по сумме счетчиков всех узлов (чтение, вынесенное на реплики, тоже учитывается).
+    """
+
+    def __init__(self, analyzer=None):
+        self.analyzer = analyzer or ProfileAnalyzer()
+
+    def analyze(self, nodes, duration):
+        """nodes: { имя_узла: (prev_snapshot, curr_snapshot) }"""
+        per_node = {}
+        primary, replicas = None, []
+        for name, (prev, curr) in nodes.items():
+            per_node[name] = self.analyzer.analyze(prev, curr, duration)
+            role = (curr.get("replication") or {}).get("role", "primary")
+            if role == "primary" and primary is None:
+                primary = name
+            else:
+                replicas.append(name)
+
+        prev_total = _merge_snapshots({name: prev for name, (prev, _) in nodes.items()})
+        curr_total = _merge_snapshots({name: curr for name, (_, curr) in nodes.items()})
+        profile, conf, metrics = self.analyzer.analyze(prev_total, curr_total, duration)
+
+        lag_bytes, lag_s = 0.0, 0.0
+        for _, curr in nodes.values():
+            rep = curr.get("replication") or {}
+            for standby in rep.get("standbys", []):
+                lag_bytes = max(lag_bytes, standby["replay_lag_bytes"])
+                lag_s = max(lag_s, standby["replay_lag_s"])
+            if rep.get("role") == "standby":
+                lag_bytes = max(lag_bytes, rep.get("replay_lag_bytes", 0.0))
+                lag_s = max(lag_s, rep.get("replay_lag_s", 0.0))
+        metrics["Max Replay Lag (MB)"] = round(lag_bytes / (1024 * 1024), 2)
+        metrics["Max Replay Lag (s)"] = round(lag_s, 2)
+
+        return {
+            "profile": profile,
+            "confidence": conf,
+            "metrics": metrics,
+            "primary": primary,
+            "replicas": replicas,
+            "nodes": per_node
+        }
+
+
+def _merge_snapshots(by_node):
+    """{ имя_узла: снимок } -> снимок кластера: счетчики складываются, глубина цепочек и bloat - максимум"""
+    snapshots = list(by_node.values())
+    merged = {key: sum(s.get(key, 0) for s in snapshots) for key in CUMULATIVE_KEYS}
+    merged["time"] = max(s["time"] for s in snapshots)
+    merged["active_sessions"] = sum(s["active_sessions"] for s in snapshots)
+    merged["max_duration"] = max(s["max_duration"] for s in snapshots)
+    waits = {}
+    for s in snapshots:
+        for wait_type, count in s["waits"].items():
+            waits[wait_type] = waits.get(wait_type, 0) + count
+    merged["waits"] = waits
+    # Собственные запросы коллекторов каждого узла исключаются и из суммы кластера
+    merged["monitor"] = {
+        key: sum((s.get("monitor") or {}).get(key, 0) for s in snapshots)
+        for key in ("statements", "db_time", "calls", "cpu_time")
+    }
+    merged["locks"] = _merge_locks(by_node)
+    merged["lock_waits"] = _merge_lock_waits(snapshots)
+    merged["vacuum"] = _merge_vacuum(by_node)
+    merged["query_mix"] = _merge_query_mix(snapshots)
+    # Состояние репликации не складывается: сохраняется по каждому узлу
+    replication = {name: s.get("replication") or {} for name, s in by_node.items()}
+    merged["replication"] = {
+        "role": "cluster",
+        "standbys": [standby for rep in replication.values() for standby in rep.get("standbys", [])],
+        "nodes": replication
+    }
+    return merged
+
+
+def _merge_locks(by_node):
+    """Ожидания складываются, глубина цепочки - максимум; блокирующие сессии помечаются узлом"""
+    sampled = {name: s["locks"] for name, s in by_node.items() if s.get("locks")}
+    if not sampled:
+        return None
+    by_relation_mode, blockers = {}, []
+    for name, locks in sampled.items():
+        for key, count in locks.get("by_relation_mode", {}).items():
+            by_relation_mode[key] = by_relation_mode.get(key, 0) + count
+        blockers.extend(dict(b, node=name) for b in locks.get("blockers", []))
+    blockers.sort(key=lambda b: b["blocked"], reverse=True)
+    return {
+        "waiting": sum(locks.get("waiting", 0) for locks in sampled.values()),
+        "by_relation_mode": by_relation_mode,
+        "blockers": blockers[:LOCK_TOP_BLOCKERS],
+        "chain_depth": max(locks.get("chain_depth", 0) for locks in sampled.values())
+    }
+
+
+def _merge_lock_waits(snapshots):
+    """Накопительные ожидания Lock складываются; None, если хотя бы один узел их не считает"""
+    if not all(s.get("lock_waits") for s in snapshots):
+        return None
+    by_relation_mode = {}
+    for s in snapshots:
+        for key, count in s["lock_waits"]["by_relation_mode"].items():
+            by_relation_mode[key] = by_relation_mode.get(key, 0) + count
+    return {
+        "session_seconds": sum(s["lock_waits"]["session_seconds"] for s in snapshots),
+        "observed": sum(s["lock_waits"]["observed"] for s in snapshots),
+        "by_relation_mode": by_relation_mode
+    }
+
+
+def _merge_vacuum(by_node):
+    """Счетчики и мертвые кортежи складываются, bloat таблицы - максимум по узлам"""
+    sampled = {name: s["vacuum"] for name, s in by_node.items() if s.get("vacuum")}
+    if not sampled:
+        return None
+    merged = {
+        key: sum(vac.get(key, 0) for vac in sampled.values())
+        for key in ("dead_tuples", "mod_since_analyze", "autovacuum_count", "autoanalyze_count",
+                    "vacuum_count", "analyze_count", "autovacuum_workers")
+    }
+    merged["in_progress"] = [dict(v, node=name) for name, vac in sampled.items() for v in vac.get("in_progress", [])]
+    top_dead = [dict(t, node=name) for name, vac in sampled.items() for t in vac.get("top_dead", [])]
+    merged["top_dead"] = sorted(top_dead, key=lambda t: t["dead"], reverse=True)[:VACUUM_TOP_TABLES]
+
+    bloat = {}
+    for vac in sampled.values():
+        for table in vac.get("bloat") or []:
+            if table["table"] not in bloat or table["bloat_pct"] > bloat[table["table"]]["bloat_pct"]:
+                bloat[table["table"]] = table
+    has_bloat = any(vac.get("bloat") is not None for vac in sampled.values())
+    merged["bloat"] = sorted(bloat.values(), key=lambda t: t["pages"], reverse=True) if has_bloat else None
+    return merged
+
+
+def _merge_query_mix(snapshots):
+    """Накопленные calls/время/строки по формам запросов складываются по узлам"""
+    merged = {}
+    for s in snapshots:
+        for shape, totals in (s.get("query_mix") or {}).items():
+            target = merged.setdefault(shape, {})
+            for key, value in totals.items():
+                target[key] = target.get(key, 0) + value
+    return merged
+
+
+def check_replication_conflicts(recs, replication, replicas_configured=False):
+    """
+    Предупреждения о рекомендациях, несовместимых с репликацией.
+    replication - секция "replication" снимка MetricsCollector (с primary или standby);
+    replicas_configured - реплики заданы в конфигурации (REPLICA_CONFIGS), даже если сейчас не подключены.
+    """
+    replication = replication or {}
+    warnings = []
+    standbys = replication.get("standbys", [])
+    is_replicated = replication.get("role") == "standby" or bool(standbys) or replicas_configured
+    if not is_replicated:
+        return warnings
+
+    has_sync = any(s.get("sync_state") in ("sync", "quorum") for s in standbys) or \
+        bool((replication.get("synchronous_standby_names") or "").strip())
+
+    wal_level = str(recs.get("wal_level", "")).lower()
+    if wal_level == "minimal":
+        warnings.append("wal_level = 'minimal' disables streaming replication (requires max_wal_senders = 0); keep 'replica'")
+
+    sync_commit = str(recs.get("synchronous_commit", "")).lower()
+    if has_sync and sync_commit in ("off", "local"):
+        warnings.append(f"synchronous_commit = '{sync_commit}' drops the synchronous standby guarantee; committed data may be lost on failover")
+
+    if str(recs.get("full_page_writes", "")).lower() == "off":
+        warnings.append("full_page_writes = 'off' risks torn pages on standbys and breaks pg_rewind")
+
+    if replication.get("role") == "standby":
+        for name in ("max_worker_processes", "max_connections", "max_wal_senders", "max_prepared_transactions", "max_locks_per_transaction"):
+            if name in recs:
+                warnings.append(f"{name} on a standby must be >= the primary's value, apply it on the primary first")
+    else:
+        for name in ("max_worker_processes", "max_connections"):
+            if name in recs:
+                warnings.append(f"{name} must be raised on every standby before the primary, or standbys will refuse to start")
+
+    return warnings
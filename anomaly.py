@@ -0,0 +1,121 @@
+import math
+
+from config import ANOMALY_SIGMA_FLOOR, ANOMALY_MIN_SAMPLES
+
+DEFAULT_SIGNALS = ("TPS", "Tx Cost (s)", "Active Sessions (ASH)", "IO Waits", "Max Latency (s)")
+
+# self.mad - EWMA среднего абсолютного отклонения (не медианного): для нормального
+# распределения E|X - mu| = sigma * sqrt(2 / pi), поэтому sigma = mad * sqrt(pi / 2)
+MAD_TO_SIGMA = math.sqrt(math.pi / 2)
+
+
+class SignalState:
+    """
+    Состояние одного потока метрик, O(1) на тик:
+    EWMA уровня и EWMA абсолютного отклонения (робастная оценка разброса)
+    плюс двусторонний CUSUM по нормированному отклонению.
+    sigma_floor - абсолютный минимум sigma в единицах сигнала; пока разброс нулевой,
+    z и CUSUM не выдаются раньше min_samples тиков.
+    """
+
+    def __init__(self, alpha=0.1, z_threshold=4.0, cusum_drift=0.5, cusum_threshold=8.0, warmup=10,
+                 sigma_floor=1e-9, min_samples=ANOMALY_MIN_SAMPLES):
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.cusum_drift = cusum_drift
+        self.cusum_threshold = cusum_threshold
+        self.warmup = warmup
+        self.sigma_floor = max(sigma_floor, 1e-9)
+        self.min_samples = min_samples
+
+        self.count = 0
+        self.mean = 0.0
+        self.mad = 0.0
+        self.cusum_pos = 0.0
+        self.cusum_neg = 0.0
+
+    def update(self, value):
+        """Возвращает (z, направление сдвига по CUSUM или None)"""
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+            return 0.0, None
+
+        sigma = max(self.mad * MAD_TO_SIGMA, self.sigma_floor, abs(self.mean) * 0.01)
+        z = (value - self.mean) / sigma
+        ready = self.count > self.warmup and (self.mad > 0 or self.count >= self.min_samples)
+
+        shift = None
+        if ready:
+            # Выбросы обрезаются, чтобы один пик не перезапускал CUSUM
+            clipped = max(min(z, self.z_threshold), -self.z_threshold)
+            self.cusum_pos = max(0.0, self.cusum_pos + clipped - self.cusum_drift)
+            self.cusum_neg = max(0.0, self.cusum_neg - clipped - self.cusum_drift)
+            if self.cusum_pos > self.cusum_threshold:
+                shift = "up"
+            elif self.cusum_neg > self.cusum_threshold:
+                shift = "down"
+
+        if shift:
+            # Новый режим: переучиваем уровень на текущем значении
+            self.mean = value
+            self.cusum_pos = self.cusum_neg = 0.0
+        else:
+            deviation = value - self.mean
+            self.mean += self.alpha * deviation
+            self.mad += self.alpha * (abs(deviation) - self.mad)
+
+        return (z if ready else 0.0), shift
+
+
+class AnomalyDetector:
+    """
+    Потоковый детектор поверх метрик ProfileAnalyzer.analyze: на каждый тик
+    выдает список событий 'spike' (робастный z-score) и 'regime_shift' (CUSUM).
+    Событие содержит время, затронутые метрики, их значения и z-оценки.
+    sigma_floor - { сигнал: минимум sigma } поверх ANOMALY_SIGMA_FLOOR из конфигурации.
+    """
+
+    def __init__(self, signals=DEFAULT_SIGNALS, sigma_floor=None, **state_params):
+        self.signals = signals
+        floors = dict(ANOMALY_SIGMA_FLOOR, **(sigma_floor or {}))
+        self.states = {
+            name: SignalState(sigma_floor=floors.get(name, 1e-9), **state_params) for name in signals
+        }
+
+    def update(self, timestamp, metrics, profile=None):
+        spikes, shifts = {}, {}
+        for name in self.signals:
+            value = metrics.get(name)
+            if value is None or isinstance(value, bool) or not math.isfinite(float(value)):
+                continue
+            state = self.states[name]
+            z, shift = state.update(float(value))
+            if shift:
+                shifts[name] = {"value": float(value), "z": round(z, 2), "direction": shift}
+            elif abs(z) >= state.z_threshold:
+                spikes[name] = {"value": float(value), "z": round(z, 2), "direction": "up" if z > 0 else "down"}
+
+        events = []
+        if shifts:
+            events.append({"time": timestamp, "type": "regime_shift", "profile": profile,
+                           "severity": _severity(shifts), "metrics": shifts})
+        if spikes:
+            events.append({"time": timestamp, "type": "spike", "profile": profile,
+                           "severity": _severity(spikes), "metrics": spikes})
+        return events
+
+
+def _severity(triggered):
+    # Рост стоимости транзакции или латентности важнее, чем изменение TPS
+    regressions = [n for n, m in triggered.items()
+                   if (n in ("Tx Cost (s)", "Max Latency (s)", "IO Waits") and m["direction"] == "up")
+                   or (n == "TPS" and m["direction"] == "down")]
+    return "critical" if regressions else "info"
+
+
+def format_event(event):
+    parts = ", ".join(
+        f"{name} {m['direction']} to {m['value']:g} (z={m['z']})" for name, m in event["metrics"].items()
+    )
+    return f"[{event['severity'].upper()}] {event['type']}: {parts}"
@@ -2,41 +2,109 @@ import subprocess
 import time
 import re
 import os
+import json
 import tempfile
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
 import psycopg2
-from config import DB_CONFIG
+from config import (
+    DB_CONFIG, RESULTS_DIR, RESOURCE_SAMPLE_INTERVAL, RESOURCE_PER_PROCESS,
+    LOAD_POOL_WORKERS, LOAD_POOL_PLACEMENT, LOAD_POOL_READY_TIMEOUT
+)
+from plan_analyzer import PlanStats, format_plan_summary
+from olap_datagen import StarSchemaGenerator
+from recommendations import HardwareInfo
+from workloads import (
+    PgbenchScript, Uniform, Zipfian, validate_script, check_script_in_container,
+    ACCOUNTS_PER_SCALE, TELLERS_PER_SCALE
+)
+from workload_spec import WorkloadSpec, content_hash
+from open_loop import parse_open_loop_output, merge_segments
+from resource_monitor import ContainerStatsSampler, efficiency_metrics
+from load_pool import PgbenchWorkerPool, HIST_AWK, parse_histogram, histogram_percentiles
+from classifier import TrainingRecorder
+
+OLAP_PLAN_QUERIES = {
+    "agg_by_branch": "SELECT bid, count(*), avg(abalance) FROM pgbench_accounts GROUP BY bid",
+    "join_3_tables": """
+        SELECT a.aid, b.bbalance, t.tbalance
+        FROM pgbench_accounts a
+        JOIN pgbench_branches b ON a.bid = b.bid
+        JOIN pgbench_tellers t ON a.bid = t.bid
+        WHERE a.abalance > 0 LIMIT 100
+    """,
+    "top_branches": "SELECT bid, sum(abalance) FROM pgbench_accounts GROUP BY bid ORDER BY sum(abalance) DESC LIMIT 5",
+    "disk_scan": "SELECT count(*), max(random_data) FROM disk_bound_data WHERE random_data LIKE 'A%'",
+}
 
 class BenchmarkRunner:
-    def __init__(self, db_config):
+    # Фикстуры, доступные в секции setup декларативных спецификаций
+    FIXTURES = {
+        "iot_tables": "_create_iot_tables",
+        "olap_indexes": "_create_olap_indexes",
+        "bulk_table": "_create_bulk_table",
+        "disk_bound_table": "_create_disk_bound_table",
+    }
+
+    def __init__(self, db_config, results_dir=RESULTS_DIR, matrix_id=None):
         self.db_config = db_config
+        self.results_dir = results_dir
+        # Все прогоны одной серии (матрицы профилей x тестов) складываются в один каталог;
+        # id уникален для каждого запуска, чтобы серии одного дня не сливались
+        self.matrix_id = matrix_id or f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
         self.container_name = "vtb_postgres"
         self.hammerdb_container = "vtb_hammerdb"
+        self._copied_scripts = set()
+        self._validated_scripts = set()
+        # Телеметрия последнего измеренного запуска, забирается _process_results
+        self._last_resources = None
+        self._last_histogram = None
+        # Метка для TrainingRecorder: если задана, измеряемые запуски пишут размеченные метрики
+        self.training_label = None
 
     def _copy_script_to_container(self, script_content, script_name="test.sql"):
         """
         Создает временный файл со скриптом и копирует его в контейнер.
         Это позволяет pgbench исполнять скрипт локально без сетевых задержек.
+        Имя файла содержит хэш содержимого: неизмененный скрипт повторно не копируется.
         """
         try:
-            with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.sql') as tmp:
-                tmp.write(script_content)
-                tmp_path = tmp.name
+            stem, ext = os.path.splitext(script_name)
+            digest = content_hash(script_content)
+            if not stem.endswith(digest):
+                stem = f"{stem}_{digest}"
+            container_path = f"/tmp/{stem}{ext or '.sql'}"
 
-            docker_dest = f"{self.container_name}:/tmp/{script_name}"
-            subprocess.run(["docker", "cp", tmp_path, docker_dest], check=True)
+            if container_path in self._copied_scripts:
+                return container_path
 
-            os.remove(tmp_path)
+            exists = subprocess.run(["docker", "exec", self.container_name, "test", "-f", container_path])
+            if exists.returncode != 0:
+                with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.sql') as tmp:
+                    tmp.write(script_content)
+                    tmp_path = tmp.name
 
-            return f"/tmp/{script_name}"
+                docker_dest = f"{self.container_name}:{container_path}"
+                subprocess.run(["docker", "cp", tmp_path, docker_dest], check=True)
+
+                os.remove(tmp_path)
+
+            self._copied_scripts.add(container_path)
+            return container_path
         except Exception as e:
             print(f" Error copying script to docker: {e}")
             return None
 
-    def _run_pgbench_custom(self, script_path, duration, clients, threads, test_name):
+    def _run_pgbench_custom(self, script_path, duration, clients, threads, test_name, rate=None, latency_limit=None,
+                            warmup=False):
         """
         Запускает pgbench внутри контейнера с указанным скриптом.
+        script_path - путь или список путей вида 'path@weight'; rate - ограничение -R (tx/s);
+        latency_limit - порог -L (мс), опоздавшие по расписанию транзакции пропускаются.
+        warmup - прогрев: без телеметрии, лога транзакций и записи обучающих примеров.
         """
+        scripts = script_path if isinstance(script_path, list) else [script_path]
         cmd = [
             "docker", "exec", "-i", self.container_name,
             "pgbench",
@@ -46,15 +114,226 @@ class BenchmarkRunner:
             "-c", str(clients),
             "-j", str(threads),
             "-P", "5",
-            "-f", script_path,
             "-r"
         ]
+        for path in scripts:
+            cmd += ["-f", path]
+        if rate:
+            cmd += ["-R", str(rate)]
+        if latency_limit:
+            cmd += ["-L", str(latency_limit)]
 
         print(f" Running {test_name}: pgbench -c {clients} -j {threads} -T {duration} ...")
 
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        if warmup:
+            return subprocess.run(cmd, capture_output=True, text=True)
+        txlog = self._txlog_prefix()
+        return self._run_measured(cmd + ["-l", f"--log-prefix={txlog}"], txlog)
+
+    def _run_measured(self, cmd, txlog=None):
+        """
+        Запускает команду, параллельно снимая ресурсы контейнера БД в self._last_resources.
+        txlog - префикс лога транзакций pgbench (-l) в контейнере: лог сворачивается
+        в гистограмму латентности self._last_histogram и удаляется.
+        """
+        with self._recording(), \
+                ContainerStatsSampler(self.container_name, RESOURCE_SAMPLE_INTERVAL, RESOURCE_PER_PROCESS) as sampler:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        self._last_resources = sampler.summary()
+        self._last_histogram = self._fold_txlog(txlog) if txlog else None
         return result
 
+    @contextmanager
+    def _recording(self):
+        """Обучающие примеры пишутся только на время измеряемой нагрузки, без подготовки данных"""
+        if not self.training_label:
+            yield
+            return
+        with TrainingRecorder(self.training_label) as recorder:
+            yield
+        print(f"  recorded {recorder.samples} training samples for {self.training_label}")
+
+    def _txlog_prefix(self):
+        # /tmp контейнера БД смонтирован как tmpfs (docker-compose.yml): лог не дает блочного I/O в метриках,
+        # но занимает память контейнера и входит в working_set
+        return f"/tmp/vtb_txlog_{os.getpid()}_{int(time.time() * 1000)}"
+
+    def _fold_txlog(self, prefix):
+        """Гистограмма латентности по логу транзакций - считается в контейнере, наружу только корзины"""
+        shell = f"cat {prefix}.* 2>/dev/null | {HIST_AWK}; rm -f {prefix}.*"
+        res = subprocess.run(["docker", "exec", self.container_name, "sh", "-c", shell], capture_output=True, text=True)
+        return parse_histogram(res.stdout)
+
+    def _prepare_workload(self, spec):
+        """Готовит фикстуры спецификации и возвращает список скриптов 'path@weight' в контейнере"""
+        scale = self._run_setup(spec)
+        return [
+            f"{self._prepare_script(content, script_name)}@{weight}"
+            for script_name, content, weight in spec.compile(scale)
+        ]
+
+    def _run_setup(self, spec):
+        """Выполняет секцию setup спецификации и возвращает scale pgbench-таблиц"""
+        scale = 1
+        for step in spec.setup:
+            if "sql" in step:
+                self._exec_sql(step["sql"])
+                continue
+            fixture = step.get("fixture")
+            if fixture == "pgbench":
+                self._initialize_pgbench(scale=step.get("scale", 5))
+                scale = self._get_pgbench_scale(default=step.get("scale", 5))
+            elif fixture in self.FIXTURES:
+                getattr(self, self.FIXTURES[fixture])()
+            else:
+                raise ValueError(f"Unknown fixture '{fixture}' in workload '{spec.name}'")
+        return scale
+
+    def run_workload_spec(self, spec, profile_name, duration=None):
+        """
+        Запускает нагрузку по декларативной спецификации (WorkloadSpec или путь к JSON/YAML):
+        готовит фикстуры, компилирует транзакции в pgbench-скрипты, прогревает и меряет.
+        """
+        try:
+            if isinstance(spec, str):
+                spec = WorkloadSpec.load(spec)
+            duration = duration or spec.duration
+            print(f" Starting {spec.name} workload for {profile_name}...")
+
+            scripts = self._prepare_workload(spec)
+
+            if spec.warmup > 0:
+                print(f" Warm-up {spec.warmup}s...")
+                self._run_pgbench_custom(scripts, spec.warmup, spec.clients, spec.threads, f"{spec.name} (warm-up)",
+                                         rate=spec.rate, warmup=True)
+
+            result = self._run_pgbench_custom(scripts, duration, spec.clients, spec.threads, spec.name, rate=spec.rate)
+            return self._process_results(result, profile_name, spec.test_type, duration, spec.clients)
+
+        except Exception as e:
+            return self._handle_error(e, profile_name)
+
+    def run_open_loop_test(self, spec, profile_name, schedule, latency_limit=None):
+        """
+        Open-loop нагрузка: транзакции приходят по расписанию RateSchedule (pgbench -R),
+        а не так быстро, как успевают клиенты. Латентность считается от запланированного
+        старта, поэтому очередь не прячется (coordinated omission).
+        latency_limit (мс) - SLO: опоздавшие транзакции пропускаются и учитываются отдельно.
+
+        Каждый сегмент - отдельный процесс pgbench, поэтому очередь, накопленная к концу
+        сегмента, на его границе сбрасывается: следующий сегмент начинает с пустым расписанием.
+        При перегрузке lag на ступенях занижен; число таких сбросов - open_loop.queue_resets.
+        """
+        try:
+            if isinstance(spec, str):
+                spec = WorkloadSpec.load(spec)
+            print(f" Starting open-loop {spec.name} for {profile_name}: {len(schedule.segments)} segments, {schedule.duration}s...")
+
+            scripts = self._prepare_workload(spec)
+
+            if spec.warmup > 0:
+                first_rate = schedule.segments[0][1]
+                self._run_pgbench_custom(scripts, spec.warmup, spec.clients, spec.threads, f"{spec.name} (warm-up)",
+                                         rate=first_rate, warmup=True)
+
+            segments = []
+            for seconds, rate in schedule.segments:
+                result = self._run_pgbench_custom(
+                    scripts, seconds, spec.clients, spec.threads,
+                    f"{spec.name} @ {rate:.0f} tx/s", rate=round(rate, 2), latency_limit=latency_limit
+                )
+                # Строки progress с lag/skipped по интервалам pgbench пишет в stderr
+                segment = parse_open_loop_output(result.stdout + "\n" + result.stderr)
+                segment["target_rate"] = round(rate, 2)
+                segment["duration"] = seconds
+                segment["resources"] = self._last_resources
+                segment["efficiency"] = efficiency_metrics(self._last_resources, segment["processed"])
+                segments.append(segment)
+                print(f"  target {rate:.0f} tx/s -> {segment['tps']:.1f} tps, lat {segment['latency_avg']:.2f}ms, "
+                      f"lag {segment['lag_avg']:.2f}ms, skipped {segment['skipped']}, late {segment['late']}")
+
+            summary = merge_segments(segments)
+            measured = [s["resources"] for s in segments if s["resources"]]
+            cpu_seconds = sum(r.get("server_cpu_seconds", r["cpu_seconds"]) for r in measured)
+            if cpu_seconds > 0:
+                summary["tx_per_cpu_second"] = round(summary["processed"] / cpu_seconds, 2)
+                summary["cpu_includes_client"] = any("server_cpu_seconds" not in r for r in measured)
+            results = {
+                'profile': profile_name,
+                'test_type': f"{spec.test_type}_OPEN",
+                'tps': round(summary['processed'] / max(schedule.duration, 1), 2),
+                'tpm': round(summary['processed'] * 60 / max(schedule.duration, 1), 2),
+                'avg_latency': summary['latency_avg'],
+                'duration_minutes': round(schedule.duration / 60, 2),
+                'clients': spec.clients,
+                'timestamp': datetime.now().isoformat(),
+                'open_loop': summary,
+                'segments': segments
+            }
+            self._save_results(results)
+            print(f" Open-loop completed: lat {summary['latency_avg']:.2f}ms, lag max {summary['lag_max']:.2f}ms, "
+                  f"skipped {summary['skipped_pct']}%, late {summary['late_pct']}%")
+            return results
+
+        except Exception as e:
+            return self._handle_error(e, profile_name)
+
+    def run_distributed_test(self, spec, profile_name, workers=LOAD_POOL_WORKERS, placement=LOAD_POOL_PLACEMENT,
+                             duration=None, clients_per_worker=None, threads_per_worker=None):
+        """
+        Нагрузка от пула из workers процессов pgbench (отдельные контейнеры, docker exec или хост),
+        стартующих по барьеру. spec - WorkloadSpec/путь или None для встроенного TPC-B;
+        clients/threads из спецификации задаются на каждого воркера.
+        """
+        try:
+            if isinstance(spec, str):
+                spec = WorkloadSpec.load(spec)
+            name = spec.name if spec else "TPC-B"
+            duration = duration or (spec.duration if spec else 30)
+            clients = clients_per_worker or (spec.clients if spec else 10)
+            threads = threads_per_worker or (spec.threads if spec else 2)
+            print(f" Starting distributed {name} for {profile_name}: {workers} x {placement} workers, {clients} clients each...")
+
+            scripts = None
+            if spec:
+                scripts = spec.compile(self._run_setup(spec))
+                # Синтаксис проверяется один раз в контейнере БД, воркеры получают уже проверенный текст
+                for script_name, content, _ in scripts:
+                    self._prepare_script(content, script_name)
+            else:
+                self._initialize_pgbench(scale=10)
+
+            pool = PgbenchWorkerPool(self.db_config, self.container_name, workers, placement, LOAD_POOL_READY_TIMEOUT)
+            with ContainerStatsSampler(self.container_name, RESOURCE_SAMPLE_INTERVAL, RESOURCE_PER_PROCESS) as sampler:
+                merged = pool.run(scripts, duration, clients, threads, rate=spec.rate if spec else None)
+            resources = sampler.summary()
+
+            results = {
+                'profile': profile_name,
+                'test_type': f"{spec.test_type if spec else 'OLTP'}_POOL",
+                'tps': merged['tps'],
+                'tpm': round(merged['tps'] * 60, 2),
+                'avg_latency': merged['latency_avg'],
+                'duration_minutes': round(duration / 60, 2),
+                'clients': clients * workers,
+                'timestamp': datetime.now().isoformat(),
+                'progress': merged['progress'],
+                'percentiles_ms': merged['percentiles_ms'],
+                'pool': {k: v for k, v in merged.items() if k not in ('progress', 'percentiles_ms')}
+            }
+            if resources:
+                results['resources'] = resources
+                results['efficiency'] = efficiency_metrics(resources, merged['processed'])
+            self._save_results(results)
+
+            p = merged['percentiles_ms']
+            print(f" Distributed {name} completed: {merged['tps']:.1f} TPS, p50 {p.get('p50', 0)}ms, p99 {p.get('p99', 0)}ms, "
+                  f"start skew {merged['start_skew_ms'] if merged['start_skew_ms'] is not None else '?'}ms, failed workers {merged['failed_workers']}")
+            return results
+
+        except Exception as e:
+            return self._handle_error(e, profile_name)
+
     def run_oltp_test(self, profile_name, duration=30, clients=20):
         """
         Стандартный TPC-B подобный тест (чтение + запись в транзакции).
@@ -65,18 +344,20 @@ class BenchmarkRunner:
 
             self._initialize_pgbench(scale=10)
 
+            txlog = self._txlog_prefix()
             cmd = [
                 "docker", "exec", "-i", self.container_name,
                 "pgbench",
                 "-c", str(clients),
                 "-j", "4",
                 "-T", str(duration),
+                "-l", f"--log-prefix={txlog}",
                 "-U", "user", "mydb",
                 "-r", "-P", "5"
             ]
 
-            result = subprocess.run(cmd, capture_output=True, text=True)
-            return self._process_results(result.stdout, profile_name, "OLTP", duration, clients)
+            result = self._run_measured(cmd, txlog)
+            return self._process_results(result, profile_name, "OLTP", duration, clients)
 
         except Exception as e:
             return self._handle_error(e, profile_name)
@@ -111,7 +392,7 @@ class BenchmarkRunner:
 
             result = self._run_pgbench_custom(script_path, duration, clients=4, threads=2, test_name="OLAP")
 
-            return self._process_results(result.stdout, profile_name, "OLAP", duration, 4)
+            return self._process_results(result, profile_name, "OLAP", duration, 4)
 
         except Exception as e:
             return self._handle_error(e, profile_name)
@@ -137,7 +418,114 @@ class BenchmarkRunner:
             threads = 1
             result = self._run_pgbench_custom(script_path, duration, clients, threads, test_name="DISK_OLAP")
 
-            return self._process_results(result.stdout, profile_name, "DISK_OLAP", duration, clients)
+            return self._process_results(result, profile_name, "DISK_OLAP", duration, clients)
+
+        except Exception as e:
+            return self._handle_error(e, profile_name)
+
+    def run_star_olap_test(self, profile_name, duration=30, scale_gb=None, disk_bound=False, partitioned=True):
+        """
+        Аналитика на звездной схеме (fact_sales + измерения) с Zipf-перекосом ключей.
+        При disk_bound=True и без scale_gb объем подбирается больше RAM контейнера.
+        """
+        try:
+            if scale_gb is None:
+                scale_gb = 1
+                if disk_bound:
+                    hw = HardwareInfo.detect_container(self.container_name)
+                    scale_gb = min(100, max(1, -(-hw.memory_bytes * 3 // 2 // 1024 ** 3)))
+
+            test_type = "STAR_DISK_OLAP" if disk_bound else "STAR_OLAP"
+            print(f" Starting {test_type} test ({scale_gb}GB) for {profile_name}...")
+            StarSchemaGenerator(self.db_config, scale_gb=scale_gb, partitioned=partitioned).ensure_dataset()
+
+            sql_script = """
+            \set r random(1, 3)
+            \set d random(0, 1700)
+            \if :r = 1
+                -- Выручка по категориям за квартал (partition pruning по дате)
+                SELECT p.category, sum(f.amount)
+                FROM fact_sales f JOIN dim_product p USING (product_id)
+                WHERE f.sale_date >= date '2020-01-01' + :d AND f.sale_date < date '2020-01-01' + :d + 90
+                GROUP BY p.category;
+            \elif :r = 2
+                -- Регионы x кварталы за год
+                SELECT c.region, d.quarter, count(*), avg(f.amount)
+                FROM fact_sales f
+                JOIN dim_customer c USING (customer_id)
+                JOIN dim_date d ON d.date_id = f.sale_date
+                WHERE d.year = 2020 + :d / 365
+                GROUP BY c.region, d.quarter;
+            \else
+                -- Полный скан факта
+                SELECT s.format, sum(f.quantity) FROM fact_sales f JOIN dim_store s USING (store_id) GROUP BY s.format;
+            \endif
+            """
+
+            script_path = self._copy_script_to_container(sql_script, "star_olap.sql")
+            result = self._run_pgbench_custom(script_path, duration, clients=4, threads=2, test_name=test_type)
+
+            return self._process_results(result, profile_name, test_type, duration, 4)
+
+        except Exception as e:
+            return self._handle_error(e, profile_name)
+
+    def run_olap_plan_test(self, profile_name, iterations=5, queries=None, settings=None):
+        """
+        Аналитический тест на уровне планов: каждый запрос выполняется iterations раз
+        через EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON). Собирает время и буферы по узлам,
+        запуск параллельных воркеров и срабатывание JIT.
+        settings - параметры профиля (work_mem, jit, ...), выставляемые на сессию.
+        """
+        try:
+            print(f" Starting OLAP plan test for {profile_name}...")
+            self._initialize_pgbench(scale=10)
+            self._create_olap_indexes()
+            queries = queries or OLAP_PLAN_QUERIES
+            if "disk_scan" in queries:
+                self._create_disk_bound_table()
+
+            conn = psycopg2.connect(**self.db_config)
+            conn.autocommit = True
+            plans = {}
+            try:
+                with conn.cursor() as cur:
+                    for name, value in (settings or {}).items():
+                        try:
+                            cur.execute("SELECT set_config(%s, %s, false)", (name, str(value)))
+                        except psycopg2.Error as e:
+                            # Параметры уровня postmaster/sighup нельзя выставить на сессию
+                            print(f" Skipping {name}: {str(e).strip()}")
+
+                    for name, sql in queries.items():
+                        stats = PlanStats(name)
+                        for _ in range(iterations):
+                            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
+                            plan = cur.fetchone()[0]
+                            if isinstance(plan, str):
+                                plan = json.loads(plan)
+                            stats.add(plan)
+                        plans[name] = stats.summary()
+                        print(format_plan_summary(plans[name]))
+            finally:
+                conn.close()
+
+            total_ms = sum(p["avg_execution_ms"] for p in plans.values())
+            qps = len(plans) * 1000.0 / total_ms if total_ms > 0 else 0.0
+
+            results = {
+                'profile': profile_name,
+                'test_type': 'OLAP_PLAN',
+                'tps': round(qps, 2),
+                'tpm': round(qps * 60, 2),
+                'avg_latency': round(total_ms / max(len(plans), 1), 2),
+                'duration_minutes': round(total_ms * iterations / 60000, 2),
+                'clients': 1,
+                'timestamp': datetime.now().isoformat(),
+                'plans': plans
+            }
+            self._save_results(results)
+            return results
 
         except Exception as e:
             return self._handle_error(e, profile_name)
@@ -164,61 +552,77 @@ class BenchmarkRunner:
             threads = 4
             result = self._run_pgbench_custom(script_path, duration, clients, threads, test_name="IoT")
 
-            return self._process_results(result.stdout, profile_name, "IoT", duration, clients)
+            return self._process_results(result, profile_name, "IoT", duration, clients)
 
         except Exception as e:
             return self._handle_error(e, profile_name)
 
-    def run_mixed_test(self, profile_name, duration=30):
+    def run_mixed_test(self, profile_name, duration=30, distribution=None):
         """
         Смешанная нагрузка: Чтение (50%), Обновление (30%), Вставка (20%).
+        Ключи берутся из всего диапазона pgbench_accounts по distribution (по умолчанию Zipf).
         """
         try:
             print(f" Starting Mixed test for {profile_name}...")
             self._initialize_pgbench(scale=5)
-
-            sql_script = """
-            \set r random(1, 100)
-            \if :r <= 50
-                -- 50% Read
-                SELECT abalance FROM pgbench_accounts WHERE aid = :r;
-            \elif :r <= 80
-                -- 30% Update
-                UPDATE pgbench_accounts SET abalance = abalance + 1 WHERE aid = :r;
-            \else
-                -- 20% Insert
-                INSERT INTO pgbench_history (tid, bid, aid, delta, mtime) VALUES (1, 1, 1, 1, NOW());
-            \endif
-            """
-
-            script_path = self._copy_script_to_container(sql_script, "mixed.sql")
+            scale = self._get_pgbench_scale(default=5)
+
+            sql_script = (
+                PgbenchScript()
+                .set("r", "random(1, 100)")
+                .key("aid", distribution or Zipfian(1.1), ACCOUNTS_PER_SCALE * scale)
+                .set("bid", f"(:aid - 1) / {ACCOUNTS_PER_SCALE} + 1")
+                .set("tid", f"random(1, {TELLERS_PER_SCALE * scale})")
+                .sql("""
+                \\if :r <= 50
+                    -- 50% Read
+                    SELECT abalance FROM pgbench_accounts WHERE aid = :aid;
+                \\elif :r <= 80
+                    -- 30% Update
+                    UPDATE pgbench_accounts SET abalance = abalance + 1 WHERE aid = :aid;
+                \\else
+                    -- 20% Insert
+                    INSERT INTO pgbench_history (tid, bid, aid, delta, mtime) VALUES (:tid, :bid, :aid, 1, NOW());
+                \\endif
+                """)
+                .render()
+            )
+
+            script_path = self._prepare_script(sql_script, "mixed.sql")
             result = self._run_pgbench_custom(script_path, duration, clients=16, threads=4, test_name="Mixed")
 
-            return self._process_results(result.stdout, profile_name, "Mixed", duration, 16)
+            return self._process_results(result, profile_name, "Mixed", duration, 16)
 
         except Exception as e:
             return self._handle_error(e, profile_name)
 
-    def run_read_only_test(self, profile_name, duration=30):
+    def run_read_only_test(self, profile_name, duration=30, distribution=None):
         """
         Тест только для чтения (Web / Read-Only): высокая скорость извлечения данных.
+        Ключи берутся из всего диапазона pgbench_accounts по distribution (по умолчанию Zipf).
         """
         try:
             print(f" Starting Read-Only test for {profile_name}...")
             self._initialize_pgbench(scale=10)
+            scale = self._get_pgbench_scale(default=10)
 
-            sql_script = """
-            -- Выбираем случайную запись, имитируя чтение страницы/объекта
-            SELECT abalance, filler FROM pgbench_accounts WHERE aid = :aid;
-            """
+            sql_script = (
+                PgbenchScript()
+                .key("aid", distribution or Zipfian(1.1), ACCOUNTS_PER_SCALE * scale)
+                .sql("""
+                -- Выбираем случайную запись, имитируя чтение страницы/объекта
+                SELECT abalance, filler FROM pgbench_accounts WHERE aid = :aid;
+                """)
+                .render()
+            )
 
-            script_path = self._copy_script_to_container(sql_script, "readonly.sql")
+            script_path = self._prepare_script(sql_script, "readonly.sql")
 
             clients = 50
             threads = 8
             result = self._run_pgbench_custom(script_path, duration, clients, threads, test_name="READ_ONLY")
 
-            return self._process_results(result.stdout, profile_name, "READ_ONLY", duration, clients)
+            return self._process_results(result, profile_name, "READ_ONLY", duration, clients)
 
         except Exception as e:
             return self._handle_error(e, profile_name)
@@ -246,7 +650,7 @@ class BenchmarkRunner:
             threads = 1
             result = self._run_pgbench_custom(script_path, duration, clients, threads, test_name="BATCH_JOB")
 
-            return self._process_results(result.stdout, profile_name, "BATCH_JOB", duration, clients)
+            return self._process_results(result, profile_name, "BATCH_JOB", duration, clients)
 
         except Exception as e:
             return self._handle_error(e, profile_name)
@@ -265,9 +669,10 @@ class BenchmarkRunner:
 
             start_time = time.time()
 
-            self._exec_sql("VACUUM ANALYZE pgbench_accounts;")
-            self._exec_sql("VACUUM ANALYZE pgbench_branches;")
-            self._exec_sql("VACUUM ANALYZE pgbench_tellers;")
+            with self._recording():
+                self._exec_sql("VACUUM ANALYZE pgbench_accounts;")
+                self._exec_sql("VACUUM ANALYZE pgbench_branches;")
+                self._exec_sql("VACUUM ANALYZE pgbench_tellers;")
 
             end_time = time.time()
             actual_duration_ms = (end_time - start_time) * 1000
@@ -310,12 +715,12 @@ class BenchmarkRunner:
 
             self._exec_sql("TRUNCATE TABLE bulk_data;")
 
-            return self._process_results(result.stdout, profile_name, "BULK_LOAD", duration, clients)
+            return self._process_results(result, profile_name, "BULK_LOAD", duration, clients)
 
         except Exception as e:
             return self._handle_error(e, profile_name)
 
-    def run_tpcc_test(self, profile_name, duration=60):
+    def run_tpcc_test(self, profile_name, duration=60, distribution=None):
         """
         Пытается запустить HammerDB. Если нет - мощная эмуляция через pgbench.
         """
@@ -338,20 +743,31 @@ class BenchmarkRunner:
             else:
                 print(" HammerDB not found. Running TPC-C simulation via pgbench...")
 
-                sql_script = """
-                BEGIN;
-                -- Payment Transaction Logic
-                UPDATE pgbench_branches SET bbalance = bbalance + 10 WHERE bid = :scale;
-                UPDATE pgbench_tellers SET tbalance = tbalance + 10 WHERE tid = :scale;
-                UPDATE pgbench_accounts SET abalance = abalance + 10 WHERE aid = :scale;
-                INSERT INTO pgbench_history (tid, bid, aid, delta, mtime) VALUES (1, 1, 1, 10, NOW());
-                -- New Order Check
-                SELECT abalance FROM pgbench_accounts WHERE aid = :scale;
-                COMMIT;
-                """
-                script_path = self._copy_script_to_container(sql_script, "tpcc_sim.sql")
+                self._initialize_pgbench(scale=10)
+                scale = self._get_pgbench_scale(default=10)
+
+                sql_script = (
+                    PgbenchScript()
+                    .key("aid", distribution or Uniform(), ACCOUNTS_PER_SCALE * scale)
+                    .set("bid", f"random(1, {scale})")
+                    .set("tid", f"random(1, {TELLERS_PER_SCALE * scale})")
+                    .set("delta", "random(-5000, 5000)")
+                    .sql("""
+                    BEGIN;
+                    -- Payment Transaction Logic
+                    UPDATE pgbench_branches SET bbalance = bbalance + :delta WHERE bid = :bid;
+                    UPDATE pgbench_tellers SET tbalance = tbalance + :delta WHERE tid = :tid;
+                    UPDATE pgbench_accounts SET abalance = abalance + :delta WHERE aid = :aid;
+                    INSERT INTO pgbench_history (tid, bid, aid, delta, mtime) VALUES (:tid, :bid, :aid, :delta, NOW());
+                    -- New Order Check
+                    SELECT abalance FROM pgbench_accounts WHERE aid = :aid;
+                    COMMIT;
+                    """)
+                    .render()
+                )
+                script_path = self._prepare_script(sql_script, "tpcc_sim.sql")
                 res = self._run_pgbench_custom(script_path, duration, clients=10, threads=2, test_name="TPC-C (Sim)")
-                return self._process_results(res.stdout, profile_name, "TPC-C", duration, 10)
+                return self._process_results(res, profile_name, "TPC-C", duration, 10)
 
             self._save_results(results)
             print(f" TPC-C test completed: {results['tps']:.1f} TPS")
@@ -361,9 +777,10 @@ class BenchmarkRunner:
             return self._handle_error(e, profile_name)
 
 
-    def _process_results(self, stdout, profile_name, test_type, duration, clients):
-        """Парсинг вывода pgbench и сохранение в БД"""
-        tps, avg_latency = self._parse_pgbench_output(stdout)
+    def _process_results(self, result, profile_name, test_type, duration, clients):
+        """Парсинг вывода pgbench и сохранение в БД. Строки progress (-P) pgbench пишет в stderr"""
+        tps, avg_latency = self._parse_pgbench_output(result.stdout)
+        parsed = parse_open_loop_output(result.stdout + "\n" + result.stderr)
 
         results = {
             'profile': profile_name,
@@ -373,11 +790,27 @@ class BenchmarkRunner:
             'avg_latency': round(avg_latency, 2),
             'duration_minutes': round(duration / 60, 2),
             'clients': clients,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': datetime.now().isoformat(),
+            'latency_stddev': parsed['latency_stddev'],
+            'progress': parsed['progress']
         }
 
+        histogram, self._last_histogram = self._last_histogram, None
+        if histogram:
+            results['percentiles_ms'] = histogram_percentiles(histogram)
+
+        resources, self._last_resources = self._last_resources, None
+        if resources:
+            transactions = parsed['processed'] or tps * duration
+            results['resources'] = resources
+            results['efficiency'] = efficiency_metrics(resources, transactions)
+
         self._save_results(results)
         print(f" {test_type} completed: {tps:.1f} TPS, {avg_latency:.2f}ms")
+        if results.get('efficiency'):
+            eff = results['efficiency']
+            client = " (incl. pgbench)" if eff['cpu_includes_client'] else f" (pgbench {eff['client_cpu_seconds']} CPU-s excluded)"
+            print(f"  cost: {eff['tx_per_cpu_second']} tx/CPU-s{client}, {eff['bytes_written_per_tx']} B written/tx")
         return results
 
     def _initialize_pgbench(self, scale=5):
@@ -395,6 +828,32 @@ class BenchmarkRunner:
         except Exception:
             pass
 
+    def _get_pgbench_scale(self, default=1):
+        """Реальный scale pgbench-таблиц (число веток). В custom-скриптах :scale по умолчанию равен 1."""
+        cmd = ["docker", "exec", "-i", self.container_name, "psql", "-U", "user", "-d", "mydb", "-tAc", "SELECT count(*) FROM pgbench_branches"]
+        res = subprocess.run(cmd, capture_output=True, text=True)
+        value = res.stdout.strip()
+        if res.returncode == 0 and value.isdigit() and int(value) > 0:
+            return int(value)
+        return default
+
+    def _prepare_script(self, script_content, script_name):
+        """Проверяет скрипт статически и одной пробной транзакцией, затем возвращает путь в контейнере"""
+        errors = validate_script(script_content)
+        if errors:
+            raise ValueError(f"Invalid pgbench script {script_name}: " + "; ".join(errors))
+
+        script_path = self._copy_script_to_container(script_content, script_name)
+        if script_path is None:
+            raise RuntimeError(f"Could not copy {script_name} to container")
+
+        if script_path not in self._validated_scripts:
+            error = check_script_in_container(self.container_name, script_path)
+            if error:
+                raise ValueError(f"pgbench rejected {script_name}: {error}")
+            self._validated_scripts.add(script_path)
+        return script_path
+
     def _create_iot_tables(self):
         """Создает таблицы для IoT теста"""
         sql = """
@@ -494,6 +953,21 @@ class BenchmarkRunner:
             conn.close()
         except Exception as e:
             print(f" DB Save Error: {e}")
+        self._save_results_file(results)
+
+    def _save_results_file(self, results):
+        """Полный результат (с рядами progress, планами, сегментами) в results/<matrix_id>/ для отчетов"""
+        try:
+            run_dir = os.path.join(self.results_dir, self.matrix_id)
+            os.makedirs(run_dir, exist_ok=True)
+            stamp = results.get('timestamp') or datetime.now().isoformat()
+            name = re.sub(r"[^A-Za-z0-9]+", "_", f"{stamp}_{results.get('test_type')}_{results.get('profile')}").strip("_")
+            path = os.path.join(run_dir, f"{name}.json")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({**results, 'matrix_id': self.matrix_id, 'timestamp': stamp}, f, ensure_ascii=False, indent=1)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            print(f" Results file save error: {e}")
 
     def cleanup_failed_tests(self):
         try:
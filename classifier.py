@@ -0,0 +1,291 @@
+import json
+import math
+import threading
+import time
+import uuid
+from collections import Counter
+import numpy as np
+
+from config import DB_CONFIG, TRAINING_DATA_PATH, CLASSIFIER_MODEL_PATH
+
+# Признаки берутся из словаря метрик ProfileAnalyzer; у "тяжелых хвостов" логарифм
+FEATURES = [
+    ("TPS", True),
+    ("Active Sessions (ASH)", True),
+    ("Tx Cost (s)", True),
+    ("Max Latency (s)", True),
+    ("IO Waits", False),
+    ("Read/Write Ratio", True),
+    ("Insert/Write Ratio", False),
+    ("Lock Waits", False),
+    ("Dead Tuple Growth (/s)", True),
+    ("Vacuums Running", False),
+]
+
+
+def feature_vector(metrics):
+    values = []
+    for name, log_scale in FEATURES:
+        value = float(metrics.get(name, 0.0) or 0.0)
+        if log_scale:
+            value = math.copysign(math.log1p(abs(value)), value)
+        values.append(value)
+    return values
+
+
+class DecisionTreeModel:
+    """
+    Дерево решений (CART, Gini), обученное на NumPy и хранящееся в плоских массивах
+    feature/threshold/left/right/proba. Предсказание - проход по спискам без NumPy,
+    единицы микросекунд на вектор.
+    """
+
+    def __init__(self, classes, feature, threshold, left, right, proba):
+        self.classes = [str(c) for c in classes]
+        self.feature = [int(v) for v in feature]
+        self.threshold = [float(v) for v in threshold]
+        self.left = [int(v) for v in left]
+        self.right = [int(v) for v in right]
+        self.proba = [list(map(float, row)) for row in proba]
+
+    @classmethod
+    def fit(cls, X, y, max_depth=8, min_samples_leaf=3):
+        X = np.asarray(X, dtype=float)
+        classes = sorted(set(y))
+        y_idx = np.array([classes.index(label) for label in y])
+        nodes = {"feature": [], "threshold": [], "left": [], "right": [], "proba": []}
+        _grow(X, y_idx, len(classes), 0, max_depth, min_samples_leaf, nodes)
+        return cls(classes, nodes["feature"], nodes["threshold"], nodes["left"], nodes["right"], nodes["proba"])
+
+    def predict_proba_one(self, x):
+        node = 0
+        while self.left[node] >= 0:
+            node = self.left[node] if x[self.feature[node]] <= self.threshold[node] else self.right[node]
+        return self.proba[node]
+
+    def predict_one(self, x):
+        proba = self.predict_proba_one(x)
+        best = max(range(len(proba)), key=proba.__getitem__)
+        return self.classes[best], proba[best]
+
+    def predict(self, metrics):
+        """Профиль и уверенность ('High'/'Medium'/'Low') по словарю метрик"""
+        label, p = self.predict_one(feature_vector(metrics))
+        confidence = "High" if p >= 0.9 else "Medium" if p >= 0.6 else "Low"
+        return label, confidence
+
+    def save(self, path=CLASSIFIER_MODEL_PATH):
+        np.savez(
+            path, classes=np.array(self.classes), feature=np.array(self.feature),
+            threshold=np.array(self.threshold), left=np.array(self.left),
+            right=np.array(self.right), proba=np.array(self.proba),
+            features=np.array([name for name, _ in FEATURES])
+        )
+
+    @classmethod
+    def load(cls, path=CLASSIFIER_MODEL_PATH):
+        data = np.load(path)
+        if list(data["features"]) != [name for name, _ in FEATURES]:
+            raise ValueError(f"Model {path} was trained on a different feature set, retrain it")
+        return cls(data["classes"], data["feature"], data["threshold"], data["left"], data["right"], data["proba"])
+
+
+def _grow(X, y, n_classes, depth, max_depth, min_leaf, nodes):
+    node_id = len(nodes["feature"])
+    counts = np.bincount(y, minlength=n_classes)
+    for key, value in (("feature", -1), ("threshold", 0.0), ("left", -1), ("right", -1),
+                       ("proba", counts / max(counts.sum(), 1))):
+        nodes[key].append(value)
+
+    if depth >= max_depth or len(y) < 2 * min_leaf or counts.max() == len(y):
+        return node_id
+
+    split = _best_split(X, y, n_classes, min_leaf)
+    if split is None:
+        return node_id
+
+    feature, threshold = split
+    mask = X[:, feature] <= threshold
+    nodes["feature"][node_id] = feature
+    nodes["threshold"][node_id] = threshold
+    nodes["left"][node_id] = _grow(X[mask], y[mask], n_classes, depth + 1, max_depth, min_leaf, nodes)
+    nodes["right"][node_id] = _grow(X[~mask], y[~mask], n_classes, depth + 1, max_depth, min_leaf, nodes)
+    return node_id
+
+
+def _best_split(X, y, n_classes, min_leaf):
+    n = len(y)
+    onehot = np.eye(n_classes)[y]
+    parent = 1.0 - ((onehot.sum(axis=0) / n) ** 2).sum()
+    best, best_score = None, parent - 1e-12
+
+    n_left = np.arange(1, n)
+    n_right = n - n_left
+    for f in range(X.shape[1]):
+        order = np.argsort(X[:, f], kind="mergesort")
+        xs = X[order, f]
+        left = np.cumsum(onehot[order], axis=0)[:-1]
+        right = left[-1] + onehot[order][-1] - left
+        gini_left = 1.0 - ((left / n_left[:, None]) ** 2).sum(axis=1)
+        gini_right = 1.0 - ((right / n_right[:, None]) ** 2).sum(axis=1)
+        score = (n_left * gini_left + n_right * gini_right) / n
+        valid = (xs[1:] > xs[:-1]) & (n_left >= min_leaf) & (n_right >= min_leaf)
+        if not valid.any():
+            continue
+        score = np.where(valid, score, np.inf)
+        i = int(np.argmin(score))
+        if score[i] < best_score:
+            best_score = score[i]
+            best = (f, float((xs[i] + xs[i + 1]) / 2))
+    return best
+
+
+class TrainingRecorder:
+    """
+    Пока идет измеряемая нагрузка, в фоне снимает метрики собственным коллектором и пишет
+    размеченные примеры в JSONL: { label, run, metrics, rule_profile }. BenchmarkRunner включает
+    его только вокруг измеряемого запуска, без подготовки данных. Первые skip_samples
+    снимков (подключение клиентов, разгон) пропускаются. run - id записи: соседние тики
+    одного прогона почти одинаковы, поэтому отложенная выборка делится по прогонам.
+    """
+
+    def __init__(self, label, db_config=DB_CONFIG, path=TRAINING_DATA_PATH, interval=2.0, skip_samples=2):
+        self.label = label
+        self.db_config = db_config
+        self.path = path
+        self.interval = interval
+        self.skip_samples = skip_samples
+        self.run_id = uuid.uuid4().hex[:12]
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join(timeout=self.interval * 2)
+        return False
+
+    def _run(self):
+        from metrics import MetricsCollector
+        from analyzer import ProfileAnalyzer
+
+        try:
+            collector = MetricsCollector(self.db_config)
+        except ConnectionError as e:
+            print(f" Training recorder disabled: {e}")
+            return
+        analyzer = ProfileAnalyzer()
+        prev = collector.get_snapshot()
+        seen = 0
+
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                while not self._stop.wait(self.interval):
+                    curr = collector.get_snapshot()
+                    profile, _, metrics = analyzer.analyze(prev, curr, curr["time"] - prev["time"])
+                    prev = curr
+                    seen += 1
+                    if seen <= self.skip_samples:
+                        continue
+                    f.write(json.dumps({"label": self.label, "run": self.run_id, "metrics": metrics,
+                                        "rule_profile": profile}) + "\n")
+                    f.flush()
+                    self.samples += 1
+        finally:
+            collector.conn.close()
+
+
+def load_samples(path=TRAINING_DATA_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def accuracy_report(model, samples):
+    """Точность модели и правил на размеченных примерах, плюс точность по классам и время предсказания"""
+    model_hits, rule_hits = 0, 0
+    per_class = {}
+    start = time.perf_counter()
+    predictions = [model.predict(s["metrics"])[0] for s in samples]
+    predict_us = (time.perf_counter() - start) * 1e6 / max(len(samples), 1)
+
+    for sample, predicted in zip(samples, predictions):
+        stats = per_class.setdefault(sample["label"], {"total": 0, "model": 0, "rules": 0})
+        stats["total"] += 1
+        if predicted == sample["label"]:
+            model_hits += 1
+            stats["model"] += 1
+        if sample["rule_profile"] == sample["label"]:
+            rule_hits += 1
+            stats["rules"] += 1
+
+    total = max(len(samples), 1)
+    return {
+        "samples": len(samples),
+        "model_accuracy": round(model_hits / total, 3),
+        "rules_accuracy": round(rule_hits / total, 3),
+        "predict_us": round(predict_us, 2),
+        "per_class": {
+            label: {"total": s["total"], "model": round(s["model"] / s["total"], 3), "rules": round(s["rules"] / s["total"], 3)}
+            for label, s in sorted(per_class.items())
+        },
+    }
+
+
+def split_by_run(samples, holdout, rng):
+    """
+    Отложенная выборка из целых прогонов: тики одного прогона автокоррелированы и не должны
+    попадать и в обучение, и в проверку. Прогоны делятся внутри каждой метки, один прогон
+    метки всегда остается в обучении. Примеры без run (старые записи) группируются
+    по подряд идущим строкам с одной меткой - так их писал один TrainingRecorder.
+    """
+    runs, block = {}, 0
+    for i, sample in enumerate(samples):
+        if "run" not in sample and i > 0 and ("run" in samples[i - 1] or samples[i - 1]["label"] != sample["label"]):
+            block += 1
+        key = sample.get("run") or f"legacy-{block}"
+        runs.setdefault((sample["label"], key), []).append(sample)
+
+    by_label = {}
+    for (label, key), group in runs.items():
+        by_label.setdefault(label, []).append(group)
+
+    train_set, test_set = [], []
+    for label in sorted(by_label):
+        groups = by_label[label]
+        order = rng.permutation(len(groups))
+        n_test = min(int(round(len(groups) * holdout)), len(groups) - 1)
+        for rank, i in enumerate(order):
+            (test_set if rank < n_test else train_set).extend(groups[i])
+    return train_set, test_set
+
+
+def train(path=TRAINING_DATA_PATH, model_path=CLASSIFIER_MODEL_PATH, holdout=0.25, max_depth=8, seed=42):
+    """Обучает дерево на записанных примерах, оценивает на отложенной выборке и сохраняет модель"""
+    samples = load_samples(path)
+    if len(samples) < 10:
+        raise ValueError(f"Not enough training samples in {path}: {len(samples)}")
+
+    train_set, held_out = split_by_run(samples, holdout, np.random.default_rng(seed))
+    # Один прогон на метку: отложить нечего, точность считается на обучающей выборке
+    test_set = held_out or train_set
+
+    model = DecisionTreeModel.fit(
+        [feature_vector(s["metrics"]) for s in train_set],
+        [s["label"] for s in train_set],
+        max_depth=max_depth
+    )
+    model.save(model_path)
+    report = accuracy_report(model, test_set)
+    report["labels"] = dict(Counter(s["label"] for s in samples))
+    report["evaluated_on"] = "holdout" if held_out else "train"
+    return model, report
+
+
+if __name__ == "__main__":
+    _, report = train()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
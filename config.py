@@ -1,9 +1,72 @@
 ANALYSIS_INTERVAL = 2
 
+# Границы адаптивного интервала опроса (сек): чаще при всплесках и сменах профиля, реже в покое
+MIN_ANALYSIS_INTERVAL = 0.5
+MAX_ANALYSIS_INTERVAL = 10
+
+# Блокировки снимаются раз в LOCK_SAMPLE_EVERY снимков (1 - каждый снимок)
+LOCK_SAMPLE_EVERY = 1
+LOCK_TOP_BLOCKERS = 5
+
+# Оценка bloat дорогая (pg_stats по всем таблицам), обновляется раз в BLOAT_REFRESH_EVERY снимков
+BLOAT_REFRESH_EVERY = 30
+VACUUM_TOP_TABLES = 10
+
+# Список queryid собственных запросов коллектора (по метке) обновляется раз в MONITOR_QUERYID_REFRESH снимков
+MONITOR_QUERYID_REFRESH = 30
+
+# Разбор pg_stat_statements по queryid (доли форм запросов) раз в QUERY_MIX_SAMPLE_EVERY снимков
+QUERY_MIX_SAMPLE_EVERY = 1
+
+# Детектор аномалий: абсолютный минимум sigma по сигналу (в единицах метрики), чтобы на ряду без разброса
+# (0 IO Waits в простое) единичный всплеск не давал z ~ 1e9. Пока отклонение ни разу не было ненулевым,
+# события выдаются только после ANOMALY_MIN_SAMPLES тиков
+ANOMALY_SIGMA_FLOOR = {
+    "TPS": 1.0,
+    "Tx Cost (s)": 0.001,
+    "Active Sessions (ASH)": 0.1,
+    "IO Waits": 1.0,
+    "Max Latency (s)": 0.05,
+}
+ANOMALY_MIN_SAMPLES = 30
+
+# Движок классификации: "rules" - пороги ProfileAnalyzer, "model" - обученное дерево решений
+CLASSIFIER_ENGINE = "rules"
+CLASSIFIER_MODEL_PATH = "profile_model.npz"
+# Запись размеченных метрик на время измеряемой нагрузки бенчмарков для обучения модели
+RECORD_TRAINING_DATA = False
+TRAINING_DATA_PATH = "training_data.jsonl"
+
+# Локальное хранилище результатов бенчмарков (JSON с рядами progress) и HTML-отчетов
+RESULTS_DIR = "results"
+REPORTS_DIR = "reports"
+
+# Телеметрия контейнера БД во время бенчмарков (Docker SDK)
+RESOURCE_SAMPLE_INTERVAL = 1.0
+RESOURCE_PER_PROCESS = False
+
+# Распределенная нагрузка: число процессов pgbench и где они запускаются ("container", "exec", "local")
+LOAD_POOL_WORKERS = 4
+LOAD_POOL_PLACEMENT = "container"
+LOAD_POOL_READY_TIMEOUT = 60
+
+# Контрольные точки накопительных счетчиков для анализа произвольных окон времени
+SNAPSHOT_DB_PATH = "snapshots.sqlite"
+SNAPSHOT_CHECKPOINT_EVERY = 60
+SNAPSHOT_RETENTION_DAYS = 30
+
+# Максимальная пауза между попытками подключения GUI к БД, секунды
+CONNECT_RETRY_MAX = 30
+
+# Реплики кластера для совместной классификации с primary (DB_CONFIG): { имя: параметры подключения как в DB_CONFIG }
+REPLICA_CONFIGS = {}
+
 DB_CONFIG = {
     "dbname": "mydb",
     "user": "user",
     "password": "password",
     "host": "localhost",
-    "port": "5433"
+    "port": "5433",
+    # Недоступный хост не должен подвешивать запуск на системный таймаут TCP
+    "connect_timeout": 3
 }
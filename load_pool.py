@@ -0,0 +1,308 @@
+import os
+import math
+import time
+import uuid
+import base64
+import shlex
+import signal
+import threading
+import subprocess
+
+from open_loop import PROGRESS_RE, parse_open_loop_output
+
+# Гистограмма латентности: HIST_SUBBUCKETS корзин на каждую степень двойки (микросекунды), шаг ~19%
+HIST_SUBBUCKETS = 4
+HIST_MARKER = "--- vtb histogram"
+PERCENTILES = (50, 90, 95, 99, 99.9)
+
+# Латентности из лога транзакций pgbench (-l, третья колонка, мкс) сворачиваются в корзины прямо у воркера,
+# наружу уходит только гистограмма. Пропущенные (-L) транзакции в логе помечены "skipped".
+HIST_AWK = (
+    "awk '$3 ~ /^[0-9]+$/ && $3 > 0 { h[int(log($3) / log(2) * %d)]++ } "
+    "END { for (b in h) print \"hist\", b, h[b] }'" % HIST_SUBBUCKETS
+)
+
+
+class PgbenchWorkerPool:
+    """
+    N независимых процессов pgbench, стартующих одновременно:
+
+      placement="exec"      - docker exec в контейнер БД (как раньше, но несколько процессов);
+      placement="container" - отдельные контейнеры из образа БД в той же docker-сети,
+                              клиент не отнимает CPU у PostgreSQL;
+      placement="local"     - pgbench на хосте по DB_CONFIG.
+
+    Барьер: каждый воркер готовит скрипты, печатает "ready" и ждет строку на stdin;
+    когда готовы все, пул одновременно отправляет "go". pgbench стартует только по "go":
+    EOF на stdin (барьер прерван) до нагрузки не доводит. Перед запуском воркер печатает
+    "started <epoch>", по этим отметкам считается реальный разброс старта.
+    При любом сбое воркеры останавливаются там, где исполняются (docker rm -f / pkill / killpg).
+    Потоки progress и гистограммы латентности воркеров сводятся в один результат.
+    """
+
+    def __init__(self, db_config, container_name="vtb_postgres", workers=4, placement="container",
+                 ready_timeout=60, worker_cpus=None, log_sampling_rate=None):
+        if placement not in ("exec", "container", "local"):
+            raise ValueError(f"Unknown worker placement '{placement}'")
+        self.db_config = db_config
+        self.container_name = container_name
+        self.workers = max(int(workers), 1)
+        self.placement = placement
+        self.ready_timeout = ready_timeout
+        self.worker_cpus = worker_cpus
+        # Доля транзакций в логе для гистограммы; в режиме exec лог пишется на диск контейнера БД
+        self.log_sampling_rate = log_sampling_rate
+        self._network_name = None
+        self._image_name = None
+        # Метка прогона: имя лога транзакций воркеров, по ней же их находит pkill
+        self._tag = None
+
+    def run(self, scripts, duration, clients, threads, rate=None, progress_interval=5):
+        """
+        scripts - список (имя, текст, вес) или None для встроенного tpcb-like.
+        clients/threads/rate - на воркер. Возвращает сводный результат и результаты воркеров.
+        """
+        self._tag = f"vtb_load_{uuid.uuid4().hex[:8]}"
+        pgbench = self._pgbench_args(scripts, duration, clients, threads, rate, progress_interval)
+        if self.placement == "container":
+            # Контейнеры прерванного прошлого прогона заняли бы имена воркеров
+            self._remove_containers()
+        procs = []
+        try:
+            for i in range(self.workers):
+                procs.append(self._spawn(i, pgbench))
+            self._await_ready(procs)
+            for proc in procs:
+                proc.stdin.write("go\n")
+                proc.stdin.flush()
+
+            outputs = [None] * len(procs)
+            readers = [threading.Thread(target=_collect, args=(proc, outputs, i), daemon=True) for i, proc in enumerate(procs)]
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join()
+        except BaseException:
+            self._abort(procs)
+            raise
+
+        workers = [_parse_worker(i, out, err, proc.returncode) for i, (proc, (out, err)) in enumerate(zip(procs, outputs))]
+        failed = [w for w in workers if w["error"]]
+        if len(failed) == len(workers):
+            raise RuntimeError(f"All pgbench workers failed: {failed[0]['error']}")
+
+        merged = merge_workers([w for w in workers if not w["error"]], progress_interval)
+        started = [w["started"] for w in workers if w["started"] is not None]
+        merged["start_skew_ms"] = round((max(started) - min(started)) * 1000, 3) if len(started) == len(workers) else None
+        merged["failed_workers"] = len(failed)
+        merged["workers"] = workers
+        return merged
+
+    def _abort(self, procs):
+        """Барьер закрывается (EOF вместо "go"), затем воркеры убиваются там, где они исполняются"""
+        for proc in procs:
+            try:
+                proc.stdin.close()
+            except (OSError, ValueError):
+                pass
+        if self.placement == "container":
+            self._remove_containers()
+        elif self.placement == "exec":
+            # kill клиента docker не останавливает процесс внутри контейнера
+            subprocess.run(["docker", "exec", self.container_name, "pkill", "-f", self._tag], capture_output=True)
+        for proc in procs:
+            if self.placement == "local":
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            proc.kill()
+            proc.wait()
+
+    def _remove_containers(self):
+        names = [self._worker_name(i) for i in range(self.workers)]
+        subprocess.run(["docker", "rm", "-f"] + names, capture_output=True)
+
+    def _worker_name(self, index):
+        return f"{self.container_name}_load_{index}"
+
+    def _pgbench_args(self, scripts, duration, clients, threads, rate, progress_interval):
+        args = ["pgbench", "-T", str(duration), "-c", str(clients), "-j", str(min(threads, clients)),
+                "-P", str(progress_interval), "-l", f"--log-prefix={self._tag}"]
+        if rate:
+            args += ["-R", str(rate)]
+        if self.log_sampling_rate:
+            args += [f"--sampling-rate={self.log_sampling_rate}"]
+        if self.placement == "exec":
+            args += ["-U", self.db_config["user"], self.db_config["dbname"]]
+        else:
+            host, port = self._target()
+            args += ["-h", host, "-p", str(port), "-U", self.db_config["user"], self.db_config["dbname"]]
+
+        setup = []
+        for name, content, weight in scripts or []:
+            encoded = base64.b64encode(content.encode("utf-8")).decode()
+            setup.append(f"echo {encoded} | base64 -d > {shlex.quote(name)}")
+            args += ["-f", f"{name}@{weight}"]
+        return setup, args
+
+    def _target(self):
+        if self.placement == "container":
+            # Воркеры в сети контейнера БД ходят на его внутренний порт
+            return self.container_name, 5432
+        return self.db_config["host"], self.db_config["port"]
+
+    def _spawn(self, index, pgbench):
+        setup, args = pgbench
+        # Скрипты и лог транзакций живут во временном каталоге воркера, наружу - только итог и гистограмма.
+        # Подготовка идет до барьера, после "go" - только отметка времени и pgbench
+        body = " && ".join(["dir=$(mktemp -d)", "cd $dir"] + setup)
+        shell = (
+            f"{body} && echo ready && read go && [ \"$go\" = go ] && "
+            f"echo \"started $(date +%s.%N)\" && "
+            f"{' '.join(shlex.quote(a) for a in args)}; rc=$?; "
+            f"echo {shlex.quote(HIST_MARKER)}; cat {self._tag}.* 2>/dev/null | {HIST_AWK}; "
+            f"cd /; rm -rf $dir; exit $rc"
+        )
+
+        password = self.db_config.get("password", "")
+        if self.placement == "exec":
+            cmd = ["docker", "exec", "-i", self.container_name, "sh", "-c", shell]
+        elif self.placement == "container":
+            cmd = ["docker", "run", "--rm", "-i", "--name", self._worker_name(index),
+                   "--network", self._network(), "-e", f"PGPASSWORD={password}"]
+            if self.worker_cpus:
+                cmd += ["--cpus", str(self.worker_cpus)]
+            cmd += ["--entrypoint", "sh", self._image(), "-c", shell]
+        else:
+            cmd = ["env", f"PGPASSWORD={password}", "sh", "-c", shell]
+
+        # Отдельная группа процессов: при сбое local-воркер убивается вместе с pgbench
+        return subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                start_new_session=self.placement == "local")
+
+    def _await_ready(self, procs):
+        ready = [threading.Event() for _ in procs]
+        lines = [None] * len(procs)
+
+        def wait_line(i, proc, event):
+            lines[i] = proc.stdout.readline().strip()
+            event.set()
+
+        for i, (proc, event) in enumerate(zip(procs, ready)):
+            threading.Thread(target=wait_line, args=(i, proc, event), daemon=True).start()
+        deadline = time.monotonic() + self.ready_timeout
+        for i, event in enumerate(ready):
+            if not event.wait(max(deadline - time.monotonic(), 0)):
+                raise RuntimeError(f"Worker {i} not ready after {self.ready_timeout}s: timeout")
+            if lines[i] != "ready":
+                # Подготовка воркера упала до барьера: stdout закрыт, причина в stderr
+                procs[i].wait()
+                raise RuntimeError(f"Worker {i} failed before start: {procs[i].stderr.read().strip() or lines[i]}")
+
+    def _inspect(self, template):
+        res = subprocess.run(["docker", "inspect", "-f", template, self.container_name], capture_output=True, text=True)
+        if res.returncode != 0:
+            raise RuntimeError(f"docker inspect {self.container_name} failed: {res.stderr.strip()}")
+        return res.stdout.strip()
+
+    def _network(self):
+        if self._network_name is None:
+            self._network_name = self._inspect("{{range $k, $v := .NetworkSettings.Networks}}{{$k}} {{end}}").split()[0]
+        return self._network_name
+
+    def _image(self):
+        # Образ контейнера БД уже содержит pgbench нужной версии
+        if self._image_name is None:
+            self._image_name = self._inspect("{{.Config.Image}}")
+        return self._image_name
+
+
+def _collect(proc, outputs, index):
+    # communicate() сам закрывает stdin воркера после "go" и дочитывает stdout/stderr без взаимной блокировки
+    outputs[index] = proc.communicate()
+
+
+def _parse_worker(index, stdout, stderr, returncode):
+    summary, _, hist_text = stdout.partition(HIST_MARKER)
+    parsed = parse_open_loop_output(summary + "\n" + stderr)
+    histogram = parse_histogram(hist_text)
+    started = None
+    for line in summary.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] == "started":
+            try:
+                started = float(parts[1])
+            except ValueError:
+                pass
+
+    error = None
+    if returncode != 0 or parsed["tps"] <= 0:
+        lines = [l for l in stderr.splitlines() if l.strip() and not PROGRESS_RE.search(l)]
+        error = lines[-1].strip() if lines else f"exit code {returncode}"
+    return {"worker": index, "error": error, "started": started, "histogram": histogram, **parsed}
+
+
+def parse_histogram(text):
+    """Строки "hist <корзина> <число>" вывода HIST_AWK -> {корзина: число}"""
+    histogram = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 3 and parts[0] == "hist":
+            histogram[int(parts[1])] = histogram.get(int(parts[1]), 0) + int(parts[2])
+    return histogram
+
+
+def merge_workers(workers, progress_interval=5):
+    """Сводный результат: суммарный TPS, латентность взвешена по числу транзакций, общая гистограмма"""
+    processed = sum(w["processed"] for w in workers) or 1
+
+    # Воркеры стартовали одновременно, поэтому интервалы progress совпадают по времени
+    buckets = {}
+    for w in workers:
+        for p in w["progress"]:
+            slot = buckets.setdefault(round(p["time"] / progress_interval), {"tps": 0.0, "lat_w": 0.0, "lag_w": 0.0, "skipped": 0})
+            slot["tps"] += p["tps"]
+            slot["lat_w"] += p["latency"] * p["tps"]
+            slot["lag_w"] += p["lag"] * p["tps"]
+            slot["skipped"] += p["skipped"]
+    progress = [
+        {"time": float(slot_id * progress_interval), "tps": round(s["tps"], 1),
+         "latency": round(s["lat_w"] / s["tps"], 3) if s["tps"] else 0.0,
+         "lag": round(s["lag_w"] / s["tps"], 3) if s["tps"] else 0.0, "skipped": s["skipped"]}
+        for slot_id, s in sorted(buckets.items())
+    ]
+
+    histogram = {}
+    for w in workers:
+        for bucket, count in w["histogram"].items():
+            histogram[bucket] = histogram.get(bucket, 0) + count
+
+    return {
+        "tps": round(sum(w["tps"] for w in workers), 2),
+        "processed": sum(w["processed"] for w in workers),
+        "skipped": sum(w["skipped"] for w in workers),
+        "latency_avg": round(sum(w["latency_avg"] * w["processed"] for w in workers) / processed, 3),
+        "lag_avg": round(sum(w["lag_avg"] * w["processed"] for w in workers) / processed, 3),
+        "lag_max": max((w["lag_max"] for w in workers), default=0.0),
+        "progress": progress,
+        "histogram": {str(b): c for b, c in sorted(histogram.items())},
+        "percentiles_ms": histogram_percentiles(histogram),
+    }
+
+
+def histogram_percentiles(histogram, percentiles=PERCENTILES):
+    """Перцентили (мс) по верхней границе корзины: оценка сверху с точностью до шага корзины"""
+    total = sum(histogram.values())
+    if not total:
+        return {}
+    result, seen = {}, 0
+    targets = iter(sorted(percentiles))
+    target = next(targets)
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        while target is not None and seen >= total * target / 100.0:
+            result[f"p{target:g}"] = round(math.pow(2, (bucket + 1) / HIST_SUBBUCKETS) / 1000.0, 3)
+            target = next(targets, None)
+    result["max"] = round(math.pow(2, (max(histogram) + 1) / HIST_SUBBUCKETS) / 1000.0, 3)
+    return result
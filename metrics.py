@@ -1,10 +1,49 @@
 import psycopg2
 import time
+from collections import Counter
+from config import (
+    LOCK_SAMPLE_EVERY, LOCK_TOP_BLOCKERS, BLOAT_REFRESH_EVERY, VACUUM_TOP_TABLES, QUERY_MIX_SAMPLE_EVERY,
+    MONITOR_QUERYID_REFRESH
+)
+from query_mix import SHAPES, MONITOR_SHAPE, classify_query, sum_by_queryid
+
+# Метка запросов коллектора: по ней находим свои queryid в pg_stat_statements.
+# Сессии всех коллекторов (GUI, TrainingRecorder) подписаны application_name и исключаются из активности.
+MONITOR_TAG = "/* vtb_monitor */ "
+MONITOR_APP_NAME = "vtb_monitor"
 
 class MetricsCollector:
-    def __init__(self, config):
+    def __init__(self, config, lock_sample_every=LOCK_SAMPLE_EVERY, bloat_refresh_every=BLOAT_REFRESH_EVERY,
+                 query_mix_every=QUERY_MIX_SAMPLE_EVERY):
+        self.lock_sample_every = max(int(lock_sample_every), 1)
+        self.bloat_refresh_every = max(int(bloat_refresh_every), 1)
+        self.query_mix_every = max(int(query_mix_every), 1)
+        # Кэш разбора: форма запроса вычисляется один раз на queryid
+        self.query_shapes = {}
+        self._query_prev = None
+        self._query_mix = {shape: {"calls": 0.0, "time": 0.0, "rows": 0.0} for shape in SHAPES}
+        self.bloat = None
+        self._tick = 0
+        # Собственный счетчик снимков вакуума: период bloat не зависит от порядка инкремента _tick
+        self._vacuum_samples = 0
+        self._statements = 0
+        self._monitor_queryids = []
+        # Накопленные по дельтам queryid время и вызовы запросов коллектора
+        self._monitor_prev = {}
+        self._monitor_db_time = 0.0
+        self._monitor_calls = 0.0
+        self._cpu_time = 0.0
+        self._wall_time = 0.0
+        # Накопительный учет ожиданий Lock между снимками: сессия-секунды по числу ждущих в каждом снимке
+        # и число наблюдений по relation:mode в снимках блокировок
+        self._lock_wait_time = 0.0
+        self._lock_observed = 0
+        self._lock_by_relation_mode = Counter()
+        self._lock_prev = None
+        # Счетчики monitor.* и query_mix живут в процессе коллектора: метка его запуска отличает их сброс
+        self._started = time.time()
         try:
-            self.conn = psycopg2.connect(**config)
+            self.conn = psycopg2.connect(**{**config, "application_name": MONITOR_APP_NAME})
             self.conn.autocommit = True
             self._init_extensions()
         except Exception as e:
@@ -14,52 +53,103 @@ class MetricsCollector:
         """Пытаемся включить pg_stat_statements для точного учета времени"""
         with self.conn.cursor() as cur:
             try:
-                cur.execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements;")
+                self._execute(cur, "CREATE EXTENSION IF NOT EXISTS pg_stat_statements;")
             except psycopg2.Error:
                 pass
 
+    def _execute(self, cur, sql, params=None):
+        """Все запросы коллектора идут с меткой и считаются: каждый в autocommit - это еще один xact_commit"""
+        self._statements += 1
+        cur.execute(MONITOR_TAG + sql, params)
+
     def get_snapshot(self):
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+
         with self.conn.cursor() as cur:
-            cur.execute("SELECT sum(xact_commit), sum(xact_rollback) FROM pg_stat_database")
+            monitor_statements = self._statements
+            self._execute(cur, """
+                SELECT sum(xact_commit), sum(xact_rollback),
+                       extract(epoch from pg_postmaster_start_time()), extract(epoch from max(stats_reset))
+                FROM pg_stat_database
+            """)
             row = cur.fetchone()
             commits = float(row[0] or 0)
             rollbacks = float(row[1] or 0)
+            # Метки настоящих сбросов счетчиков: по ним SnapshotStore отличает сброс от вытеснения/удаления
+            resets = {
+                "postmaster_start": float(row[2]) if row[2] is not None else None,
+                "db_stats_reset": float(row[3]) if row[3] is not None else None,
+                "statements_reset": None,
+                "statements_dealloc": None,
+                "collector_started": self._started,
+            }
 
             db_time_accumulated = 0.0
             try:
-                cur.execute("SELECT sum(total_exec_time) FROM pg_stat_statements")
+                if self._tick % MONITOR_QUERYID_REFRESH == 1:
+                    self._execute(cur, "SELECT coalesce(array_agg(queryid), '{}') FROM pg_stat_statements WHERE query LIKE %s",
+                                  (MONITOR_TAG.strip() + "%",))
+                    self._monitor_queryids = list(cur.fetchone()[0])
+                self._execute(cur, "SELECT sum(total_exec_time) FROM pg_stat_statements(false)")
                 res = cur.fetchone()
                 if res and res[0]:
                     db_time_accumulated = float(res[0]) / 1000.0
+                self._sample_monitor_time(cur)
             except psycopg2.Error:
                 self.conn.rollback()
                 db_time_accumulated = 0.0
+            try:
+                # pg_stat_statements_info есть с PostgreSQL 14
+                self._execute(cur, "SELECT dealloc, extract(epoch from stats_reset) FROM pg_stat_statements_info")
+                info = cur.fetchone()
+                if info:
+                    resets["statements_dealloc"] = float(info[0])
+                    resets["statements_reset"] = float(info[1]) if info[1] is not None else None
+            except psycopg2.Error:
+                self.conn.rollback()
 
-            cur.execute("SELECT count(*) FROM pg_stat_activity WHERE state = 'active' AND pid <> pg_backend_pid()")
+            self._execute(cur, "SELECT count(*) FROM pg_stat_activity WHERE state = 'active' AND application_name <> %s",
+                          (MONITOR_APP_NAME,))
             active_sessions = int(cur.fetchone()[0])
 
-            cur.execute("SELECT sum(tup_inserted), sum(tup_fetched), sum(tup_updated), sum(tup_deleted) FROM pg_stat_database")
+            self._execute(cur, "SELECT sum(tup_inserted), sum(tup_fetched), sum(tup_updated), sum(tup_deleted) FROM pg_stat_database")
             row = cur.fetchone()
             tup_inserted = float(row[0] or 0)
             tup_fetched = float(row[1] or 0)
             tup_updated = float(row[2] or 0)
             tup_deleted = float(row[3] or 0) 
 
-            cur.execute("""
+            self._execute(cur, """
                 SELECT wait_event_type, count(*)
                 FROM pg_stat_activity
-                WHERE state = 'active'
+                WHERE state = 'active' AND application_name <> %s
                 GROUP BY wait_event_type
-            """)
+            """, (MONITOR_APP_NAME,))
             waits = dict(cur.fetchall())
+            self._accumulate_lock_waits(waits.get("Lock", 0))
 
-            cur.execute("""
+            self._execute(cur, """
                 SELECT coalesce(max(extract(epoch from (now() - query_start))), 0)
                 FROM pg_stat_activity
-                WHERE state = 'active' AND pid <> pg_backend_pid()
-            """)
+                WHERE state = 'active' AND application_name <> %s
+            """, (MONITOR_APP_NAME,))
             max_duration = cur.fetchone()[0]
 
+            locks = None
+            if self._tick % self.lock_sample_every == 0:
+                locks = self._sample_locks(cur)
+                self._lock_observed += locks["waiting"]
+                self._lock_by_relation_mode.update(locks["by_relation_mode"])
+            if self._tick % self.query_mix_every == 0:
+                self._sample_query_mix(cur)
+            self._tick += 1
+
+            replication = self._sample_replication(cur)
+            vacuum = self._sample_vacuum(cur)
+
+        self._wall_time += time.perf_counter() - wall_start
+        self._cpu_time += time.process_time() - cpu_start
+
         return {
             "time": time.time(),
             "commits": commits,
@@ -71,5 +161,303 @@ class MetricsCollector:
             "tup_fetched": tup_fetched,
             "tup_updated": tup_updated,
             "tup_deleted": tup_deleted,
-            "max_duration": float(max_duration or 0)
+            "max_duration": float(max_duration or 0),
+            "locks": locks,
+            "lock_waits": {
+                "session_seconds": self._lock_wait_time,
+                "observed": float(self._lock_observed),
+                "by_relation_mode": dict(self._lock_by_relation_mode)
+            },
+            "replication": replication,
+            "vacuum": vacuum,
+            "query_mix": {shape: dict(totals) for shape, totals in self._query_mix.items()},
+            "resets": resets,
+            "monitor": {
+                "statements": float(monitor_statements),
+                "db_time": self._monitor_db_time,
+                "calls": self._monitor_calls,
+                "cpu_time": self._cpu_time,
+                "wall_time": self._wall_time
+            }
+        }
+
+    def _accumulate_lock_waits(self, waiting):
+        """Интеграл числа ждущих Lock по времени (трапеции между снимками): разность / длина окна = среднее"""
+        now = time.time()
+        if self._lock_prev is not None:
+            prev_time, prev_waiting = self._lock_prev
+            self._lock_wait_time += (prev_waiting + waiting) / 2 * max(now - prev_time, 0.0)
+        self._lock_prev = (now, waiting)
+
+    def _sample_monitor_time(self, cur):
+        """
+        Время и вызовы запросов с меткой коллектора (всех процессов-коллекторов) по дельтам каждого queryid.
+        Счетчики pg_stat_statements накопительные: queryid, впервые попавший в список
+        при его обновлении, только запоминает базу, иначе в интервал попала бы вся его история.
+        """
+        self._execute(cur, """
+            SELECT queryid, sum(calls), sum(total_exec_time)
+            FROM pg_stat_statements(false) WHERE queryid = ANY(%s)
+            GROUP BY queryid
+        """, (self._monitor_queryids,))
+        current = sum_by_queryid(cur.fetchall())
+        for queryid in current:
+            prev = self._monitor_prev.get(queryid)
+            if prev is None:
+                continue
+            if current[queryid][0] < prev[0]:
+                prev = (0.0, 0.0)
+            self._monitor_calls += current[queryid][0] - prev[0]
+            self._monitor_db_time += max(current[queryid][1] - prev[1], 0.0) / 1000.0
+        self._monitor_prev = current
+
+    def _sample_query_mix(self, cur):
+        """
+        Накапливает calls/время/строки по формам запросов из дельт pg_stat_statements по queryid.
+        Тексты читаются только для новых queryid; счетчики по формам монотонны, так что
+        вытеснение записей pg_stat_statements и его сброс не дают отрицательных долей.
+        """
+        try:
+            self._execute(cur, """
+                SELECT queryid, sum(calls), sum(total_exec_time), sum(rows)
+                FROM pg_stat_statements(false) WHERE queryid IS NOT NULL
+                GROUP BY queryid
+            """)
+            current = sum_by_queryid(cur.fetchall())
+            unknown = [q for q in current if q not in self.query_shapes]
+            if unknown:
+                self._execute(cur, "SELECT queryid, query FROM pg_stat_statements(true) WHERE queryid = ANY(%s)", (unknown,))
+                for queryid, text in cur.fetchall():
+                    tagged = (text or "").startswith(MONITOR_TAG.strip())
+                    self.query_shapes[queryid] = MONITOR_SHAPE if tagged else classify_query(text)
+                for queryid in unknown:
+                    # Текст мог быть уже вытеснен из файла pg_stat_statements
+                    self.query_shapes.setdefault(queryid, "other")
+        except psycopg2.Error:
+            self.conn.rollback()
+            return
+
+        for queryid in current:
+            shape = self.query_shapes.get(queryid)
+            # Первый опрос только запоминает базу: накопленное до старта коллектора не относится к интервалу
+            if self._query_prev is None or shape in (None, MONITOR_SHAPE):
+                continue
+            prev = self._query_prev.get(queryid, (0.0, 0.0, 0.0))
+            if current[queryid][0] < prev[0]:
+                prev = (0.0, 0.0, 0.0)
+            totals = self._query_mix[shape]
+            totals["calls"] += current[queryid][0] - prev[0]
+            totals["time"] += max(current[queryid][1] - prev[1], 0.0) / 1000.0
+            totals["rows"] += max(current[queryid][2] - prev[2], 0.0)
+        self._query_prev = current
+
+        if len(self.query_shapes) > 2 * max(len(current), 1000):
+            self.query_shapes = {q: s for q, s in self.query_shapes.items() if q in current}
+
+    def _sample_vacuum(self, cur):
+        """
+        Мертвые кортежи и активность (авто)вакуума. Суммы по pg_stat_user_tables берутся каждый снимок,
+        по таблицам - только top-N по мертвым кортежам, оценка bloat - раз в bloat_refresh_every снимков.
+        """
+        self._execute(cur, """
+            SELECT coalesce(sum(n_dead_tup), 0), coalesce(sum(n_mod_since_analyze), 0),
+                   coalesce(sum(autovacuum_count), 0), coalesce(sum(autoanalyze_count), 0),
+                   coalesce(sum(vacuum_count), 0), coalesce(sum(analyze_count), 0)
+            FROM pg_stat_user_tables
+        """)
+        row = cur.fetchone()
+
+        self._execute(cur, """
+            SELECT relname, n_live_tup, n_dead_tup, n_mod_since_analyze,
+                   coalesce(extract(epoch from (now() - greatest(last_autovacuum, last_vacuum))), -1)
+            FROM pg_stat_user_tables
+            WHERE n_dead_tup > 0
+            ORDER BY n_dead_tup DESC
+            LIMIT %s
+        """, (VACUUM_TOP_TABLES,))
+        top_dead = [
+            {"table": r[0], "live": int(r[1]), "dead": int(r[2]), "mod_since_analyze": int(r[3]),
+             "since_vacuum_s": round(float(r[4]), 1)}
+            for r in cur.fetchall()
+        ]
+
+        self._execute(cur, """
+            SELECT coalesce(c.relname, p.relid::text), p.phase,
+                   CASE WHEN p.heap_blks_total > 0 THEN round(100.0 * p.heap_blks_scanned / p.heap_blks_total, 1) ELSE 0 END,
+                   a.backend_type = 'autovacuum worker'
+            FROM pg_stat_progress_vacuum p
+            LEFT JOIN pg_class c ON c.oid = p.relid
+            LEFT JOIN pg_stat_activity a ON a.pid = p.pid
+        """)
+        in_progress = [
+            {"table": r[0], "phase": r[1], "scanned_pct": float(r[2]), "auto": bool(r[3])}
+            for r in cur.fetchall()
+        ]
+
+        self._execute(cur, "SELECT count(*) FROM pg_stat_activity WHERE backend_type = 'autovacuum worker'")
+        autovacuum_workers = int(cur.fetchone()[0])
+
+        if self._vacuum_samples % self.bloat_refresh_every == 0:
+            self.bloat = self._estimate_bloat(cur)
+        self._vacuum_samples += 1
+
+        return {
+            "dead_tuples": float(row[0]),
+            "mod_since_analyze": float(row[1]),
+            "autovacuum_count": float(row[2]),
+            "autoanalyze_count": float(row[3]),
+            "vacuum_count": float(row[4]),
+            "analyze_count": float(row[5]),
+            "autovacuum_workers": autovacuum_workers,
+            "in_progress": in_progress,
+            "top_dead": top_dead,
+            "bloat": self.bloat
+        }
+
+    def _estimate_bloat(self, cur):
+        """Грубая оценка bloat: фактические страницы против ожидаемых по reltuples и средней ширине строки"""
+        self._execute(cur, """
+            SELECT c.relname, c.relpages,
+                   ceil(c.reltuples * (24 + 4 + coalesce(w.width, 0)) / (current_setting('block_size')::numeric * 0.9))
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            LEFT JOIN (
+                SELECT schemaname, tablename, sum(avg_width) AS width
+                FROM pg_stats GROUP BY schemaname, tablename
+            ) w ON w.schemaname = n.nspname AND w.tablename = c.relname
+            WHERE c.relkind = 'r' AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+              AND c.relpages > 128 AND c.reltuples > 0
+            ORDER BY c.relpages DESC
+            LIMIT %s
+        """, (VACUUM_TOP_TABLES,))
+        result = []
+        for relname, pages, expected in cur.fetchall():
+            expected = float(expected or 0)
+            bloat_pct = max(0.0, 100.0 * (pages - expected) / pages) if pages else 0.0
+            result.append({"table": relname, "pages": int(pages), "bloat_pct": round(bloat_pct, 1)})
+        return result
+
+    def _sample_replication(self, cur):
+        """
+        Роль узла и отставание реплик. На primary - pg_stat_replication по каждой реплике
+        (write/flush/replay в байтах и секундах), на standby - pg_stat_wal_receiver и отставание replay.
+        """
+        self._execute(cur, "SELECT pg_is_in_recovery()")
+        in_recovery = bool(cur.fetchone()[0])
+
+        if not in_recovery:
+            self._execute(cur, """
+                SELECT application_name, coalesce(host(client_addr), 'local'), state, sync_state,
+                       coalesce(pg_wal_lsn_diff(pg_current_wal_lsn(), write_lsn), 0),
+                       coalesce(pg_wal_lsn_diff(pg_current_wal_lsn(), flush_lsn), 0),
+                       coalesce(pg_wal_lsn_diff(pg_current_wal_lsn(), replay_lsn), 0),
+                       coalesce(extract(epoch from write_lag), 0),
+                       coalesce(extract(epoch from flush_lag), 0),
+                       coalesce(extract(epoch from replay_lag), 0)
+                FROM pg_stat_replication
+            """)
+            standbys = [
+                {
+                    "name": row[0], "addr": row[1], "state": row[2], "sync_state": row[3],
+                    "write_lag_bytes": float(row[4]), "flush_lag_bytes": float(row[5]), "replay_lag_bytes": float(row[6]),
+                    "write_lag_s": float(row[7]), "flush_lag_s": float(row[8]), "replay_lag_s": float(row[9])
+                }
+                for row in cur.fetchall()
+            ]
+            self._execute(cur, "SELECT current_setting('synchronous_standby_names'), current_setting('wal_level')")
+            sync_names, wal_level = cur.fetchone()
+            return {
+                "role": "primary",
+                "standbys": standbys,
+                "synchronous_standby_names": sync_names,
+                "wal_level": wal_level
+            }
+
+        self._execute(cur, """
+            SELECT status, sender_host, sender_port,
+                   coalesce(extract(epoch from (now() - last_msg_receipt_time)), 0)
+            FROM pg_stat_wal_receiver
+        """)
+        row = cur.fetchone()
+        self._execute(cur, """
+            SELECT coalesce(pg_wal_lsn_diff(pg_last_wal_receive_lsn(), pg_last_wal_replay_lsn()), 0),
+                   coalesce(extract(epoch from (now() - pg_last_xact_replay_timestamp())), 0)
+        """)
+        replay_bytes, replay_age = cur.fetchone()
+        return {
+            "role": "standby",
+            "receiver": {
+                "status": row[0], "sender": f"{row[1]}:{row[2]}", "last_msg_age_s": float(row[3])
+            } if row else None,
+            "replay_lag_bytes": float(replay_bytes),
+            "replay_lag_s": float(replay_age)
         }
+
+    def _sample_locks(self, cur):
+        """
+        Снимок ожиданий блокировок: pg_blocking_pids() вызывается только для
+        сессий, которые сейчас ждут Lock, поэтому в спокойной базе запрос почти бесплатный.
+        """
+        self._execute(cur, """
+            SELECT a.pid, pg_blocking_pids(a.pid), l.mode, coalesce(c.relname, l.locktype, 'unknown')
+            FROM pg_stat_activity a
+            LEFT JOIN pg_locks l ON l.pid = a.pid AND NOT l.granted
+            LEFT JOIN pg_class c ON c.oid = l.relation
+            WHERE a.wait_event_type = 'Lock' AND a.application_name <> %s
+        """, (MONITOR_APP_NAME,))
+        rows = cur.fetchall()
+
+        by_relation_mode = Counter()
+        blocked_by = {}
+        for pid, blockers, mode, relation in rows:
+            by_relation_mode[f"{relation}:{mode or 'unknown'}"] += 1
+            blocked_by[pid] = list(blockers or [])
+
+        # Сколько сессий (прямо или по цепочке) ждут каждого блокирующего: корень цепочки получает всех
+        victims = Counter()
+        for pid in blocked_by:
+            for blocker in self._upstream(pid, blocked_by):
+                victims[blocker] += 1
+
+        depth = 0
+        for pid in blocked_by:
+            depth = max(depth, self._chain_depth(pid, blocked_by, set()))
+
+        top = victims.most_common(LOCK_TOP_BLOCKERS)
+        blockers = []
+        if top:
+            self._execute(cur, """
+                SELECT pid, state, coalesce(extract(epoch from (now() - xact_start)), 0), left(query, 120)
+                FROM pg_stat_activity WHERE pid = ANY(%s)
+            """, ([pid for pid, _ in top],))
+            info = {row[0]: row[1:] for row in cur.fetchall()}
+            for pid, count in top:
+                state, xact_age, query = info.get(pid, (None, 0, ""))
+                blockers.append({
+                    "pid": pid, "blocked": count, "state": state,
+                    "xact_age": round(float(xact_age or 0), 2), "query": query
+                })
+
+        return {
+            "waiting": len(blocked_by),
+            "by_relation_mode": dict(by_relation_mode),
+            "blockers": blockers,
+            "chain_depth": depth
+        }
+
+    def _upstream(self, pid, blocked_by):
+        """Все сессии, которых pid ждет напрямую или через другие ожидающие сессии"""
+        seen, stack = set(), list(blocked_by.get(pid, []))
+        while stack:
+            blocker = stack.pop()
+            if blocker in seen or blocker == pid:
+                continue
+            seen.add(blocker)
+            stack.extend(blocked_by.get(blocker, []))
+        return seen
+
+    def _chain_depth(self, pid, blocked_by, seen):
+        if pid in seen or pid not in blocked_by:
+            return 0
+        seen.add(pid)
+        return 1 + max((self._chain_depth(b, blocked_by, seen) for b in blocked_by[pid]), default=0)
@@ -0,0 +1,258 @@
+import io
+import math
+import random
+import bisect
+import hashlib
+import json
+from datetime import date, timedelta
+from multiprocessing import Pool
+import psycopg2
+
+# ~100 байт на строку факта вместе с заголовком кортежа
+FACT_ROWS_PER_GB = 10_000_000
+COPY_BATCH_ROWS = 50_000
+ZIPF_MAX_RANKS = 1_000_000
+START_DATE = date(2020, 1, 1)
+DAYS = 5 * 365
+
+SCHEMA_SQL = """
+DROP TABLE IF EXISTS fact_sales, dim_customer, dim_product, dim_store, dim_date CASCADE;
+
+CREATE TABLE dim_date (
+    date_id DATE PRIMARY KEY,
+    year INT, quarter INT, month INT, day_of_week INT
+);
+CREATE TABLE dim_customer (
+    customer_id INT PRIMARY KEY,
+    segment VARCHAR(16), region VARCHAR(16), signup_date DATE
+);
+CREATE TABLE dim_product (
+    product_id INT PRIMARY KEY,
+    category VARCHAR(16), brand VARCHAR(16), price NUMERIC(10, 2)
+);
+CREATE TABLE dim_store (
+    store_id INT PRIMARY KEY,
+    city VARCHAR(16), format VARCHAR(16)
+);
+"""
+
+FACT_SQL = """
+CREATE TABLE fact_sales (
+    sale_id BIGINT,
+    sale_date DATE NOT NULL,
+    customer_id INT,
+    product_id INT,
+    store_id INT,
+    quantity INT,
+    amount NUMERIC(12, 2),
+    discount NUMERIC(4, 2)
+){partition_clause};
+"""
+
+META_SQL = """
+CREATE TABLE IF NOT EXISTS olap_dataset_meta (
+    dataset VARCHAR(32) PRIMARY KEY,
+    signature VARCHAR(64),
+    fact_rows BIGINT,
+    created_at TIMESTAMP DEFAULT now()
+);
+"""
+
+SEGMENTS = ["retail", "sme", "corporate", "private", "vip"]
+REGIONS = ["moscow", "spb", "kazan", "novosib", "ekb", "sochi", "omsk", "perm"]
+CATEGORIES = ["food", "tech", "home", "sport", "books", "fashion", "auto", "toys"]
+FORMATS = ["hyper", "super", "mini", "online"]
+
+
+class ZipfSampler:
+    """
+    Сэмплер Zipf по рангам 1..n через предпосчитанную CDF и бинарный поиск.
+    Ранг переводится в ключ перестановкой, чтобы горячие ключи не шли подряд.
+    """
+
+    def __init__(self, n, s=1.1, rng=None):
+        self.n = n
+        self.rng = rng or random.Random()
+        ranks = min(n, ZIPF_MAX_RANKS)
+        weights = [1.0 / math.pow(k, s) for k in range(1, ranks + 1)]
+        total = sum(weights)
+        acc, self.cdf = 0.0, []
+        for w in weights:
+            acc += w / total
+            self.cdf.append(acc)
+        # Хвост за пределами ZIPF_MAX_RANKS растягиваем равномерно
+        self.bucket = n / ranks
+        self.stride = _coprime_stride(n)
+
+    def sample(self):
+        rank = bisect.bisect_left(self.cdf, self.rng.random())
+        rank = min(rank, len(self.cdf) - 1)
+        key = int(rank * self.bucket + self.rng.random() * self.bucket) if self.bucket > 1 else rank
+        return (key * self.stride) % self.n + 1
+
+
+def _coprime_stride(n):
+    stride = 2654435761 % n if n > 1 else 1
+    while math.gcd(stride, n) != 1:
+        stride += 1
+    return stride
+
+
+class StarSchemaGenerator:
+    """
+    Генератор звездной схемы (fact_sales + 4 измерения) заданного объема.
+    Факт грузится параллельными COPY-потоками, опционально с RANGE-партициями по месяцам.
+    Повторная генерация пропускается, если в olap_dataset_meta уже лежит набор с той же сигнатурой.
+    """
+
+    def __init__(self, db_config, scale_gb=1, skew=1.1, partitioned=True, streams=4, seed=42):
+        if not 1 <= scale_gb <= 100:
+            raise ValueError("scale_gb must be between 1 and 100")
+        self.db_config = db_config
+        self.scale_gb = scale_gb
+        self.skew = skew
+        self.partitioned = partitioned
+        self.streams = max(int(streams), 1)
+        self.seed = seed
+
+        self.fact_rows = int(scale_gb * FACT_ROWS_PER_GB)
+        self.customers = max(1000, min(self.fact_rows // 100, 10_000_000))
+        self.products = max(1000, min(self.fact_rows // 1000, 1_000_000))
+        self.stores = 200
+
+    @property
+    def signature(self):
+        params = {
+            "fact_rows": self.fact_rows, "customers": self.customers, "products": self.products,
+            "stores": self.stores, "skew": self.skew, "partitioned": self.partitioned, "seed": self.seed
+        }
+        return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def ensure_dataset(self):
+        """Генерирует набор, если его нет или он собран с другими параметрами. Возвращает True, если генерация была."""
+        conn = psycopg2.connect(**self.db_config)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute(META_SQL)
+                cur.execute("SELECT signature FROM olap_dataset_meta WHERE dataset = 'star'")
+                row = cur.fetchone()
+                if row and row[0] == self.signature and self._fact_exists(cur):
+                    print(f" Star schema {self.scale_gb}GB already loaded, skipping generation")
+                    return False
+
+                print(f" Generating star schema: {self.fact_rows} fact rows ({self.scale_gb}GB), {self.streams} streams...")
+                cur.execute("DELETE FROM olap_dataset_meta WHERE dataset = 'star'")
+                cur.execute(SCHEMA_SQL)
+                cur.execute(FACT_SQL.format(partition_clause=" PARTITION BY RANGE (sale_date)" if self.partitioned else ""))
+                if self.partitioned:
+                    self._create_partitions(cur)
+                self._load_dimensions(conn)
+        finally:
+            conn.close()
+
+        chunk = math.ceil(self.fact_rows / self.streams)
+        tasks = [
+            (self.db_config, i * chunk, min((i + 1) * chunk, self.fact_rows),
+             self.customers, self.products, self.stores, self.skew, self.seed + i)
+            for i in range(self.streams) if i * chunk < self.fact_rows
+        ]
+        with Pool(processes=len(tasks)) as pool:
+            pool.starmap(_copy_fact_chunk, tasks)
+
+        self._finalize()
+        return True
+
+    def _fact_exists(self, cur):
+        cur.execute("SELECT to_regclass('public.fact_sales')")
+        return cur.fetchone()[0] is not None
+
+    def _create_partitions(self, cur):
+        month = date(START_DATE.year, START_DATE.month, 1)
+        end = START_DATE + timedelta(days=DAYS)
+        while month <= end:
+            nxt = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+            cur.execute(
+                f"CREATE TABLE fact_sales_{month:%Y_%m} PARTITION OF fact_sales "
+                f"FOR VALUES FROM ('{month}') TO ('{nxt}')"
+            )
+            month = nxt
+
+    def _load_dimensions(self, conn):
+        rng = random.Random(self.seed)
+        with conn.cursor() as cur:
+            _copy_rows(cur, "dim_date", (
+                (d, d.year, (d.month - 1) // 3 + 1, d.month, d.isoweekday())
+                for d in (START_DATE + timedelta(days=i) for i in range(DAYS + 1))
+            ))
+            _copy_rows(cur, "dim_customer", (
+                (i, rng.choice(SEGMENTS), rng.choice(REGIONS), START_DATE - timedelta(days=rng.randint(0, 3650)))
+                for i in range(1, self.customers + 1)
+            ))
+            _copy_rows(cur, "dim_product", (
+                (i, rng.choice(CATEGORIES), f"brand_{rng.randint(1, 500)}", round(rng.uniform(1, 5000), 2))
+                for i in range(1, self.products + 1)
+            ))
+            _copy_rows(cur, "dim_store", (
+                (i, rng.choice(REGIONS), rng.choice(FORMATS)) for i in range(1, self.stores + 1)
+            ))
+
+    def _finalize(self):
+        conn = psycopg2.connect(**self.db_config)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("CREATE INDEX ON fact_sales (customer_id)")
+                cur.execute("CREATE INDEX ON fact_sales (product_id)")
+                cur.execute("ANALYZE fact_sales, dim_customer, dim_product, dim_store, dim_date")
+                cur.execute(
+                    "INSERT INTO olap_dataset_meta (dataset, signature, fact_rows) VALUES ('star', %s, %s)",
+                    (self.signature, self.fact_rows)
+                )
+        finally:
+            conn.close()
+
+
+def _copy_rows(cur, table, rows):
+    buf = io.StringIO()
+    count = 0
+    for row in rows:
+        buf.write(",".join(str(v) for v in row))
+        buf.write("\n")
+        count += 1
+        if count % COPY_BATCH_ROWS == 0:
+            buf.seek(0)
+            cur.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT csv)", buf)
+            buf = io.StringIO()
+    if buf.tell():
+        buf.seek(0)
+        cur.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT csv)", buf)
+
+
+def _copy_fact_chunk(db_config, start_id, end_id, customers, products, stores, skew, seed):
+    """Один COPY-поток: генерирует строки факта [start_id, end_id) со смещенным распределением ключей"""
+    rng = random.Random(seed)
+    customer_zipf = ZipfSampler(customers, skew, rng)
+    product_zipf = ZipfSampler(products, skew, rng)
+
+    def rows():
+        for sale_id in range(start_id + 1, end_id + 1):
+            qty = rng.randint(1, 10)
+            yield (
+                sale_id,
+                START_DATE + timedelta(days=rng.randint(0, DAYS)),
+                customer_zipf.sample(),
+                product_zipf.sample(),
+                rng.randint(1, stores),
+                qty,
+                round(qty * rng.uniform(1, 500), 2),
+                round(rng.choice((0, 0, 0, 0.05, 0.1, 0.2)), 2),
+            )
+
+    conn = psycopg2.connect(**db_config)
+    try:
+        with conn.cursor() as cur:
+            _copy_rows(cur, "fact_sales", rows())
+        conn.commit()
+    finally:
+        conn.close()
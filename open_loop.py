@@ -0,0 +1,136 @@
+import math
+import re
+
+PROGRESS_RE = re.compile(
+    r"progress:\s*([\d.]+)\s*s,\s*([\d.]+)\s*tps,\s*lat\s*([\d.]+)\s*ms\s*stddev\s*([\d.naN]+)"
+    r"(?:,\s*(?:\d+\s*failed,\s*)?lag\s*([\d.]+)\s*ms)?(?:,\s*(\d+)\s*skipped)?"
+)
+LAG_RE = re.compile(r"rate limit schedule lag:\s*avg\s*([\d.]+)\s*\(max\s*([\d.]+)\)\s*ms")
+SKIPPED_RE = re.compile(r"number of transactions skipped:\s*(\d+)")
+LATE_RE = re.compile(r"number of transactions above the\s*([\d.]+)\s*ms latency limit:\s*(\d+)")
+PROCESSED_RE = re.compile(r"number of transactions actually processed:\s*(\d+)")
+LATENCY_RE = re.compile(r"latency average\s*=\s*([\d.]+)\s*ms")
+STDDEV_RE = re.compile(r"latency stddev\s*=\s*([\d.]+)\s*ms")
+TPS_RE = re.compile(r"tps\s*=\s*([\d.]+)")
+
+
+class RateSchedule:
+    """
+    План интенсивности для open-loop нагрузки: список сегментов (секунды, tx/s).
+    Каждый сегмент исполняется отдельным запуском pgbench -R, поэтому очередь
+    неуспевших транзакций на границе сегментов не переносится.
+    """
+
+    def __init__(self, segments):
+        segments = [(int(sec), float(rate)) for sec, rate in segments if sec > 0]
+        if not segments or any(rate <= 0 for _, rate in segments):
+            raise ValueError("Rate schedule needs at least one segment with positive rate")
+        self.segments = segments
+
+    @property
+    def duration(self):
+        return sum(sec for sec, _ in self.segments)
+
+    @classmethod
+    def constant(cls, rate, duration):
+        return cls([(duration, rate)])
+
+    @classmethod
+    def step(cls, rates, step_seconds):
+        return cls([(step_seconds, rate) for rate in rates])
+
+    @classmethod
+    def ramp(cls, start_rate, end_rate, duration, steps=5):
+        steps = max(int(steps), 1)
+        seconds = max(duration // steps, 1)
+        # Остаток деления достается последней ступени: суммарная длительность равна duration
+        last = max(duration - seconds * (steps - 1), 1)
+        if steps == 1:
+            return cls([(last, end_rate)])
+        return cls([
+            (last if i == steps - 1 else seconds, start_rate + (end_rate - start_rate) * i / (steps - 1))
+            for i in range(steps)
+        ])
+
+    @classmethod
+    def sine(cls, base_rate, amplitude, period, duration, steps_per_period=8):
+        seconds = max(period // steps_per_period, 1)
+        count = max(duration // seconds, 1)
+        return cls([
+            (seconds, max(base_rate + amplitude * math.sin(2 * math.pi * (i + 0.5) * seconds / period), 1.0))
+            for i in range(count)
+        ])
+
+    @classmethod
+    def utilisation(cls, capacity_tps, levels=(0.5, 0.7, 0.8, 0.9), step_seconds=30):
+        """Ступени в долях от измеренной closed-loop пропускной способности"""
+        return cls.step([capacity_tps * level for level in levels], step_seconds)
+
+
+def parse_open_loop_output(output):
+    """
+    Разбирает вывод pgbench -R [-L]. Латентность pgbench в этом режиме считает
+    от запланированного момента старта, поэтому очередь перед сервером в нее входит.
+    """
+    result = {
+        "tps": 0.0, "latency_avg": 0.0, "latency_stddev": 0.0,
+        "lag_avg": 0.0, "lag_max": 0.0,
+        "processed": 0, "skipped": 0, "late": 0, "latency_limit": None,
+        "progress": [],
+    }
+
+    for line in output.splitlines():
+        match = PROGRESS_RE.search(line)
+        if match:
+            result["progress"].append({
+                "time": float(match.group(1)),
+                "tps": float(match.group(2)),
+                "latency": float(match.group(3)),
+                "lag": float(match.group(5) or 0.0),
+                "skipped": int(match.group(6) or 0),
+            })
+            continue
+
+        for key, regex in (("latency_avg", LATENCY_RE), ("latency_stddev", STDDEV_RE)):
+            match = regex.search(line)
+            if match:
+                result[key] = float(match.group(1))
+        if "tps =" in line:
+            match = TPS_RE.search(line)
+            if match:
+                result["tps"] = float(match.group(1))
+
+        match = LAG_RE.search(line)
+        if match:
+            result["lag_avg"], result["lag_max"] = float(match.group(1)), float(match.group(2))
+        match = SKIPPED_RE.search(line)
+        if match:
+            result["skipped"] = int(match.group(1))
+        match = LATE_RE.search(line)
+        if match:
+            result["latency_limit"], result["late"] = float(match.group(1)), int(match.group(2))
+        match = PROCESSED_RE.search(line)
+        if match:
+            result["processed"] = int(match.group(1))
+
+    return result
+
+
+def merge_segments(segments):
+    """Сводит результаты сегментов расписания в один итог (средние взвешены по числу транзакций)"""
+    processed = sum(s["processed"] for s in segments)
+    weight = processed or 1
+    scheduled = processed + sum(s["skipped"] for s in segments)
+    return {
+        "processed": processed,
+        "skipped": sum(s["skipped"] for s in segments),
+        "late": sum(s["late"] for s in segments),
+        "skipped_pct": round(100.0 * sum(s["skipped"] for s in segments) / scheduled, 2) if scheduled else 0.0,
+        "late_pct": round(100.0 * sum(s["late"] for s in segments) / weight, 2) if processed else 0.0,
+        "latency_avg": round(sum(s["latency_avg"] * s["processed"] for s in segments) / weight, 3),
+        "lag_avg": round(sum(s["lag_avg"] * s["processed"] for s in segments) / weight, 3),
+        "lag_max": max((s["lag_max"] for s in segments), default=0.0),
+        "latency_worst_segment": max((s["latency_avg"] for s in segments), default=0.0),
+        # Границы сегментов, на которых очередь расписания обнулялась вместе с процессом pgbench
+        "queue_resets": max(len(segments) - 1, 0),
+    }
@@ -0,0 +1,132 @@
+class PlanStats:
+    """
+    Аккумулирует результаты EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) одного запроса
+    за несколько прогонов: время по узлам, строки, буферы, параллельность и JIT.
+
+    Время узла - по стене: под Gather каждый процесс (воркеры + лидер) считается
+    отдельным loop, поэтому время * loops делится на число процессов. Буферы в EXPLAIN
+    включают дочерние узлы; в сводке они собственные (за вычетом детей), как self time.
+    """
+
+    def __init__(self, query_name):
+        self.query_name = query_name
+        self.runs = 0
+        self.execution_times = []
+        self.planning_times = []
+        self.nodes = {}
+        self.workers_planned = 0
+        self.workers_launched = 0
+        self.jit_runs = 0
+        self.jit_functions = 0
+        self.jit_time = 0.0
+
+    def add(self, explain_json):
+        """Принимает результат EXPLAIN ... FORMAT JSON (список из одного элемента или dict)"""
+        root = explain_json[0] if isinstance(explain_json, list) else explain_json
+        self.runs += 1
+        self.execution_times.append(float(root.get("Execution Time", 0.0)))
+        self.planning_times.append(float(root.get("Planning Time", 0.0)))
+
+        jit = root.get("JIT")
+        if jit and jit.get("Functions", 0) > 0:
+            self.jit_runs += 1
+            self.jit_functions += int(jit.get("Functions", 0))
+            self.jit_time += float(jit.get("Timing", {}).get("Total", 0.0))
+
+        self._walk(root["Plan"], "0")
+
+    def _walk(self, node, path, processes=1):
+        total_time = _wall_time(node, processes)
+
+        children = node.get("Plans", [])
+        # Под Gather / Gather Merge поддерево исполняют запущенные воркеры и лидер
+        child_processes = processes
+        if node.get("Node Type") in ("Gather", "Gather Merge"):
+            child_processes = int(node.get("Workers Launched", 0)) + 1
+        children_time = sum(_wall_time(c, child_processes) for c in children)
+
+        key = (path, node.get("Node Type", "?"), node.get("Relation Name") or node.get("Index Name") or "")
+        agg = self.nodes.setdefault(key, {
+            "total_time": 0.0, "self_time": 0.0, "rows": 0, "loops": 0,
+            "shared_hit": 0, "shared_read": 0, "temp_written": 0, "count": 0
+        })
+        agg["count"] += 1
+        agg["total_time"] += total_time
+        agg["self_time"] += max(total_time - children_time, 0.0)
+        loops = max(int(node.get("Actual Loops", 1)), 1)
+        agg["rows"] += int(node.get("Actual Rows", 0)) * loops
+        agg["loops"] += loops
+        for field, counter in (("shared_hit", "Shared Hit Blocks"), ("shared_read", "Shared Read Blocks"),
+                               ("temp_written", "Temp Written Blocks")):
+            own = int(node.get(counter, 0)) - sum(int(c.get(counter, 0)) for c in children)
+            agg[field] += max(own, 0)
+
+        if "Workers Planned" in node:
+            self.workers_planned += int(node.get("Workers Planned", 0))
+            self.workers_launched += int(node.get("Workers Launched", 0))
+
+        for i, child in enumerate(children):
+            self._walk(child, f"{path}.{i}", child_processes)
+
+    def summary(self):
+        runs = max(self.runs, 1)
+        nodes = []
+        for (path, node_type, relation), agg in sorted(self.nodes.items()):
+            count = max(agg["count"], 1)
+            nodes.append({
+                "path": path,
+                "node": node_type,
+                "relation": relation,
+                "avg_total_ms": round(agg["total_time"] / count, 3),
+                "avg_self_ms": round(agg["self_time"] / count, 3),
+                "avg_rows": round(agg["rows"] / count, 1),
+                "avg_shared_hit": round(agg["shared_hit"] / count, 1),
+                "avg_shared_read": round(agg["shared_read"] / count, 1),
+                "avg_temp_written": round(agg["temp_written"] / count, 1),
+            })
+
+        times = sorted(self.execution_times) or [0.0]
+        return {
+            "query": self.query_name,
+            "runs": self.runs,
+            "avg_execution_ms": round(sum(times) / len(times), 3),
+            "min_execution_ms": round(times[0], 3),
+            "max_execution_ms": round(times[-1], 3),
+            "avg_planning_ms": round(sum(self.planning_times) / runs, 3),
+            "parallel": {
+                "workers_planned": self.workers_planned,
+                "workers_launched": self.workers_launched,
+                "used": self.workers_launched > 0,
+            },
+            "jit": {
+                "fired_runs": self.jit_runs,
+                "avg_functions": round(self.jit_functions / runs, 1),
+                "avg_time_ms": round(self.jit_time / runs, 3),
+                "used": self.jit_runs > 0,
+            },
+            "nodes": nodes,
+        }
+
+
+def _wall_time(node, processes):
+    """Actual Total Time - среднее на loop; суммарное время всех loops, деленное на число параллельных процессов"""
+    loops = max(int(node.get("Actual Loops", 1)), 1)
+    return float(node.get("Actual Total Time", 0.0)) * loops / max(processes, 1)
+
+
+def format_plan_summary(summary, top=5):
+    """Короткий текстовый отчет: время, параллельность, JIT и самые дорогие узлы"""
+    par, jit = summary["parallel"], summary["jit"]
+    lines = [
+        f"{summary['query']}: {summary['avg_execution_ms']:.1f}ms avg "
+        f"({summary['min_execution_ms']:.1f}..{summary['max_execution_ms']:.1f}), runs={summary['runs']}",
+        f"  parallel: {par['workers_launched']}/{par['workers_planned']} workers launched | "
+        f"JIT: {'fired' if jit['used'] else 'off'} ({jit['fired_runs']}/{summary['runs']} runs, {jit['avg_time_ms']:.1f}ms)",
+    ]
+    for node in sorted(summary["nodes"], key=lambda n: n["avg_self_ms"], reverse=True)[:top]:
+        target = f" on {node['relation']}" if node["relation"] else ""
+        lines.append(
+            f"  {node['node']}{target}: self {node['avg_self_ms']:.1f}ms, rows {node['avg_rows']:.0f}, "
+            f"self hit {node['avg_shared_hit']:.0f}, self read {node['avg_shared_read']:.0f}"
+        )
+    return "\n".join(lines)
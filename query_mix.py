@@ -0,0 +1,117 @@
+import re
+
+# Формы запросов по нормализованному тексту pg_stat_statements
+SHAPES = (
+    "point_lookup", "range_scan", "aggregate_join",
+    "single_row_write", "bulk_write", "ddl_maintenance", "other",
+)
+SHAPE_LABELS = {
+    "point_lookup": "Point Lookup",
+    "range_scan": "Range Scan",
+    "aggregate_join": "Aggregate/Join",
+    "single_row_write": "Single-Row Write",
+    "bulk_write": "Bulk Write",
+    "ddl_maintenance": "DDL/Maintenance",
+    "other": "Other",
+}
+# Собственные запросы коллектора в долю нагрузки не входят
+MONITOR_SHAPE = "monitor"
+
+COMMENT_RE = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+SPACE_RE = re.compile(r"\s+")
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+MAINTENANCE_RE = re.compile(r"^(create|alter|drop|truncate|vacuum|analyze|reindex|cluster|refresh|grant|revoke|comment|lock)\b")
+UTILITY_RE = re.compile(r"^(begin|commit|rollback|end|start|savepoint|release|set|reset|show|discard|deallocate|prepare|execute|listen|notify|checkpoint)\b")
+AGGREGATE_RE = re.compile(r"\bgroup by\b|\b(count|sum|avg|min|max|stddev|string_agg|array_agg)\s*\(|\bdistinct\b|\bover\s*\(")
+JOIN_RE = re.compile(r"\bjoin\b|\bfrom\s+\w+(?:\.\w+)?(?:\s+(?:as\s+)?\w+)?\s*,\s*\w")
+POINT_RE = re.compile(r"\bwhere\s+(?:\w+\.)?\w+\s*=\s*\$\d+(?:\s+and\s+(?:\w+\.)?\w+\s*=\s*\$\d+)*\s*(?:limit\s+\$?\d+\s*)?(?:for\s+\w+\s*)?;?$")
+MULTI_VALUES_RE = re.compile(r"\)\s*,\s*\(")
+
+
+def normalize(text):
+    """Нижний регистр, без комментариев, строковых литералов и лишних пробелов"""
+    text = COMMENT_RE.sub(" ", text or "")
+    text = STRING_RE.sub("$s", text)
+    return SPACE_RE.sub(" ", text).strip().lower()
+
+
+def classify_query(text):
+    """
+    Форма запроса по тексту. pg_stat_statements уже заменяет константы на $n,
+    поэтому текст одного queryid достаточно разобрать один раз.
+    """
+    sql = normalize(text)
+    if not sql:
+        return "other"
+    if sql.startswith("with "):
+        # CTE: форму определяет основной оператор, пишущие CTE считаются записью
+        if re.search(r"\b(insert|update|delete)\b", sql):
+            return "bulk_write"
+        sql = sql[sql.rfind(") select ") + 2:] if ") select " in sql else sql
+
+    if MAINTENANCE_RE.match(sql):
+        return "ddl_maintenance"
+    if UTILITY_RE.match(sql):
+        return "other"
+
+    if sql.startswith("copy "):
+        return "range_scan" if re.search(r"\bto\s+(stdout|\$s|program)\b", sql) else "bulk_write"
+
+    if sql.startswith("insert "):
+        if " select " in sql or "generate_series" in sql or MULTI_VALUES_RE.search(sql):
+            return "bulk_write"
+        return "single_row_write"
+
+    if sql.startswith(("update ", "delete ", "merge ")):
+        if (sql.startswith("merge ") or " in (select" in sql
+                or re.match(r"update \S+ set .* from ", sql) or re.match(r"delete from \S+ using ", sql)):
+            return "bulk_write"
+        return "single_row_write" if POINT_RE.search(sql) else "bulk_write"
+
+    if sql.startswith(("select ", "table ", "values ")):
+        if " from " not in sql and not sql.startswith("table "):
+            return "other"
+        if AGGREGATE_RE.search(sql) or JOIN_RE.search(sql):
+            return "aggregate_join"
+        if POINT_RE.search(sql):
+            return "point_lookup"
+        return "range_scan"
+
+    return "other"
+
+
+def sum_by_queryid(rows):
+    """
+    Строки pg_stat_statements уникальны по (userid, dbid, queryid, toplevel): при track=all один queryid
+    встречается несколько раз. (queryid, счетчик, ...) -> { queryid: (сумма, ...) }
+    """
+    totals = {}
+    for queryid, *values in rows:
+        values = [float(v or 0) for v in values]
+        prev = totals.get(queryid)
+        totals[queryid] = tuple(values) if prev is None else tuple(a + b for a, b in zip(prev, values))
+    return totals
+
+
+def mix_shares(prev, curr):
+    """
+    Доли времени и вызовов по формам за интервал из счетчиков query_mix двух снимков.
+    Возвращает None, если за интервал нет учтенного времени.
+    """
+    if not prev or not curr:
+        return None
+    d_time, d_calls = {}, {}
+    for shape in SHAPES:
+        p, c = prev.get(shape) or {}, curr.get(shape) or {}
+        d_time[shape] = max(c.get("time", 0.0) - p.get("time", 0.0), 0.0)
+        d_calls[shape] = max(c.get("calls", 0.0) - p.get("calls", 0.0), 0.0)
+
+    total_time, total_calls = sum(d_time.values()), sum(d_calls.values())
+    if total_time <= 0:
+        return None
+    return {
+        "time": total_time,
+        "calls": total_calls,
+        "time_share": {shape: d_time[shape] / total_time for shape in SHAPES},
+        "call_share": {shape: d_calls[shape] / total_calls if total_calls else 0.0 for shape in SHAPES},
+    }
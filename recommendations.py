@@ -0,0 +1,385 @@
+import os
+import re
+import subprocess
+import psycopg2
+
+UNIT_BYTES = {"B": 1, "kB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+UNIT_MS = {"us": 0.001, "ms": 1, "s": 1000, "min": 60000, "h": 3600000, "d": 86400000}
+
+RELATIVE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*%\s*RAM\s*$", re.IGNORECASE)
+QUANTITY_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*$")
+
+# Параметры, количество которых не имеет смысла делать больше числа CPU
+CPU_BOUND_SETTINGS = (
+    "max_parallel_workers_per_gather",
+    "max_parallel_workers",
+    "max_parallel_maintenance_workers",
+    "max_worker_processes",
+)
+
+# backend/superuser-backend после reload видят только новые сессии, уже открытые остаются со старым значением
+CONTEXT_ACTIONS = {
+    "postmaster": "restart",
+    "sighup": "reload",
+    "superuser-backend": "new sessions",
+    "backend": "new sessions",
+    "superuser": "reload",
+    "user": "reload",
+    "internal": "read-only",
+}
+
+# Значения, без которых сервер не стартует с данным значением параметра
+DEPENDENT_SETTINGS = {
+    ("wal_level", "minimal"): {"max_wal_senders": "0", "archive_mode": "off"},
+}
+
+# Один вызов docker exec собирает все сведения о ресурсах контейнера (cgroup v2 и v1)
+CONTAINER_PROBE = r"""
+echo "mem_total=$(awk '/MemTotal/ {print $2 * 1024}' /proc/meminfo)"
+echo "mem_limit=$(cat /sys/fs/cgroup/memory.max 2>/dev/null || cat /sys/fs/cgroup/memory/memory.limit_in_bytes 2>/dev/null)"
+echo "cpu_max=$(cat /sys/fs/cgroup/cpu.max 2>/dev/null)"
+echo "cpu_quota=$(cat /sys/fs/cgroup/cpu/cpu.cfs_quota_us 2>/dev/null) $(cat /sys/fs/cgroup/cpu/cpu.cfs_period_us 2>/dev/null)"
+echo "nproc=$(nproc 2>/dev/null)"
+echo "rotational=$(cat /sys/block/*/queue/rotational 2>/dev/null | tr '\n' ' ')"
+"""
+
+
+class HardwareInfo:
+    def __init__(self, memory_bytes, cpu_count, storage="ssd", source="local"):
+        self.memory_bytes = int(memory_bytes)
+        self.cpu_count = max(int(cpu_count), 1)
+        self.storage = storage
+        self.source = source
+
+    def __repr__(self):
+        return (f"HardwareInfo(memory={self.memory_bytes // UNIT_BYTES['MB']}MB, "
+                f"cpus={self.cpu_count}, storage={self.storage}, source={self.source})")
+
+    @classmethod
+    def detect_local(cls):
+        """Читает ресурсы текущего хоста из /proc и /sys"""
+        memory = 0
+        try:
+            with open("/proc/meminfo") as f:
+                for line in f:
+                    if line.startswith("MemTotal:"):
+                        memory = int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+
+        flags = []
+        try:
+            for dev in os.listdir("/sys/block"):
+                if dev.startswith(("loop", "ram", "zram")):
+                    continue
+                with open(f"/sys/block/{dev}/queue/rotational") as f:
+                    flags.append(f.read().strip())
+        except OSError:
+            pass
+
+        return cls(memory, os.cpu_count() or 1, _storage_from_flags(flags), "local")
+
+    @classmethod
+    def detect_container(cls, container_name):
+        """Читает лимиты cgroup контейнера с БД (память, квота CPU, тип дисков)"""
+        result = subprocess.run(
+            ["docker", "exec", "-i", container_name, "sh", "-c", CONTAINER_PROBE],
+            capture_output=True, text=True, timeout=10
+        )
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip() or "docker exec failed")
+
+        values = {}
+        for line in result.stdout.splitlines():
+            if "=" in line:
+                key, _, value = line.partition("=")
+                values[key.strip()] = value.strip()
+
+        memory = _to_int(values.get("mem_total"))
+        limit = _to_int(values.get("mem_limit"))
+        # "max" или огромное число означает отсутствие лимита
+        if limit and (not memory or limit < memory):
+            memory = limit
+
+        cpus = _to_int(values.get("nproc")) or 1
+        quota = _cpu_quota(values.get("cpu_max")) or _cpu_quota(values.get("cpu_quota"))
+        if quota:
+            cpus = min(cpus, max(int(quota), 1))
+
+        return cls(memory, cpus, _storage_from_flags(values.get("rotational", "").split()), "container")
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _cpu_quota(value):
+    """'200000 100000' -> 2.0; 'max 100000' или '-1 100000' -> None"""
+    parts = (value or "").split()
+    if len(parts) != 2:
+        return None
+    quota, period = _to_int(parts[0]), _to_int(parts[1])
+    if quota <= 0 or period <= 0:
+        return None
+    return quota / period
+
+
+def _storage_from_flags(flags):
+    flags = [f for f in flags if f in ("0", "1")]
+    if flags and all(f == "1" for f in flags):
+        return "hdd"
+    return "ssd"
+
+
+def parse_quantity(text, base_unit):
+    """
+    Переводит строку вида '64MB', '30min', '200' в число единиц base_unit
+    (единица из pg_settings.unit: '8kB', 'kB', 'MB', 'ms', 's', 'min').
+    """
+    match = QUANTITY_RE.match(str(text))
+    if not match:
+        raise ValueError(f"cannot parse '{text}'")
+    number, unit = float(match.group(1)), match.group(2)
+    if not unit:
+        return number
+
+    base_num, base_name = _split_unit(base_unit)
+    if unit in UNIT_BYTES and base_name in UNIT_BYTES:
+        return number * UNIT_BYTES[unit] / (base_num * UNIT_BYTES[base_name])
+    if unit in UNIT_MS and base_name in UNIT_MS:
+        return number * UNIT_MS[unit] / (base_num * UNIT_MS[base_name])
+    raise ValueError(f"unit '{unit}' is not compatible with '{base_unit}'")
+
+
+def format_quantity(value, base_unit):
+    """Переводит число единиц base_unit в самую крупную целую единицу ('524288 kB' -> '512MB')"""
+    base_num, base_name = _split_unit(base_unit)
+    if base_name in UNIT_BYTES:
+        table, order = UNIT_BYTES, ("TB", "GB", "MB", "kB")
+    elif base_name in UNIT_MS:
+        table, order = UNIT_MS, ("d", "h", "min", "s", "ms")
+    else:
+        return _format_number(value)
+
+    total = int(round(value * base_num * table[base_name]))
+    for unit in order:
+        if total and total % table[unit] == 0:
+            return f"{total // table[unit]}{unit}"
+    return f"{int(round(value * base_num))}{base_name}"
+
+
+def _split_unit(unit):
+    match = re.match(r"^(\d*)\s*([a-zA-Z]+)$", unit or "")
+    if not match:
+        return 1, ""
+    return int(match.group(1) or 1), match.group(2)
+
+
+def _format_number(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:g}"
+
+
+class RecommendationResolver:
+    """
+    Превращает рекомендации профиля ('25% RAM', '64MB', 'on') в конкретные
+    значения GUC для целевого хоста и проверяет их по pg_settings.
+    """
+
+    def __init__(self, db_config, container_name="vtb_postgres", hardware=None):
+        self.db_config = db_config
+        self.container_name = container_name
+        self._hardware = hardware
+
+    @property
+    def hardware(self):
+        if self._hardware is None:
+            try:
+                self._hardware = HardwareInfo.detect_container(self.container_name)
+            except Exception:
+                self._hardware = HardwareInfo.detect_local()
+        return self._hardware
+
+    def _load_settings(self, names):
+        conn = psycopg2.connect(**self.db_config)
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT name, setting, unit, vartype, min_val, max_val, enumvals, context
+                    FROM pg_settings
+                    WHERE name = ANY(%s)
+                """, (list(names),))
+                return {
+                    row[0]: {
+                        "setting": row[1], "unit": row[2], "vartype": row[3],
+                        "min_val": row[4], "max_val": row[5],
+                        "enumvals": row[6] or [], "context": row[7]
+                    }
+                    for row in cur.fetchall()
+                }
+        finally:
+            conn.close()
+
+    def resolve(self, recs):
+        """
+        Возвращает список словарей:
+        { name, raw, value, current, action, valid, note }
+        action: 'reload' | 'new sessions' | 'restart' | 'read-only'
+        Зависимые параметры (DEPENDENT_SETTINGS) добавляются к рекомендациям и перекрывают их.
+        """
+        recs, required = _with_dependencies(recs)
+        settings = self._load_settings(recs.keys()) if recs else {}
+        hw = self.hardware
+        resolved = []
+
+        for name, raw in recs.items():
+            item = {"name": name, "raw": raw, "value": None, "current": None,
+                    "action": None, "valid": False, "note": ""}
+            meta = settings.get(name)
+            if meta is None:
+                item["note"] = "unknown setting"
+                resolved.append(item)
+                continue
+
+            item["action"] = CONTEXT_ACTIONS.get(meta["context"], "restart")
+            try:
+                item["value"], item["note"] = self._resolve_value(name, str(raw), meta, hw)
+                item["current"] = self._current_value(meta)
+                item["valid"] = True
+            except ValueError as e:
+                item["note"] = str(e)
+            if name in required:
+                item["note"] = ", ".join(filter(None, [item["note"], f"required by {required[name]}"]))
+            resolved.append(item)
+
+        return resolved
+
+    def _resolve_value(self, name, raw, meta, hw):
+        vartype, unit, note = meta["vartype"], meta["unit"], ""
+
+        if vartype == "bool":
+            value = raw.strip().lower()
+            if value not in ("on", "off", "true", "false", "yes", "no", "1", "0"):
+                raise ValueError(f"'{raw}' is not a boolean")
+            return value, note
+
+        if vartype == "enum":
+            value = raw.strip()
+            if value.lower() not in [v.lower() for v in meta["enumvals"]]:
+                raise ValueError(f"'{raw}' not in {meta['enumvals']}")
+            return value, note
+
+        if vartype == "string":
+            return raw, note
+
+        relative = RELATIVE_RE.match(raw)
+        if relative:
+            if not hw.memory_bytes:
+                raise ValueError("target memory size is unknown")
+            if not unit or _split_unit(unit)[1] not in UNIT_BYTES:
+                raise ValueError(f"'{raw}' used for non-memory setting")
+            base_num, base_name = _split_unit(unit)
+            target = hw.memory_bytes * float(relative.group(1)) / 100
+            # Округляем вниз до мегабайта, чтобы значение было читаемым
+            target -= target % UNIT_BYTES["MB"]
+            number = target / (base_num * UNIT_BYTES[base_name])
+            note = f"{relative.group(1)}% of {hw.memory_bytes // UNIT_BYTES['MB']}MB"
+        else:
+            number = parse_quantity(raw, unit)
+
+        number, note = self._adjust_for_hardware(name, number, note, hw)
+
+        if vartype == "integer":
+            number = int(number)
+        min_val, max_val = float(meta["min_val"]), float(meta["max_val"])
+        if number < min_val or number > max_val:
+            raise ValueError(f"{number:g} out of range [{min_val:g}, {max_val:g}] {unit or ''}".rstrip())
+
+        if unit:
+            return format_quantity(number, unit), note
+        return _format_number(number), note
+
+    def _adjust_for_hardware(self, name, number, note, hw):
+        if name in CPU_BOUND_SETTINGS and number > hw.cpu_count:
+            return hw.cpu_count, f"capped to {hw.cpu_count} CPUs"
+        if hw.storage == "hdd":
+            if name == "random_page_cost" and number < 4.0:
+                return 4.0, "rotational storage"
+            if name == "effective_io_concurrency" and number > 2:
+                return 2, "rotational storage"
+        return number, note
+
+    def _current_value(self, meta):
+        if meta["unit"] and meta["vartype"] in ("integer", "real"):
+            try:
+                return format_quantity(float(meta["setting"]), meta["unit"])
+            except ValueError:
+                pass
+        return meta["setting"]
+
+    def apply(self, resolved):
+        """
+        Применяет валидные значения через ALTER SYSTEM и pg_reload_conf().
+        Возвращает список параметров, которым нужен рестарт. Набор, в котором нет зависимых
+        параметров (wal_level = minimal без max_wal_senders = 0), не применяется: сервер не поднимется.
+        """
+        missing = _missing_dependencies(resolved)
+        if missing:
+            raise ValueError(f"Refusing to apply: {'; '.join(missing)}")
+        needs_restart = []
+        conn = psycopg2.connect(**self.db_config)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                for item in resolved:
+                    if not item["valid"] or item["action"] == "read-only":
+                        continue
+                    cur.execute(f"ALTER SYSTEM SET {item['name']} = %s", (item["value"],))
+                    if item["action"] == "restart":
+                        needs_restart.append(item["name"])
+                cur.execute("SELECT pg_reload_conf()")
+        finally:
+            conn.close()
+        return needs_restart
+
+
+def _with_dependencies(recs):
+    """Рекомендации плюс зависимые параметры; { параметр: 'wal_level = minimal' } - для пометки"""
+    recs, required = dict(recs), {}
+    for (name, value), dependent in DEPENDENT_SETTINGS.items():
+        if str(recs.get(name, "")).strip().lower() == value:
+            for dep_name, dep_value in dependent.items():
+                recs[dep_name] = dep_value
+                required[dep_name] = f"{name} = {value}"
+    return recs, required
+
+
+def _missing_dependencies(resolved):
+    applied = {item["name"]: str(item["value"]).lower() for item in resolved if item["valid"]}
+    missing = []
+    for (name, value), dependent in DEPENDENT_SETTINGS.items():
+        if applied.get(name) != value:
+            continue
+        for dep_name, dep_value in dependent.items():
+            if applied.get(dep_name) != dep_value:
+                missing.append(f"{name} = {value} requires {dep_name} = {dep_value}")
+    return missing
+
+
+def to_conf_lines(resolved):
+    """Строки для postgresql.conf с пометкой, нужен ли reload или restart"""
+    lines = []
+    for item in resolved:
+        if item["valid"]:
+            comment = f"# {item['action']}"
+            if item["note"]:
+                comment += f", {item['note']}"
+            lines.append(f"{item['name']} = '{item['value']}'    {comment}")
+        else:
+            lines.append(f"# {item['name']} = '{item['raw']}'    # SKIPPED: {item['note']}")
+    return lines
@@ -0,0 +1,290 @@
+import os
+import io
+import json
+import base64
+import hashlib
+import html
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from config import RESULTS_DIR, REPORTS_DIR
+
+COLOR_VTB_BLUE_DARK = "#0A2896"
+COLOR_VTB_BLUE_LIGHT = "#3A83F1"
+COLOR_SUCCESS = "#28A745"
+COLOR_DANGER = "#DC3545"
+
+# Порог, после которого изменение считается регрессией
+TPS_REGRESSION_PCT = -5.0
+LATENCY_REGRESSION_PCT = 10.0
+
+PAGE_STYLE = """
+body { font-family: 'Segoe UI', Arial, sans-serif; background: #F0F4F7; color: #2B2D33; margin: 24px; }
+h1 { color: #0A2896; } h2 { color: #0A2896; border-bottom: 2px solid #DDE2E8; padding-bottom: 4px; }
+table { border-collapse: collapse; background: #FFFFFF; margin-bottom: 16px; }
+th, td { padding: 6px 12px; border-bottom: 1px solid #E9ECEF; text-align: right; }
+th { background: #0A2896; color: #FFFFFF; } td:first-child, td:nth-child(2) { text-align: left; }
+.bad { color: #DC3545; font-weight: bold; } .good { color: #28A745; }
+.run { background: #FFFFFF; padding: 12px; margin-bottom: 16px; }
+img { max-width: 100%; }
+"""
+
+
+class ReportBuilder:
+    """
+    Строит один самодостаточный HTML на каждую серию прогонов (results/<matrix_id>/*.json):
+    кривые пропускной способности, перцентили латентности по логу транзакций,
+    сравнение профилей и таблицу регрессий относительно последней более ранней серии
+    с теми же парами (профиль, тест).
+
+    Рендер без GUI (Agg, без pyplot). Графики кэшируются по хэшу файла прогона,
+    серия перерисовывается только если изменился хотя бы один ее прогон или базовая серия.
+    """
+
+    def __init__(self, results_dir=RESULTS_DIR, output_dir=REPORTS_DIR):
+        self.results_dir = results_dir
+        self.output_dir = output_dir
+        self.cache_dir = os.path.join(output_dir, ".cache")
+        self.manifest_path = os.path.join(output_dir, "manifest.json")
+
+    def build_all(self, force=False):
+        """Возвращает список путей к перестроенным отчетам"""
+        if not os.path.isdir(self.results_dir):
+            return []
+        os.makedirs(self.cache_dir, exist_ok=True)
+        manifest = self._load_manifest()
+
+        # Серии упорядочены по времени первого прогона, а не по имени каталога
+        series = []
+        for matrix_id in os.listdir(self.results_dir):
+            if os.path.isdir(os.path.join(self.results_dir, matrix_id)):
+                runs = self._load_runs(matrix_id)
+                started = min((r.get("timestamp", "") for r in runs), default="")
+                series.append((started, matrix_id, runs))
+        series.sort(key=lambda item: item[:2])
+
+        built, previous = [], []
+        for _, matrix_id, runs in series:
+            baseline = _pick_baseline(runs, previous)
+            digest = hashlib.sha1(json.dumps([
+                [r["_hash"] for r in runs], baseline and baseline["matrix_id"], baseline and baseline["digest"]
+            ]).encode()).hexdigest()
+            output = os.path.join(self.output_dir, f"report_{matrix_id}.html")
+
+            if force or manifest.get(matrix_id) != digest or not os.path.exists(output):
+                self._render_matrix(matrix_id, runs, baseline, output)
+                manifest[matrix_id] = digest
+                built.append(output)
+
+            previous.append({"matrix_id": matrix_id, "runs": runs, "digest": digest})
+
+        self._save_manifest(manifest)
+        return built
+
+    def _load_runs(self, matrix_id):
+        runs = []
+        matrix_dir = os.path.join(self.results_dir, matrix_id)
+        for filename in sorted(os.listdir(matrix_dir)):
+            if not filename.endswith(".json"):
+                continue
+            with open(os.path.join(matrix_dir, filename), "rb") as f:
+                raw = f.read()
+            run = json.loads(raw)
+            run["_hash"] = hashlib.sha1(raw).hexdigest()
+            runs.append(run)
+        return runs
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self, manifest):
+        with open(self.manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+
+    def _render_matrix(self, matrix_id, runs, baseline, output):
+        parts = [
+            "<!DOCTYPE html><html><head><meta charset='utf-8'>",
+            f"<title>VTB Load Profiler - {html.escape(matrix_id)}</title><style>{PAGE_STYLE}</style></head><body>",
+            f"<h1>Benchmark report: {html.escape(matrix_id)}</h1>",
+            f"<p>{len(runs)} runs</p>",
+        ]
+
+        parts.append("<h2>Profile comparison</h2>")
+        parts.append(self._img(self._comparison_chart(runs)))
+        parts.append(self._summary_table(runs))
+
+        if baseline:
+            parts.append(f"<h2>Regressions vs {html.escape(baseline['matrix_id'])}</h2>")
+            parts.append(self._regression_table(runs, baseline["runs"]))
+        else:
+            parts.append("<h2>Regressions</h2><p>No earlier series with the same profile/test pairs.</p>")
+
+        parts.append("<h2>Runs</h2>")
+        for run in runs:
+            title = f"{run.get('test_type')} / {run.get('profile')} ({run.get('timestamp', '')[:19]})"
+            parts.append(f"<div class='run'><h3>{html.escape(title)}</h3>")
+            parts.append(self._img(self._run_chart(run)))
+            parts.append("</div>")
+
+        parts.append("</body></html>")
+        with open(output + ".tmp", "w", encoding="utf-8") as f:
+            f.write("\n".join(parts))
+        os.replace(output + ".tmp", output)
+
+    def _run_chart(self, run):
+        """Кривые TPS и латентности прогона; PNG кэшируется по хэшу исходного JSON"""
+        cache_path = os.path.join(self.cache_dir, f"{run['_hash']}.png")
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                return f.read()
+
+        progress = run.get("progress") or []
+        fig = Figure(figsize=(10, 3))
+        ax1, ax2 = fig.subplots(1, 2)
+        if progress:
+            t = [p["time"] for p in progress]
+            _plot(ax1, t, [p["tps"] for p in progress], "Throughput (tps)", COLOR_SUCCESS)
+            _plot(ax2, t, [p["latency"] for p in progress], "Latency per interval (ms)", COLOR_DANGER)
+            lags = [p.get("lag", 0) for p in progress]
+            if any(lags):
+                ax2.plot(t, lags, color="#FFC107", linewidth=1.5, label="schedule lag")
+                ax2.legend(fontsize=8)
+        else:
+            for ax in (ax1, ax2):
+                ax.text(0.5, 0.5, "no progress series", ha="center", va="center", color="#888888")
+                ax.set_axis_off()
+        fig.tight_layout()
+
+        png = _to_png(fig)
+        with open(cache_path, "wb") as f:
+            f.write(png)
+        return png
+
+    def _comparison_chart(self, runs):
+        groups = _latest_by_key(runs)
+        test_types = sorted({k[1] for k in groups})
+        profiles = sorted({k[0] for k in groups})
+
+        fig = Figure(figsize=(10, 3.5))
+        ax = fig.subplots()
+        width = 0.8 / max(len(profiles), 1)
+        for i, profile in enumerate(profiles):
+            values = [groups.get((profile, t), {}).get("tps", 0) for t in test_types]
+            ax.bar([x + i * width for x in range(len(test_types))], values, width, label=profile)
+        ax.set_xticks([x + width * (len(profiles) - 1) / 2 for x in range(len(test_types))])
+        ax.set_xticklabels(test_types, fontsize=8)
+        ax.set_title("TPS by test and profile", fontsize=9, loc="left", color="#666666")
+        if profiles:
+            ax.legend(fontsize=7)
+        _style(ax)
+        fig.tight_layout()
+        return _to_png(fig)
+
+    def _summary_table(self, runs):
+        rows = ["<table><tr><th>Profile</th><th>Test</th><th>TPS</th><th>Avg lat, ms</th>"
+                "<th>p50 / p95 / p99 lat, ms</th><th>Clients</th><th>Tx / CPU-s</th><th>Written B / tx</th></tr>"]
+        includes_client = False
+        for (profile, test_type), run in sorted(_latest_by_key(runs).items()):
+            (p50, p95, p99), exact = _latency_percentiles(run)
+            eff = run.get("efficiency") or {}
+            includes_client = includes_client or bool(eff.get("cpu_includes_client"))
+            rows.append(
+                f"<tr><td>{html.escape(str(profile))}</td><td>{html.escape(str(test_type))}</td>"
+                f"<td>{run.get('tps', 0):.1f}</td><td>{run.get('avg_latency', 0):.2f}</td>"
+                f"<td>{p50:.2f} / {p95:.2f} / {p99:.2f}{'' if exact else ' (interval avg)'}</td><td>{run.get('clients', '')}</td>"
+                f"<td>{eff.get('tx_per_cpu_second') or '-'}{' *' if eff.get('cpu_includes_client') else ''}</td>"
+                f"<td>{eff.get('bytes_written_per_tx', '-')}</td></tr>"
+            )
+        rows.append("</table>")
+        if includes_client:
+            rows.append("<p>* CPU includes the pgbench client running in the database container</p>")
+        return "\n".join(rows)
+
+    def _regression_table(self, runs, baseline_runs):
+        current, baseline = _latest_by_key(runs), _latest_by_key(baseline_runs)
+        rows = ["<table><tr><th>Profile</th><th>Test</th><th>TPS before</th><th>TPS after</th><th>TPS &Delta;%</th>"
+                "<th>Lat before</th><th>Lat after</th><th>Lat &Delta;%</th></tr>"]
+        for key in sorted(set(current) & set(baseline)):
+            before, after = baseline[key], current[key]
+            tps_delta = _pct(before.get("tps", 0), after.get("tps", 0))
+            lat_delta = _pct(before.get("avg_latency", 0), after.get("avg_latency", 0))
+            tps_cls = "bad" if tps_delta <= TPS_REGRESSION_PCT else "good" if tps_delta > 0 else ""
+            lat_cls = "bad" if lat_delta >= LATENCY_REGRESSION_PCT else "good" if lat_delta < 0 else ""
+            rows.append(
+                f"<tr><td>{html.escape(str(key[0]))}</td><td>{html.escape(str(key[1]))}</td>"
+                f"<td>{before.get('tps', 0):.1f}</td><td>{after.get('tps', 0):.1f}</td>"
+                f"<td class='{tps_cls}'>{tps_delta:+.1f}</td>"
+                f"<td>{before.get('avg_latency', 0):.2f}</td><td>{after.get('avg_latency', 0):.2f}</td>"
+                f"<td class='{lat_cls}'>{lat_delta:+.1f}</td></tr>"
+            )
+        rows.append("</table>")
+        return "\n".join(rows)
+
+    @staticmethod
+    def _img(png):
+        return f"<img src='data:image/png;base64,{base64.b64encode(png).decode()}'/>"
+
+
+def _pick_baseline(runs, previous):
+    """Последняя более ранняя серия, в которой есть хотя бы одна пара (profile, test_type) текущей"""
+    keys = set(_latest_by_key(runs))
+    for candidate in reversed(previous):
+        if keys & set(_latest_by_key(candidate["runs"])):
+            return candidate
+    return None
+
+
+def _latest_by_key(runs):
+    latest = {}
+    for run in sorted(runs, key=lambda r: r.get("timestamp", "")):
+        if "error" not in run:
+            latest[(run.get("profile"), run.get("test_type"))] = run
+    return latest
+
+
+def _latency_percentiles(run):
+    """
+    ((p50, p95, p99), exact). Перцентили по гистограмме лога транзакций точные с точностью до корзины;
+    для старых прогонов без нее берутся перцентили средних по интервалам progress - это не латентность транзакций
+    """
+    exact = run.get("percentiles_ms")
+    if exact:
+        return (exact.get("p50", 0.0), exact.get("p95", 0.0), exact.get("p99", 0.0)), True
+    values = sorted(p["latency"] for p in run.get("progress") or [])
+    if not values:
+        return (0.0, 0.0, 0.0), False
+    pick = lambda q: values[min(int(q * len(values)), len(values) - 1)]
+    return (pick(0.50), pick(0.95), pick(0.99)), False
+
+
+def _pct(before, after):
+    return 100.0 * (after - before) / before if before else 0.0
+
+
+def _plot(ax, x, y, title, color):
+    ax.plot(x, y, color=color, linewidth=2)
+    ax.fill_between(x, y, color=color, alpha=0.1)
+    ax.set_title(title, fontsize=9, color="#666666", loc="left")
+    _style(ax)
+
+
+def _style(ax):
+    ax.grid(True, linestyle="--", alpha=0.3)
+    ax.spines["top"].set_visible(False)
+    ax.spines["right"].set_visible(False)
+    ax.tick_params(axis="both", colors="#888888", labelsize=8)
+
+
+def _to_png(fig):
+    buf = io.BytesIO()
+    FigureCanvasAgg(fig).print_png(buf)
+    return buf.getvalue()
+
+
+if __name__ == "__main__":
+    for path in ReportBuilder().build_all():
+        print(f"Report written: {path}")
@@ -0,0 +1,259 @@
+import threading
+import time
+
+try:
+    import docker
+except ImportError:
+    docker = None
+
+_client = None
+_client_error = None
+
+
+def docker_client():
+    """Общий клиент Docker SDK; None, если пакет не установлен или демон недоступен"""
+    global _client, _client_error
+    if _client is None and _client_error is None and docker is not None:
+        try:
+            _client = docker.from_env()
+            _client.ping()
+        except Exception as e:
+            # Повторно не пытаемся, чтобы не тормозить каждый прогон
+            _client, _client_error = None, e
+            print(f" Docker SDK unavailable, resource telemetry disabled: {e}")
+    return _client
+
+
+class ContainerStatsSampler:
+    """
+    Фоновый сэмплер ресурсов контейнера на время прогона: CPU cgroup, RSS,
+    блочный I/O и сеть с фиксированной частотой, опционально - пики по процессам (docker top).
+    Счетчики cgroup накопительные, поэтому скорости считаются по разнице соседних снимков.
+    pgbench и свертка его лога запускаются через docker exec в том же контейнере и попадают в CPU cgroup:
+    при client_cpu=True CPU процессов не из postgres считается по docker top и вычитается
+    в server_cpu_seconds (с точностью до последнего интервала жизни процесса).
+
+        with ContainerStatsSampler("vtb_postgres") as sampler:
+            subprocess.run(...)
+        sampler.summary()
+    """
+
+    def __init__(self, container_name, interval=1.0, per_process=False, client=None, client_cpu=True):
+        self.container_name = container_name
+        self.interval = interval
+        self.per_process = per_process
+        self.client_cpu = client_cpu
+        self.client = client
+        self.series = []
+        self.processes = {}
+        # pid -> [CPU-секунды при первом и последнем снимке] процессов клиента нагрузки
+        self._client_procs = {}
+        self._process_samples = 0
+        self._first = None
+        self._last = None
+        self._peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._container = None
+        # join в __exit__ ограничен по времени: поток может еще быть внутри медленного stats(),
+        # поэтому финальный снимок и снимок потока обновляют состояние под блокировкой
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        client = self.client or docker_client()
+        if client is not None:
+            try:
+                self._container = client.containers.get(self.container_name)
+            except Exception as e:
+                print(f" Resource telemetry disabled: {e}")
+        if self._container is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=self.interval * 3)
+            self._take_sample()
+        return False
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while True:
+            self._take_sample()
+            next_tick += self.interval
+            if self._stop.wait(max(next_tick - time.monotonic(), 0)):
+                break
+
+    def _read_stats(self):
+        try:
+            # one_shot не ждет второго замера precpu на стороне демона (Docker API >= 1.41)
+            return self._container.stats(stream=False, one_shot=True)
+        except TypeError:
+            return self._container.stats(stream=False)
+
+    def _take_sample(self):
+        # Время запроса, а не ответа: медленный ответ не должен выглядеть свежее следующего снимка
+        started = time.monotonic()
+        try:
+            sample = _parse_stats(self._read_stats())
+        except Exception as e:
+            print(f" Container stats error: {e}")
+            return
+        sample["time"] = started
+
+        with self._lock:
+            self._record(sample)
+
+        if self.per_process or self.client_cpu:
+            self._sample_processes()
+
+    def _record(self, sample):
+        if self._last is not None:
+            dt = sample["time"] - self._last["time"]
+            # Снимок, обогнанный параллельным более свежим, отбрасывается
+            if dt <= 0:
+                return
+            self.series.append({
+                "time": round(sample["time"] - self._first["time"], 2),
+                "cpu_cores": round((sample["cpu_ns"] - self._last["cpu_ns"]) / 1e9 / dt, 3),
+                "rss_bytes": sample["rss_bytes"],
+                "working_set_bytes": sample["working_set_bytes"],
+                "read_bps": round(max(sample["read_bytes"] - self._last["read_bytes"], 0) / dt),
+                "write_bps": round(max(sample["write_bytes"] - self._last["write_bytes"], 0) / dt),
+                "rx_bps": round(max(sample["rx_bytes"] - self._last["rx_bytes"], 0) / dt),
+                "tx_bps": round(max(sample["tx_bytes"] - self._last["tx_bytes"], 0) / dt),
+            })
+        else:
+            self._first = sample
+        self._last = sample
+        self._peak_rss = max(self._peak_rss, sample["rss_bytes"])
+
+    def _sample_processes(self):
+        """
+        Пиковые RSS и %CPU по типам процессов PostgreSQL (backend, checkpointer, walwriter, ...)
+        и накопленный CPU процессов клиента: %CPU в ps - среднее за жизнь процесса, CPU-секунды = %CPU * ELAPSED.
+        """
+        try:
+            top = self._container.top(ps_args="-o pid,pcpu,etimes,rss,args")
+        except Exception:
+            return
+        titles = top.get("Titles") or []
+        try:
+            pid_i, pcpu_i, etime_i = titles.index("PID"), titles.index("%CPU"), titles.index("ELAPSED")
+            rss_i, args_i = titles.index("RSS"), titles.index("COMMAND")
+        except ValueError:
+            return
+
+        current, client = {}, {}
+        for row in top.get("Processes") or []:
+            kind = _process_kind(row[args_i])
+            entry = current.setdefault(kind, {"count": 0, "cpu_pct": 0.0, "rss_bytes": 0})
+            entry["count"] += 1
+            entry["cpu_pct"] += float(row[pcpu_i] or 0)
+            entry["rss_bytes"] += int(row[rss_i] or 0) * 1024
+            if not row[args_i].startswith("postgres"):
+                client[row[pid_i]] = float(row[pcpu_i] or 0) / 100.0 * float(row[etime_i] or 0)
+
+        with self._lock:
+            for pid, cpu in client.items():
+                # Процесс, живший до старта сэмплера, учитывается только с первого снимка
+                first = cpu if self._process_samples == 0 else 0.0
+                self._client_procs.setdefault(pid, [first, cpu])[1] = cpu
+            self._process_samples += 1
+            if not self.per_process:
+                return
+            for kind, entry in current.items():
+                peak = self.processes.setdefault(kind, {"count": 0, "cpu_pct": 0.0, "rss_bytes": 0})
+                for key in peak:
+                    peak[key] = max(peak[key], entry[key])
+
+    def summary(self):
+        """Итоги прогона; None, если телеметрия не собиралась"""
+        with self._lock:
+            return self._summary()
+
+    def _summary(self):
+        if self._first is None or self._last is self._first:
+            return None
+        first, last = self._first, self._last
+        elapsed = last["time"] - first["time"]
+        cpu_seconds = (last["cpu_ns"] - first["cpu_ns"]) / 1e9
+        result = {
+            "interval": self.interval,
+            "elapsed": round(elapsed, 2),
+            "cpu_seconds": round(cpu_seconds, 3),
+            "avg_cpu_cores": round(cpu_seconds / elapsed, 3) if elapsed > 0 else 0.0,
+            "peak_cpu_cores": max((s["cpu_cores"] for s in self.series), default=0.0),
+            "peak_rss_bytes": self._peak_rss,
+            "bytes_read": max(last["read_bytes"] - first["read_bytes"], 0),
+            "bytes_written": max(last["write_bytes"] - first["write_bytes"], 0),
+            "net_rx_bytes": max(last["rx_bytes"] - first["rx_bytes"], 0),
+            "net_tx_bytes": max(last["tx_bytes"] - first["tx_bytes"], 0),
+            "series": list(self.series),
+        }
+        if self.processes:
+            result["processes"] = {kind: dict(peak) for kind, peak in self.processes.items()}
+        if self._process_samples:
+            client_cpu = sum(max(last - first, 0.0) for first, last in self._client_procs.values())
+            result["client_cpu_seconds"] = round(client_cpu, 3)
+            result["server_cpu_seconds"] = round(max(cpu_seconds - client_cpu, 0.0), 3)
+        return result
+
+
+def efficiency_metrics(resources, transactions):
+    """
+    Стоимость транзакции: tx на CPU-секунду и байты I/O на транзакцию.
+    CPU берется без клиента нагрузки, если сэмплер его отделил; иначе cpu_includes_client = True.
+    """
+    if not resources or transactions <= 0:
+        return None
+    server_cpu = resources.get("server_cpu_seconds")
+    cpu = resources["cpu_seconds"] if server_cpu is None else server_cpu
+    return {
+        "tx_per_cpu_second": round(transactions / cpu, 2) if cpu > 0 else None,
+        "cpu_ms_per_tx": round(cpu * 1000 / transactions, 4),
+        "cpu_includes_client": server_cpu is None,
+        "client_cpu_seconds": resources.get("client_cpu_seconds"),
+        "bytes_written_per_tx": round(resources["bytes_written"] / transactions, 1),
+        "bytes_read_per_tx": round(resources["bytes_read"] / transactions, 1),
+    }
+
+
+def _parse_stats(stats):
+    memory = stats.get("memory_stats") or {}
+    mem = memory.get("stats") or {}
+    usage = memory.get("usage", 0)
+    # cgroup v1: rss/total_inactive_file, cgroup v2: anon/inactive_file
+    rss = mem.get("rss", mem.get("anon", usage))
+    inactive = mem.get("total_inactive_file", mem.get("inactive_file", 0))
+
+    read_bytes = write_bytes = 0
+    for entry in (stats.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []:
+        op = entry.get("op", "").lower()
+        if op == "read":
+            read_bytes += entry.get("value", 0)
+        elif op == "write":
+            write_bytes += entry.get("value", 0)
+
+    networks = (stats.get("networks") or {}).values()
+    return {
+        "cpu_ns": ((stats.get("cpu_stats") or {}).get("cpu_usage") or {}).get("total_usage", 0),
+        "rss_bytes": rss,
+        "working_set_bytes": max(usage - inactive, 0),
+        "read_bytes": read_bytes,
+        "write_bytes": write_bytes,
+        "rx_bytes": sum(n.get("rx_bytes", 0) for n in networks),
+        "tx_bytes": sum(n.get("tx_bytes", 0) for n in networks),
+    }
+
+
+def _process_kind(command):
+    # "postgres: user mydb 172.18.0.1(5432) idle" -> backend, "postgres: checkpointer" -> checkpointer
+    if not command.startswith("postgres:"):
+        return command.split()[0] if command else "?"
+    words = command[len("postgres:"):].split()
+    if len(words) >= 3 and ("(" in words[2] or words[2] == "[local]"):
+        return "backend"
+    return " ".join(w for w in words if not w.startswith("(")) or "postmaster"
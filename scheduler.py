@@ -0,0 +1,47 @@
+from config import ANALYSIS_INTERVAL, MIN_ANALYSIS_INTERVAL, MAX_ANALYSIS_INTERVAL
+
+
+class AdaptiveScheduler:
+    """
+    Подбирает интервал до следующего снимка. При смене профиля или скачке TPS/ASH
+    относительно сглаженного уровня - минимальный интервал; пока профиль стабилен
+    или IDLE - интервал плавно растет до максимального.
+    """
+
+    def __init__(self, base=ANALYSIS_INTERVAL, min_interval=MIN_ANALYSIS_INTERVAL,
+                 max_interval=MAX_ANALYSIS_INTERVAL, spike_ratio=0.5, alpha=0.3, backoff=1.5, stable_ticks=5):
+        self.base = base
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.spike_ratio = spike_ratio
+        self.alpha = alpha
+        self.backoff = backoff
+        self.stable_ticks = stable_ticks
+
+        self.interval = base
+        self.last_profile = None
+        self.stable_for = 0
+        self.level = {}
+
+    def next_interval(self, profile, metrics):
+        spike = False
+        for key in ("TPS", "Active Sessions (ASH)"):
+            value = float(metrics.get(key, 0))
+            level = self.level.get(key)
+            if level is not None and abs(value - level) > self.spike_ratio * max(level, 1.0):
+                spike = True
+            self.level[key] = value if level is None else level + self.alpha * (value - level)
+
+        if profile != self.last_profile or spike:
+            self.stable_for = 0
+            self.interval = self.min_interval
+        else:
+            self.stable_for += 1
+            if profile == "IDLE" or self.stable_for >= self.stable_ticks:
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+            else:
+                # Переходный период закончился, но стабильности еще нет - возвращаемся к базовому
+                self.interval = min(max(self.interval * self.backoff, self.min_interval), self.base)
+
+        self.last_profile = profile
+        return self.interval
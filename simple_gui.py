@@ -6,17 +6,18 @@ import sys
 import os
 import json
 from collections import deque
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-from config import DB_CONFIG, ANALYSIS_INTERVAL
-from metrics import MetricsCollector
-from analyzer import ProfileAnalyzer
-from db_loader import load_profiles_from_db
-from benchmark_runner import BenchmarkRunner
+from config import (
+    DB_CONFIG, ANALYSIS_INTERVAL, CLASSIFIER_ENGINE, CLASSIFIER_MODEL_PATH, RECORD_TRAINING_DATA,
+    CONNECT_RETRY_MAX, REPLICA_CONFIGS
+)
+from scheduler import AdaptiveScheduler
+from anomaly import AnomalyDetector, format_event
+# matplotlib, psycopg2 и модули бэкенда импортируются лениво: окно появляется сразу,
+# подключение к БД идет в фоне (см. _connect_backend)
 
 COLOR_VTB_BLUE_DARK = "#0A2896"
 COLOR_VTB_BLUE_LIGHT = "#3A83F1"
@@ -40,16 +41,23 @@ class VTBProfilerGUI:
         self.profile_map = self._load_local_profiles()
 
         self.is_test_running = False
-
-        try:
-            self.collector = MetricsCollector(DB_CONFIG)
-            self.analyzer = ProfileAnalyzer()
-            self.benchmark_runner = BenchmarkRunner(DB_CONFIG)
-            self.profiles_db = load_profiles_from_db()
-            self.prev_snapshot = self.collector.get_snapshot()
-            print("VTB System initialized successfully")
-        except Exception as e:
-            print(f"Warning: Database connection issue: {e}")
+        self.scheduler = AdaptiveScheduler()
+        self.anomaly_detector = AnomalyDetector()
+        self.anomaly_events = deque(maxlen=200)
+        self.next_interval = ANALYSIS_INTERVAL
+
+        self.collector = None
+        self.benchmark_runner = None
+        self.rec_resolver = None
+        self.profiles_db = {}
+        self.prev_snapshot = {}
+        self.canvas = None
+        self.snapshot_store = None
+        self.connect_attempt = 0
+        # Реплики из REPLICA_CONFIGS: коллектор и предыдущий снимок на узел, профиль считается по кластеру
+        self.replicas = {}
+        self.replica_prev = {}
+        self.topology = None
 
         self.history_tps = deque([0]*60, maxlen=60)
         self.history_lat = deque([0]*60, maxlen=60)
@@ -60,8 +68,105 @@ class VTBProfilerGUI:
 
         self.running = True
         self.setup_ui()
+        self._set_connecting(f"Connecting to {DB_CONFIG['host']}:{DB_CONFIG['port']}...")
+        # Графики строятся после первой отрисовки окна, подключение - в фоновом потоке
+        self.root.after(1, self._setup_charts)
+        self._start_connect()
+
+    def _set_connecting(self, message):
+        self.profile_var.set("CONNECTING")
+        self.confidence_var.set(message)
+        self.progress_var.set(message)
+        self.lbl_profile.config(fg="#999999")
+
+    def _start_connect(self):
+        self.connect_attempt += 1
+        threading.Thread(target=self._connect_backend, daemon=True).start()
+
+    def _connect_backend(self):
+        """Тяжелые импорты и подключение к БД вне UI-потока; результат передается через root.after"""
+        # Соединения коллекторов, открытые до сбоя следующего шага, закрываются: иначе каждая попытка их теряет
+        opened = []
+        try:
+            from metrics import MetricsCollector
+            from benchmark_runner import BenchmarkRunner
+            from recommendations import RecommendationResolver
+            from db_loader import load_profiles_from_db
+            from analyzer import TopologyAnalyzer
+
+            collector = MetricsCollector(DB_CONFIG)
+            opened.append(collector)
+            analyzer = self._create_analyzer()
+            replicas = self._connect_replicas(MetricsCollector)
+            opened.extend(replicas.values())
+            backend = {
+                "collector": collector,
+                "analyzer": analyzer,
+                "benchmark_runner": BenchmarkRunner(DB_CONFIG),
+                "rec_resolver": RecommendationResolver(DB_CONFIG),
+                "profiles_db": load_profiles_from_db(),
+                "prev_snapshot": collector.get_snapshot(),
+                "replicas": replicas,
+                "replica_prev": {name: replica.get_snapshot() for name, replica in replicas.items()},
+                "topology": TopologyAnalyzer(analyzer) if replicas else None,
+            }
+        except Exception as e:
+            error = e
+            for opened_collector in opened:
+                try:
+                    opened_collector.conn.close()
+                except Exception:
+                    pass
+            if self.running:
+                self.root.after(0, lambda: self._on_connect_failed(error))
+            return
+        if self.running:
+            self.root.after(0, lambda: self._on_connected(backend))
+
+    def _connect_replicas(self, collector_cls):
+        """Недоступная реплика не мешает мониторингу primary: она пропускается до следующего подключения"""
+        replicas = {}
+        for name, config in REPLICA_CONFIGS.items():
+            try:
+                replicas[name] = collector_cls(config)
+            except ConnectionError as e:
+                print(f"Warning: replica {name} skipped: {e}")
+        return replicas
+
+    def _on_connected(self, backend):
+        for name, value in backend.items():
+            setattr(self, name, value)
+        # sqlite3-соединение привязано к потоку, поэтому хранилище контрольных точек создается в UI-потоке
+        try:
+            from snapshot_store import SnapshotStore
+            self.snapshot_store = SnapshotStore()
+        except Exception as e:
+            print(f"Warning: snapshot checkpoints disabled: {e}")
+        print("VTB System initialized successfully")
+        self.profile_var.set("IDLE")
+        self.confidence_var.set("Waiting for data...")
+        self.progress_var.set("System Ready")
+        self._log("Connected to database.")
         self.start_updates()
 
+    def _on_connect_failed(self, error):
+        delay = min(2 ** self.connect_attempt, CONNECT_RETRY_MAX)
+        print(f"Warning: Database connection issue: {error}")
+        self._set_connecting(f"Database unavailable, retry in {delay}s")
+        self._log(f"Connection failed (attempt {self.connect_attempt}): {str(error).strip()}")
+        self.root.after(delay * 1000, self._start_connect)
+
+    def _create_analyzer(self):
+        from analyzer import ProfileAnalyzer
+
+        if CLASSIFIER_ENGINE == "model" and os.path.exists(CLASSIFIER_MODEL_PATH):
+            try:
+                from classifier import DecisionTreeModel
+                return ProfileAnalyzer(engine="model", model=DecisionTreeModel.load(CLASSIFIER_MODEL_PATH))
+            except Exception as e:
+                print(f"Warning: could not load classifier model, using rules: {e}")
+        return ProfileAnalyzer()
+
     def _load_local_profiles(self):
         return {
             'IDLE': {},
@@ -160,6 +265,7 @@ class VTBProfilerGUI:
         self._create_sidebar_btn(sidebar, "  Mixed / HTAP", lambda: self.run_benchmark("Mixed / HTAP", "Mixed"))
         self._create_sidebar_btn(sidebar, "  End of day Batch", lambda: self.run_benchmark("End of day Batch", "BATCH_JOB"))
         self._create_sidebar_btn(sidebar, "  Data Maintenance", lambda: self.run_benchmark("Data Maintenance", "MAINTENANCE"))
+        self._create_sidebar_btn(sidebar, "  OLAP Plan Analysis", lambda: self.run_benchmark("Heavy OLAP", "OLAP_PLAN"))
 
         ttk.Separator(sidebar).pack(fill=tk.X, padx=20, pady=20)
 
@@ -225,12 +331,22 @@ class VTBProfilerGUI:
         self.results_text.insert(tk.END, "VTB Profiler System initialized. Ready to execute benchmarks.\n")
         self.results_text.config(state=tk.DISABLED)
 
-        chart_container = tk.Frame(main_content, bg=COLOR_WHITE, padx=5, pady=5)
-        chart_container.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
-        self.fig, ((self.ax1, self.ax2, self.ax3), (self.ax4, self.ax5, self.ax6)) = plt.subplots(2, 3, figsize=(10, 6))
+        self.chart_container = tk.Frame(main_content, bg=COLOR_WHITE, padx=5, pady=5)
+        self.chart_container.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+        self.chart_placeholder = tk.Label(self.chart_container, text="Loading charts...", font=("Segoe UI", 10), bg=COLOR_WHITE, fg=COLOR_TEXT_SECONDARY)
+        self.chart_placeholder.pack(fill=tk.BOTH, expand=True)
+
+    def _setup_charts(self):
+        """Импорт matplotlib (~0.5с) откладывается до момента, когда окно уже показано"""
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+
+        self.fig = Figure(figsize=(10, 6))
+        ((self.ax1, self.ax2, self.ax3), (self.ax4, self.ax5, self.ax6)) = self.fig.subplots(2, 3)
         self.fig.patch.set_facecolor(COLOR_WHITE)
-        plt.subplots_adjust(left=0.05, bottom=0.1, right=0.95, top=0.9, wspace=0.2, hspace=0.4)
-        self.canvas = FigureCanvasTkAgg(self.fig, master=chart_container)
+        self.fig.subplots_adjust(left=0.05, bottom=0.1, right=0.95, top=0.9, wspace=0.2, hspace=0.4)
+        self.chart_placeholder.destroy()
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.chart_container)
         self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
 
     def _create_sidebar_label(self, parent, text):
@@ -251,14 +367,25 @@ class VTBProfilerGUI:
         def update():
             if self.running:
                 self.update_stats()
-                self.root.after(int(ANALYSIS_INTERVAL * 1000), update)
+                self.root.after(int(self.next_interval * 1000), update)
         self.root.after(1000, update)
 
     def update_stats(self):
         try:
             curr_snapshot = self.collector.get_snapshot()
-            profile, conf, metrics = self.analyzer.analyze(self.prev_snapshot, curr_snapshot, ANALYSIS_INTERVAL)
+            duration = curr_snapshot["time"] - self.prev_snapshot["time"]
+            if self.topology is not None:
+                profile, conf, metrics = self._analyze_cluster(self.prev_snapshot, curr_snapshot, duration)
+            else:
+                profile, conf, metrics = self.analyzer.analyze(self.prev_snapshot, curr_snapshot, duration)
             self.prev_snapshot = curr_snapshot
+            if self.snapshot_store is not None:
+                self.snapshot_store.record(curr_snapshot)
+            self.next_interval = self.scheduler.next_interval(profile, metrics)
+
+            for event in self.anomaly_detector.update(curr_snapshot["time"], metrics, profile):
+                self.anomaly_events.append(event)
+                self._log(f"{time.strftime('%H:%M:%S', time.localtime(event['time']))} {format_event(event)}")
 
             self.tps_var.set(f"{int(metrics['TPS'])}")
             self.latency_var.set(f"{metrics['Tx Cost (s)']:.4f}s")
@@ -266,7 +393,13 @@ class VTBProfilerGUI:
             self.io_var.set(f"{metrics['IO Waits']}")
 
             self.profile_var.set(profile)
-            self.confidence_var.set(f"Accuracy: {conf}")
+            status = (
+                f"Accuracy: {conf} | Interval: {self.next_interval:.1f}s | "
+                f"Monitor: {metrics['Monitor DB Time (%)']:.2f}% DB, {metrics['Monitor CPU (ms)']:.0f}ms CPU"
+            )
+            if "Max Replay Lag (s)" in metrics:
+                status += f" | Cluster of {len(self.replicas) + 1}, replay lag {metrics['Max Replay Lag (s)']:.1f}s"
+            self.confidence_var.set(status)
 
             if "IDLE" in profile: self.lbl_profile.config(fg="#999999")
             elif "OLTP" in profile: self.lbl_profile.config(fg=COLOR_SUCCESS)
@@ -280,6 +413,8 @@ class VTBProfilerGUI:
             self.history_max_lat.append(metrics["Max Latency (s)"])
             self.history_iwr.append(min(metrics["Insert/Write Ratio"], 100.0))
 
+            if self.canvas is None:
+                return
             self._draw_chart(self.ax1, self.history_tps, "TPS Trend", COLOR_SUCCESS)
             self._draw_chart(self.ax2, self.history_lat, "Avg Tx Latency (s)", COLOR_DANGER)
             self._draw_chart(self.ax3, self.history_ash, "DB Load (ASH)", "#6F42C1")
@@ -291,18 +426,54 @@ class VTBProfilerGUI:
         except Exception as e:
             print(f"Update error: {e}")
 
-    def _update_recommendations(self, profile_name):
+    def _analyze_cluster(self, prev, curr, duration):
+        """Профиль primary + реплик по сумме счетчиков; реплика с ошибкой снимка в этот тик не входит"""
+        nodes = {"primary": (prev, curr)}
+        for name, replica in self.replicas.items():
+            try:
+                snapshot = replica.get_snapshot()
+            except Exception as e:
+                print(f"Replica {name} snapshot error: {e}")
+                continue
+            nodes[name] = (self.replica_prev[name], snapshot)
+            self.replica_prev[name] = snapshot
+        result = self.topology.analyze(nodes, duration)
+        return result["profile"], result["confidence"], result["metrics"]
+
+    def _resolve_recommendations(self, profile_name):
+        """Подставляет реальные ресурсы хоста в рекомендации (вызывается из фонового потока)"""
+        recs = self.profile_map.get(profile_name, {})
+        try:
+            return self.rec_resolver.resolve(recs)
+        except Exception as e:
+            print(f"Recommendation resolve error: {e}")
+            return None
+
+    def _update_recommendations(self, profile_name, resolved=None):
+        from analyzer import check_replication_conflicts
+        from recommendations import to_conf_lines
+
         recs = self.profile_map.get(profile_name, {})
         self.rec_text.config(state=tk.NORMAL)
         self.rec_text.delete(1.0, tk.END)
 
         if not recs:
             self.rec_text.insert(tk.END, f"# Benchmark Profile: {profile_name}\n# No specific tuning recommendations found for this profile.")
+        elif resolved:
+            hw = self.rec_resolver.hardware
+            self.rec_text.insert(tk.END, f"# Recommended Settings for Profile: {profile_name}\n")
+            self.rec_text.insert(tk.END, f"# Target: {hw.memory_bytes // (1024 * 1024)}MB RAM, {hw.cpu_count} CPU, {hw.storage.upper()} ({hw.source})\n\n")
+            for line in to_conf_lines(resolved):
+                self.rec_text.insert(tk.END, line + "\n")
         else:
             self.rec_text.insert(tk.END, f"# Recommended Settings for Profile: {profile_name}\n\n")
             for key, value in recs.items():
                 line = f"{key} = '{value}'\n"
                 self.rec_text.insert(tk.END, line)
+
+        replication = self.prev_snapshot.get("replication")
+        for warning in check_replication_conflicts(recs, replication, replicas_configured=bool(REPLICA_CONFIGS)):
+            self.rec_text.insert(tk.END, f"# WARNING: {warning}\n")
         self.rec_text.config(state=tk.DISABLED)
 
     def _draw_chart(self, ax, data, title, color):
@@ -328,27 +499,38 @@ class VTBProfilerGUI:
         if self.is_test_running:
             self._log("Test already running. Please wait.")
             return
+        if self.benchmark_runner is None:
+            self._log("Database is not connected yet. Please wait.")
+            return
 
         def run_test():
             self.is_test_running = True
             self.progress_var.set(f"RUNNING: {test_type} ({profile_name})")
 
+            runner = self.benchmark_runner
             test_methods = {
-                "OLTP": self.benchmark_runner.run_oltp_test,
-                "OLAP": self.benchmark_runner.run_olap_test,
-                "IoT": self.benchmark_runner.run_iot_test,
-                "Mixed": self.benchmark_runner.run_mixed_test,
-                "READ_ONLY": self.benchmark_runner.run_read_only_test,
-                "DISK_OLAP": self.benchmark_runner.run_disk_bound_olap_test,
-                "BATCH_JOB": self.benchmark_runner.run_batch_test,
-                "MAINTENANCE": self.benchmark_runner.run_maintenance_test
+                "OLTP": runner.run_oltp_test,
+                # OLAP-кнопки идут на звездную схему: Disk-Bound подбирает объем больше RAM контейнера
+                "OLAP": runner.run_star_olap_test,
+                "IoT": runner.run_iot_test,
+                "Mixed": runner.run_mixed_test,
+                "READ_ONLY": runner.run_read_only_test,
+                "DISK_OLAP": lambda profile, duration: runner.run_star_olap_test(profile, duration, disk_bound=True),
+                "BATCH_JOB": runner.run_batch_test,
+                "MAINTENANCE": runner.run_maintenance_test,
+                "OLAP_PLAN": self._run_plan_test
             }
 
             method = test_methods.get(test_type)
 
             if method:
                 try:
-                    results = method(profile_name, duration=duration)
+                    # Раннер пишет обучающие примеры только вокруг измеряемой нагрузки
+                    self.benchmark_runner.training_label = profile_name if RECORD_TRAINING_DATA else None
+                    try:
+                        results = method(profile_name, duration=duration)
+                    finally:
+                        self.benchmark_runner.training_label = None
                     if 'error' in results:
                         self._log(f"Error: {results['error']}")
                         self.progress_var.set("Error detected")
@@ -356,7 +538,8 @@ class VTBProfilerGUI:
                         self.progress_var.set("Test Completed Successfully")
                         report = f"DONE: {test_type} | TPS: {results['tps']:.1f} | Lat: {results['avg_latency']:.2f}ms"
                         self._log(report)
-                        self.root.after(0, lambda: self._update_recommendations(profile_name))
+                        resolved = self._resolve_recommendations(profile_name)
+                        self.root.after(0, lambda: self._update_recommendations(profile_name, resolved))
                 except Exception as e:
                     self._log(f"Critical Error: {e}")
             else:
@@ -366,6 +549,17 @@ class VTBProfilerGUI:
 
         threading.Thread(target=run_test, daemon=True).start()
 
+    def _run_plan_test(self, profile_name, duration=None):
+        """EXPLAIN ANALYZE OLAP-запросов с параметрами профиля на сессию; duration не используется"""
+        from plan_analyzer import format_plan_summary
+
+        resolved = self._resolve_recommendations(profile_name) or []
+        settings = {item["name"]: item["value"] for item in resolved if item["valid"]}
+        results = self.benchmark_runner.run_olap_plan_test(profile_name, settings=settings)
+        for plan in (results.get("plans") or {}).values():
+            self._log(format_plan_summary(plan))
+        return results
+
     def on_closing(self):
         self.running = False
         self.root.destroy()
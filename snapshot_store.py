@@ -0,0 +1,219 @@
+import sys
+import json
+import time
+import sqlite3
+from datetime import datetime
+
+from config import SNAPSHOT_DB_PATH, SNAPSHOT_CHECKPOINT_EVERY, SNAPSHOT_RETENTION_DAYS
+from analyzer import ProfileAnalyzer, CUMULATIVE_KEYS
+from query_mix import SHAPES
+
+# Источник сброса -> метки из секции "resets" снимка; смена любой метки - настоящий сброс счетчиков источника
+RESET_MARKERS = {
+    "database": ("postmaster_start", "db_stats_reset"),
+    "statements": ("postmaster_start", "statements_reset"),
+    "collector": ("collector_started",),
+}
+
+# Накопительные счетчики снимка MetricsCollector: (путь в словаре, источник сброса).
+# monitor.*, lock_waits и query_mix - счетчики процесса коллектора, они обнуляются при его перезапуске.
+COUNTER_PATHS = [
+    ((key,), "statements" if key == "db_time_accumulated" else "database") for key in CUMULATIVE_KEYS
+] + [
+    (("vacuum", key), "database") for key in ("autovacuum_count", "autoanalyze_count", "vacuum_count", "analyze_count")
+] + [
+    (("monitor", key), "collector") for key in ("statements", "db_time", "calls", "cpu_time", "wall_time")
+] + [
+    (("lock_waits", key), "collector") for key in ("session_seconds", "observed")
+] + [(("query_mix", shape, field), "collector") for shape in SHAPES for field in ("calls", "time", "rows")]
+
+# Мгновенные значения, которые интегрируются по времени: разность интегралов / длина окна = среднее за окно
+GAUGE_INTEGRALS = {
+    "active_sessions": lambda s: s.get("active_sessions", 0),
+    "io_waits": lambda s: (s.get("waits") or {}).get("IO", 0),
+    "lock_waits": lambda s: (s.get("waits") or {}).get("Lock", 0),
+}
+
+
+class SnapshotStore:
+    """
+    Персистентные контрольные точки снимков (по аналогии с pg_profile/AWR) в SQLite.
+
+    record() вызывается на каждом тике коллектора, но пишет точку не чаще, чем раз
+    в checkpoint_every секунд. Счетчики хранятся монотонными, поэтому разность любых
+    двух точек корректна. Сброс распознается по меткам снимка (pg_postmaster_start_time,
+    stats_reset pg_stat_database и pg_stat_statements_info, запуск коллектора): к счетчикам
+    источника добавляется их последнее значение. Уменьшение без сброса (вытеснение строк
+    pg_stat_statements, DROP DATABASE) считается нулевым приростом. Теряется только
+    прирост между последним тиком и моментом сброса.
+
+    diff(start, end) находит ближайшие точки двумя поисками по индексу (node, ts) -
+    O(log n) - и возвращает то же (profile, confidence, metrics), что ProfileAnalyzer.analyze.
+    """
+
+    def __init__(self, path=SNAPSHOT_DB_PATH, checkpoint_every=SNAPSHOT_CHECKPOINT_EVERY,
+                 retention_days=SNAPSHOT_RETENTION_DAYS, node="local"):
+        self.checkpoint_every = checkpoint_every
+        self.retention_days = retention_days
+        self.node = node
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                node TEXT NOT NULL,
+                ts REAL NOT NULL,
+                epoch INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                state TEXT NOT NULL,
+                PRIMARY KEY (node, ts)
+            )
+        """)
+        self.conn.commit()
+
+        self._last_checkpoint = 0.0
+        self._checkpoints = 0
+        self._state = self._restore_state()
+
+    def _restore_state(self):
+        """Смещения и последние сырые значения счетчиков берутся из последней точки узла"""
+        row = self.conn.execute(
+            "SELECT ts, state FROM snapshots WHERE node = ? ORDER BY ts DESC LIMIT 1", (self.node,)
+        ).fetchone()
+        if row is None:
+            return {"epoch": 0, "raw": {}, "offset": {}, "markers": {}, "integrals": {}, "last_time": None,
+                    "last_gauges": {}}
+        self._last_checkpoint = row[0]
+        state = json.loads(row[1])
+        # Простой между запусками коллектора не интегрируется: значения в нем не наблюдались
+        state["last_time"] = None
+        state.setdefault("markers", {})
+        return state
+
+    def record(self, snapshot):
+        """Учитывает снимок; возвращает True, если он записан как контрольная точка"""
+        state = self._state
+        markers = {k: v for k, v in (snapshot.get("resets") or {}).items() if v is not None}
+        reset_sources = {
+            source for source, keys in RESET_MARKERS.items()
+            if any(k in markers and k in state["markers"] and markers[k] != state["markers"][k] for k in keys)
+        }
+        state["markers"].update(markers)
+
+        for path, source in COUNTER_PATHS:
+            value = _get(snapshot, path)
+            if value is None:
+                continue
+            key = ".".join(path)
+            last = state["raw"].get(key)
+            if last is not None:
+                if source in reset_sources:
+                    # Счетчик начат заново с нуля: все текущее значение - прирост после сброса
+                    state["offset"][key] = state["offset"].get(key, 0.0) + last
+                elif value < last:
+                    state["offset"][key] = state["offset"].get(key, 0.0) + last - value
+            state["raw"][key] = value
+        reset = bool(reset_sources)
+        if reset:
+            state["epoch"] += 1
+
+        # Трапеции между тиками: интеграл считается на каждом тике, а не только в точках
+        now = snapshot["time"]
+        if state["last_time"] is not None and now > state["last_time"]:
+            dt = now - state["last_time"]
+            for name, read in GAUGE_INTEGRALS.items():
+                avg = (state["last_gauges"].get(name, 0) + read(snapshot)) / 2
+                state["integrals"][name] = state["integrals"].get(name, 0.0) + avg * dt
+        state["last_time"] = now
+        state["last_gauges"] = {name: read(snapshot) for name, read in GAUGE_INTEGRALS.items()}
+
+        if now - self._last_checkpoint < self.checkpoint_every and not reset:
+            return False
+
+        stored = json.loads(json.dumps(snapshot))
+        for path, _ in COUNTER_PATHS:
+            value = _get(stored, path)
+            if value is not None:
+                _set(stored, path, value + state["offset"].get(".".join(path), 0.0))
+        stored["integrals"] = dict(state["integrals"])
+        stored["epoch"] = state["epoch"]
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO snapshots (node, ts, epoch, data, state) VALUES (?, ?, ?, ?, ?)",
+            (self.node, now, state["epoch"], json.dumps(stored), json.dumps(state))
+        )
+        self._checkpoints += 1
+        if self._checkpoints % 100 == 0:
+            self.prune()
+        self.conn.commit()
+        self._last_checkpoint = now
+        return True
+
+    def prune(self):
+        cutoff = time.time() - self.retention_days * 86400
+        self.conn.execute("DELETE FROM snapshots WHERE node = ? AND ts < ?", (self.node, cutoff))
+
+    def at(self, moment):
+        """Последняя точка не позже moment; если раньше точек нет - первая после"""
+        ts = _to_ts(moment)
+        row = self.conn.execute(
+            "SELECT data FROM snapshots WHERE node = ? AND ts <= ? ORDER BY ts DESC LIMIT 1", (self.node, ts)
+        ).fetchone()
+        if row is None:
+            row = self.conn.execute(
+                "SELECT data FROM snapshots WHERE node = ? AND ts >= ? ORDER BY ts LIMIT 1", (self.node, ts)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def diff(self, start, end, analyzer=None):
+        """Профиль за окно [start, end] (epoch, datetime или ISO-строка)"""
+        prev, curr = self.at(start), self.at(end)
+        if prev is None or curr is None or curr["time"] <= prev["time"]:
+            raise ValueError(f"Not enough checkpoints between {start} and {end}")
+
+        duration = curr["time"] - prev["time"]
+        # Мгновенные значения конца окна заменяются средними за окно
+        averages = {
+            name: (curr["integrals"].get(name, 0.0) - prev["integrals"].get(name, 0.0)) / duration
+            for name in GAUGE_INTEGRALS
+        }
+        prev = {**prev, "active_sessions": averages["active_sessions"]}
+        curr = {**curr, "active_sessions": averages["active_sessions"],
+                "waits": {**curr["waits"], "IO": round(averages["io_waits"], 2), "Lock": round(averages["lock_waits"], 2)}}
+        if curr.get("locks"):
+            curr["locks"] = {**curr["locks"], "waiting": round(averages["lock_waits"], 2)}
+
+        profile, conf, metrics = (analyzer or ProfileAnalyzer()).analyze(prev, curr, duration)
+        metrics["Window Start"] = prev["time"]
+        metrics["Window End"] = curr["time"]
+        metrics["Counter Resets"] = curr["epoch"] - prev["epoch"]
+        return profile, conf, metrics
+
+
+def _get(snapshot, path):
+    for key in path:
+        if not isinstance(snapshot, dict):
+            return None
+        snapshot = snapshot.get(key)
+    return snapshot
+
+
+def _set(snapshot, path, value):
+    for key in path[:-1]:
+        snapshot = snapshot[key]
+    snapshot[path[-1]] = value
+
+
+def _to_ts(moment):
+    if isinstance(moment, (int, float)):
+        return float(moment)
+    if isinstance(moment, str):
+        moment = datetime.fromisoformat(moment)
+    return moment.timestamp()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python snapshot_store.py <start> <end>   (ISO time, e.g. 2026-10-17T02:00)")
+        sys.exit(2)
+    profile, conf, metrics = SnapshotStore().diff(sys.argv[1], sys.argv[2])
+    print(f"Profile: {profile} ({conf})")
+    print(json.dumps(metrics, indent=2, ensure_ascii=False))
@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+
+# Цель по холодному старту: от запуска интерпретатора до первой отрисовки окна
+TARGET_SECONDS = 1.0
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+import tkinter as tk
+import simple_gui
+result = {"import": time.perf_counter() - t0, "window": None}
+try:
+    root = tk.Tk()
+except tk.TclError:
+    pass
+else:
+    app = simple_gui.VTBProfilerGUI(root)
+    root.update()
+    result["window"] = time.perf_counter() - t0
+    app.on_closing()
+print(json.dumps(result))
+"""
+
+
+def measure(runs=5):
+    """
+    Холодный старт в свежем интерпретаторе: время импорта simple_gui и время
+    до первой отрисовки окна (если есть дисплей). БД может быть недоступна -
+    подключение идет в фоне и на старт влиять не должно.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", CHILD], cwd=here, capture_output=True, text=True)
+        total = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "child failed")
+        sample = json.loads(proc.stdout.strip().splitlines()[-1])
+        sample["process"] = total
+        samples.append(sample)
+
+    report = {"runs": runs, "target": TARGET_SECONDS}
+    for key in ("import", "window", "process"):
+        values = [s[key] for s in samples if s[key] is not None]
+        if values:
+            report[key] = {"median": round(statistics.median(values), 3), "max": round(max(values), 3)}
+    cold = report.get("window", report["import"])["median"]
+    report["ok"] = cold < TARGET_SECONDS
+    return report
+
+
+def slowest_imports(limit=10):
+    """Самые тяжелые модули по выводу python -X importtime (кумулятивно, мс)"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import simple_gui"],
+                          cwd=here, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((int(parts[1]) / 1000.0, parts[2].rstrip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+if __name__ == "__main__":
+    report = measure(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
+    print(json.dumps(report, indent=2))
+    print("Slowest imports (cumulative ms):")
+    for ms, name in slowest_imports():
+        print(f"  {ms:8.1f}  {name}")
+    sys.exit(0 if report["ok"] else 1)
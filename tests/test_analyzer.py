@@ -0,0 +1,52 @@
+from analyzer import _merge_snapshots
+
+
+def node_snapshot(waiting, depth, dead, bloat_pct, calls, role="primary"):
+    return {
+        "time": 10.0, "commits": 5.0, "active_sessions": 1, "max_duration": 0.1, "waits": {"Lock": waiting},
+        "locks": {"waiting": waiting, "by_relation_mode": {"t:RowExclusiveLock": waiting}, "blockers": [],
+                  "chain_depth": depth},
+        "vacuum": {"dead_tuples": dead, "autovacuum_count": 1.0, "in_progress": [], "top_dead": [],
+                   "bloat": [{"table": "t", "pages": 200, "bloat_pct": bloat_pct}]},
+        "query_mix": {"point_lookup": {"calls": calls, "time": 1.0, "rows": calls}},
+        "replication": {"role": role, "standbys": []},
+    }
+
+
+def test_merge_keeps_lock_vacuum_mix_and_replication_sections():
+    merged = _merge_snapshots({
+        "primary": node_snapshot(3, 2, 100.0, 10.0, 50.0),
+        "replica": node_snapshot(1, 4, 20.0, 30.0, 70.0, role="standby"),
+    })
+
+    assert merged["locks"]["waiting"] == 4
+    assert merged["locks"]["chain_depth"] == 4
+    assert merged["locks"]["by_relation_mode"] == {"t:RowExclusiveLock": 4}
+    assert merged["vacuum"]["dead_tuples"] == 120.0
+    assert merged["vacuum"]["autovacuum_count"] == 2.0
+    assert merged["vacuum"]["bloat"][0]["bloat_pct"] == 30.0
+    assert merged["query_mix"]["point_lookup"]["calls"] == 120.0
+    assert merged["replication"]["nodes"]["replica"]["role"] == "standby"
+
+
+def test_merge_without_lock_samples_keeps_none():
+    a, b = node_snapshot(0, 0, 0.0, 0.0, 0.0), node_snapshot(0, 0, 0.0, 0.0, 0.0)
+    a["locks"] = b["locks"] = None
+    assert _merge_snapshots({"a": a, "b": b})["locks"] is None
+
+
+def test_lock_waits_are_averaged_over_the_interval():
+    from analyzer import ProfileAnalyzer
+
+    def snapshot(t, session_seconds, waiting_now):
+        return {
+            "time": t, "commits": 0.0, "rollbacks": 0.0, "db_time_accumulated": 0.0, "tup_inserted": 0.0,
+            "tup_fetched": 0.0, "tup_updated": 0.0, "tup_deleted": 0.0, "active_sessions": 4,
+            "max_duration": 0.0, "waits": {"Lock": waiting_now},
+            "locks": {"waiting": waiting_now, "by_relation_mode": {}, "blockers": [], "chain_depth": 1},
+            "lock_waits": {"session_seconds": session_seconds, "observed": 0.0, "by_relation_mode": {}},
+        }
+
+    # В конце интервала никто не ждет, но 10 с из 10 ждали 3 сессии
+    _, _, metrics = ProfileAnalyzer().analyze(snapshot(0, 5.0, 3), snapshot(10, 35.0, 0), 10)
+    assert metrics["Lock Waits"] == 3.0
@@ -0,0 +1,28 @@
+from anomaly import AnomalyDetector, SignalState
+
+
+def test_zero_variance_series_does_not_explode():
+    state = SignalState(warmup=10, sigma_floor=1.0, min_samples=30)
+    for _ in range(20):
+        assert state.update(0.0) == (0.0, None)
+    # Разброса еще не было и тиков меньше min_samples: событие не выдается
+    z, shift = state.update(1.0)
+    assert z == 0.0 and shift is None
+
+
+def test_zero_variance_series_uses_absolute_floor():
+    state = SignalState(warmup=10, sigma_floor=1.0, min_samples=30)
+    for _ in range(40):
+        state.update(0.0)
+    z, _ = state.update(1.0)
+    # Без минимума sigma было бы 1e-9 и z ~ 1e9
+    assert z == 1.0
+
+
+def test_detector_floors_are_per_signal():
+    detector = AnomalyDetector(signals=("IO Waits",), sigma_floor={"IO Waits": 2.0})
+    for t in range(40):
+        assert detector.update(t, {"IO Waits": 0}) == []
+    assert detector.update(40, {"IO Waits": 1}) == []
+    events = detector.update(41, {"IO Waits": 20})
+    assert events and events[0]["type"] == "spike"
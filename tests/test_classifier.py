@@ -0,0 +1,36 @@
+import numpy as np
+
+from classifier import split_by_run
+
+
+def samples_for(label, run, n):
+    return [{"label": label, "run": run, "metrics": {"TPS": i}, "rule_profile": label} for i in range(n)]
+
+
+def test_holdout_never_splits_a_run():
+    samples = []
+    for label in ("OLTP", "OLAP"):
+        for run in range(4):
+            samples += samples_for(label, f"{label}-{run}", 10)
+
+    train_set, test_set = split_by_run(samples, 0.25, np.random.default_rng(0))
+
+    train_runs = {s["run"] for s in train_set}
+    test_runs = {s["run"] for s in test_set}
+    assert train_runs.isdisjoint(test_runs)
+    assert len(test_runs) == 2
+    assert {s["label"] for s in test_set} == {"OLTP", "OLAP"}
+
+
+def test_single_run_label_stays_in_train():
+    samples = samples_for("IDLE", "a", 5) + samples_for("OLTP", "b", 5) + samples_for("OLTP", "c", 5)
+    train_set, test_set = split_by_run(samples, 0.5, np.random.default_rng(0))
+    assert {s["label"] for s in train_set} == {"IDLE", "OLTP"}
+    assert {s["run"] for s in test_set} <= {"b", "c"}
+
+
+def test_legacy_samples_group_by_contiguous_label():
+    samples = [{"label": label, "metrics": {}, "rule_profile": label} for label in ["A"] * 3 + ["B"] * 3 + ["A"] * 3]
+    train_set, test_set = split_by_run(samples, 0.5, np.random.default_rng(0))
+    # Два блока A: один в обучении, один в проверке, целиком
+    assert sum(1 for s in test_set if s["label"] == "A") == 3
@@ -0,0 +1,15 @@
+from open_loop import RateSchedule
+
+
+def test_ramp_remainder_goes_to_last_segment():
+    schedule = RateSchedule.ramp(100, 500, 62, steps=5)
+
+    assert schedule.duration == 62
+    assert [seconds for seconds, _ in schedule.segments] == [12, 12, 12, 12, 14]
+    assert schedule.segments[0][1] == 100
+    assert schedule.segments[-1][1] == 500
+
+
+def test_single_step_ramp_keeps_duration():
+    schedule = RateSchedule.ramp(100, 500, 45, steps=1)
+    assert schedule.segments == [(45, 500)]
@@ -0,0 +1,24 @@
+from query_mix import sum_by_queryid
+
+
+def test_duplicate_queryid_rows_are_summed():
+    # Один queryid под двумя пользователями и на вложенном уровне (track=all)
+    rows = [
+        (42, 10, 5.0, 10),
+        (42, 3, 1.5, 3),
+        (42, 1, 0.5, None),
+        (7, 2, 2.0, 20),
+    ]
+    totals = sum_by_queryid(rows)
+
+    assert totals[42] == (14.0, 7.0, 13.0)
+    assert totals[7] == (2.0, 2.0, 20.0)
+
+
+def test_duplicate_rows_do_not_look_like_reset():
+    # Порядок строк между опросами меняется: сумма по queryid остается монотонной
+    first = sum_by_queryid([(42, 10, 5.0), (42, 3, 1.0)])
+    second = sum_by_queryid([(42, 4, 1.2), (42, 11, 5.5)])
+
+    assert second[42][0] >= first[42][0]
+    assert second[42][0] - first[42][0] == 2.0
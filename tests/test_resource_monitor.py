@@ -0,0 +1,40 @@
+from resource_monitor import ContainerStatsSampler, efficiency_metrics
+
+
+class FakeContainer:
+    """docker top контейнера БД: postmaster, sh из docker exec и pgbench, запущенный после первого снимка"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def top(self, ps_args):
+        self.calls += 1
+        processes = [["1", "5.0", "100", "1000", "postgres -c shared_buffers=128MB"],
+                     ["7", "50.0", "1", "10", "sh -c pgbench"]]
+        if self.calls > 1:
+            processes.append(["9", "40.0", str(10 * (self.calls - 1)), "100", "pgbench -c 4"])
+        return {"Titles": ["PID", "%CPU", "ELAPSED", "RSS", "COMMAND"], "Processes": processes}
+
+
+def test_client_cpu_is_excluded_from_efficiency():
+    sampler = ContainerStatsSampler("vtb_postgres")
+    sampler._container = FakeContainer()
+    for _ in range(4):
+        sampler._sample_processes()
+    counters = {"read_bytes": 0, "write_bytes": 0, "rx_bytes": 0, "tx_bytes": 0}
+    sampler._first = dict(counters, time=0.0, cpu_ns=0)
+    sampler._last = dict(counters, time=30.0, cpu_ns=60e9)
+
+    resources = sampler.summary()
+    # pgbench: 40% за 30 с; sh жил до старта сэмплера и не рос
+    assert resources["client_cpu_seconds"] == 12.0
+    assert resources["server_cpu_seconds"] == 48.0
+
+    eff = efficiency_metrics(resources, 1000)
+    assert eff["cpu_includes_client"] is False
+    assert eff["cpu_ms_per_tx"] == 48.0
+
+
+def test_efficiency_flags_client_without_process_sampling():
+    resources = {"cpu_seconds": 10.0, "bytes_written": 0, "bytes_read": 0}
+    assert efficiency_metrics(resources, 100)["cpu_includes_client"] is True
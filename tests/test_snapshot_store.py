@@ -0,0 +1,51 @@
+from snapshot_store import SnapshotStore
+
+
+def snapshot(t, db_time, commits=0.0, postmaster_start=1000.0, statements_reset=1000.0):
+    return {
+        "time": t,
+        "commits": commits,
+        "db_time_accumulated": db_time,
+        "active_sessions": 1,
+        "waits": {},
+        "resets": {"postmaster_start": postmaster_start, "statements_reset": statements_reset,
+                   "collector_started": 500.0},
+    }
+
+
+def make_store(tmp_path):
+    return SnapshotStore(path=str(tmp_path / "snapshots.sqlite"), checkpoint_every=0)
+
+
+def test_decrease_without_reset_is_zero_growth(tmp_path):
+    store = make_store(tmp_path)
+    store.record(snapshot(10, 100.0))
+    # Вытеснение строк pg_stat_statements: сумма уменьшилась, сброса не было
+    store.record(snapshot(20, 60.0))
+    store.record(snapshot(30, 70.0))
+
+    assert store.at(20)["db_time_accumulated"] == 100.0
+    assert store.at(30)["db_time_accumulated"] == 110.0
+    assert store.at(30)["epoch"] == 0
+
+
+def test_marker_change_is_reset(tmp_path):
+    store = make_store(tmp_path)
+    store.record(snapshot(10, 100.0, commits=50.0))
+    store.record(snapshot(20, 5.0, commits=3.0, postmaster_start=2000.0))
+
+    stored = store.at(20)
+    assert stored["db_time_accumulated"] == 105.0
+    assert stored["commits"] == 53.0
+    assert stored["epoch"] == 1
+
+
+def test_statements_reset_leaves_database_counters(tmp_path):
+    store = make_store(tmp_path)
+    store.record(snapshot(10, 100.0, commits=50.0))
+    store.record(snapshot(20, 5.0, commits=40.0, statements_reset=2000.0))
+
+    stored = store.at(20)
+    assert stored["db_time_accumulated"] == 105.0
+    # pg_stat_database не сбрасывался: уменьшение - нулевой прирост, а не вся история заново
+    assert stored["commits"] == 50.0
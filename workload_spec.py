@@ -0,0 +1,126 @@
+import os
+import re
+import json
+import hashlib
+from workloads import PgbenchScript, make_distribution, validate_script, ACCOUNTS_PER_SCALE, TELLERS_PER_SCALE
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# Именованные диапазоны ключей, зависящие от scale pgbench
+KEY_RANGES = {
+    "accounts": lambda scale: ACCOUNTS_PER_SCALE * scale,
+    "tellers": lambda scale: TELLERS_PER_SCALE * scale,
+    "branches": lambda scale: scale,
+}
+
+SPEC_DEFAULTS = {
+    "test_type": None,
+    "setup": [],
+    "clients": 10,
+    "threads": 2,
+    "rate": None,
+    "duration": 30,
+    "warmup": 0,
+}
+
+
+class WorkloadSpec:
+    """
+    Декларативное описание нагрузки (JSON/YAML):
+
+        name: Mixed
+        setup: [{fixture: pgbench, scale: 5}, {sql: "CREATE INDEX ..."}]
+        transactions:
+          - name: read
+            weight: 50
+            keys: {aid: {distribution: zipfian, s: 1.1, range: accounts}}
+            vars: {bid: "(:aid - 1) / 100000 + 1"}
+            sql: SELECT abalance FROM pgbench_accounts WHERE aid = :aid;
+        clients: 16
+        threads: 4
+        rate: null        # pgbench -R, транзакций в секунду
+        duration: 30
+        warmup: 5
+
+    Каждая транзакция компилируется в отдельный pgbench-скрипт и запускается как -f script@weight.
+    """
+
+    def __init__(self, data):
+        missing = [k for k in ("name", "transactions") if k not in data]
+        if missing:
+            raise ValueError(f"Workload spec is missing: {', '.join(missing)}")
+
+        self.data = {**SPEC_DEFAULTS, **data}
+        self.name = self.data["name"]
+        self.test_type = self.data["test_type"] or self.name.upper()
+        self.setup = self.data["setup"]
+        self.transactions = self.data["transactions"]
+        self.clients = int(self.data["clients"])
+        self.threads = min(int(self.data["threads"]), self.clients)
+        self.rate = self.data["rate"]
+        self.duration = int(self.data["duration"])
+        self.warmup = int(self.data["warmup"])
+
+        if not self.transactions:
+            raise ValueError(f"Workload '{self.name}' has no transactions")
+        for tx in self.transactions:
+            if "sql" not in tx:
+                raise ValueError(f"Transaction '{tx.get('name', '?')}' in '{self.name}' has no sql")
+            if int(tx.get("weight", 1)) <= 0:
+                raise ValueError(f"Transaction '{tx.get('name', '?')}' weight must be positive")
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            if path.endswith((".yaml", ".yml")):
+                if yaml is None:
+                    raise ImportError("PyYAML is required to load YAML workload specs")
+                return cls(yaml.safe_load(f))
+            return cls(json.load(f))
+
+    def compile(self, scale=1):
+        """
+        Возвращает список (имя_скрипта, текст, вес). Имя содержит хэш текста,
+        так что одинаковые скрипты не копируются в контейнер повторно.
+        """
+        compiled = []
+        for i, tx in enumerate(self.transactions):
+            script = PgbenchScript()
+            for var, key in tx.get("keys", {}).items():
+                params = {k: v for k, v in key.items() if k not in ("distribution", "range")}
+                upper = key.get("range", "accounts")
+                upper = KEY_RANGES[upper](scale) if upper in KEY_RANGES else int(upper)
+                script.key(var, make_distribution(key.get("distribution", "uniform"), **params), upper)
+            for var, expr in tx.get("vars", {}).items():
+                script.set(var, expr)
+            script.sql(tx["sql"])
+
+            content = script.render()
+            errors = validate_script(content)
+            if errors:
+                raise ValueError(f"Workload '{self.name}', transaction '{tx.get('name', i)}': " + "; ".join(errors))
+
+            tx_name = tx.get("name", f"tx{i}")
+            compiled.append((f"{_slug(self.name)}_{tx_name}_{content_hash(content)}.sql", content, int(tx.get("weight", 1))))
+        return compiled
+
+
+def content_hash(content):
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:12]
+
+
+def _slug(name):
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+def load_specs(directory):
+    """Загружает все спецификации из каталога: { name: WorkloadSpec }"""
+    specs = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith((".json", ".yaml", ".yml")):
+            spec = WorkloadSpec.load(os.path.join(directory, filename))
+            specs[spec.name] = spec
+    return specs
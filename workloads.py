@@ -0,0 +1,181 @@
+import re
+import subprocess
+
+ACCOUNTS_PER_SCALE = 100000
+TELLERS_PER_SCALE = 10
+
+# Переменные, которые pgbench выставляет сам
+BUILTIN_VARIABLES = {"scale", "client_id", "random_seed", "default_seed"}
+
+META_RE = re.compile(r"^\s*\\(\w+)(.*)$")
+VAR_REF_RE = re.compile(r"(?<!:):([a-zA-Z_]\w*)")
+
+
+class KeyDistribution:
+    """
+    Распределение ключей для pgbench-скрипта. render() возвращает строки \\set,
+    которые кладут в переменную var случайный ключ из диапазона [1, upper].
+    upper - число или выражение pgbench.
+    """
+
+    def render(self, var, upper):
+        raise NotImplementedError
+
+
+class Uniform(KeyDistribution):
+    def render(self, var, upper):
+        return [f"\\set {var} random(1, {upper})"]
+
+
+class Zipfian(KeyDistribution):
+    def __init__(self, s=1.1):
+        if s <= 1.0:
+            raise ValueError("pgbench random_zipfian requires s > 1.0")
+        self.s = s
+
+    def render(self, var, upper):
+        # random_zipfian отдает самые частые значения в начале диапазона,
+        # permute разбрасывает их по всей таблице
+        return [
+            f"\\set {var}_rank random_zipfian(1, {upper}, {self.s})",
+            f"\\set {var} permute(:{var}_rank, {upper}) + 1",
+        ]
+
+
+class Gaussian(KeyDistribution):
+    def __init__(self, parameter=5.0):
+        if parameter < 2.0:
+            raise ValueError("pgbench random_gaussian requires parameter >= 2.0")
+        self.parameter = parameter
+
+    def render(self, var, upper):
+        return [f"\\set {var} random_gaussian(1, {upper}, {self.parameter})"]
+
+
+class HotSet(KeyDistribution):
+    """hot_access_pct% обращений попадают в первые hot_keys_pct% ключей"""
+
+    def __init__(self, hot_keys_pct=1.0, hot_access_pct=90.0):
+        if not (0 < hot_keys_pct < 100 and 0 <= hot_access_pct <= 100):
+            raise ValueError("hot set percentages must be within (0, 100)")
+        self.hot_keys_pct = hot_keys_pct
+        self.hot_access_pct = hot_access_pct
+
+    def render(self, var, upper):
+        hot = f"greatest(1, int(({upper}) * {self.hot_keys_pct} / 100.0))"
+        return [
+            f"\\set {var}_hot {hot}",
+            f"\\set {var}_dice random(1, 10000)",
+            f"\\if :{var}_dice <= {int(self.hot_access_pct * 100)}",
+            f"\\set {var} random(1, :{var}_hot)",
+            "\\else",
+            f"\\set {var} random(:{var}_hot + 1, greatest(:{var}_hot + 1, {upper}))",
+            "\\endif",
+        ]
+
+
+DISTRIBUTIONS = {
+    "uniform": Uniform,
+    "zipfian": Zipfian,
+    "gaussian": Gaussian,
+    "hotset": HotSet,
+}
+
+
+def make_distribution(name, **params):
+    try:
+        return DISTRIBUTIONS[name](**params)
+    except KeyError:
+        raise ValueError(f"Unknown distribution '{name}', expected one of {sorted(DISTRIBUTIONS)}")
+
+
+class PgbenchScript:
+    """Сборщик pgbench-скрипта: ключи со своими распределениями + тело транзакции"""
+
+    def __init__(self):
+        self.lines = []
+
+    def key(self, var, distribution, upper):
+        self.lines.extend(distribution.render(var, upper))
+        return self
+
+    def set(self, var, expr):
+        self.lines.append(f"\\set {var} {expr}")
+        return self
+
+    def sql(self, statement):
+        self.lines.extend(line.rstrip() for line in statement.strip().splitlines())
+        return self
+
+    def render(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def validate_script(script):
+    """
+    Статическая проверка pgbench-скрипта: все :переменные определены до использования,
+    блоки \\if/\\endif сбалансированы, мета-команды известны.
+    Возвращает список ошибок (пустой - скрипт корректен).
+    """
+    errors = []
+    defined = set(BUILTIN_VARIABLES)
+    depth = 0
+
+    for lineno, line in enumerate(script.splitlines(), 1):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("--"):
+            continue
+
+        meta = META_RE.match(line)
+        body = line
+        if meta:
+            command, args = meta.group(1), meta.group(2)
+            if command in ("set", "setshell"):
+                parts = args.split(None, 1)
+                if not parts:
+                    errors.append(f"line {lineno}: \\{command} without variable")
+                    continue
+                body = parts[1] if len(parts) > 1 else ""
+                _check_refs(body, defined, lineno, errors)
+                defined.add(parts[0])
+                continue
+            if command == "if":
+                depth += 1
+            elif command in ("elif", "else"):
+                if depth == 0:
+                    errors.append(f"line {lineno}: \\{command} without \\if")
+            elif command == "endif":
+                depth -= 1
+                if depth < 0:
+                    errors.append(f"line {lineno}: \\endif without \\if")
+                    depth = 0
+            elif command not in ("sleep", "shell", "gset", "aset", "startpipeline", "endpipeline", "syncpipeline"):
+                errors.append(f"line {lineno}: unknown meta command \\{command}")
+            body = args
+
+        _check_refs(body, defined, lineno, errors)
+
+    if depth > 0:
+        errors.append(f"{depth} unterminated \\if block(s)")
+    return errors
+
+
+def _check_refs(text, defined, lineno, errors):
+    # Отбрасываем строковые литералы и приведения типов (::int), чтобы не ловить ложные ссылки
+    text = re.sub(r"'[^']*'", "''", text)
+    for name in VAR_REF_RE.findall(text):
+        if name not in defined:
+            errors.append(f"line {lineno}: variable :{name} is used before \\set")
+
+
+def check_script_in_container(container_name, script_path):
+    """Прогоняет скрипт одной транзакцией внутри контейнера (pgbench -t 1), возвращает текст ошибки или None"""
+    cmd = [
+        "docker", "exec", "-i", container_name,
+        "pgbench", "-U", "user", "-d", "mydb", "-n", "-t", "1", "-c", "1", "-f", script_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0 or "aborted" in result.stdout + result.stderr:
+        return (result.stderr or result.stdout).strip()
+    return None
+